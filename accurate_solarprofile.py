@@ -1,6 +1,12 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+
 import numpy as np
-from datetime import datetime, timedelta
-from config import PanelArea, PanelEfficiency, RaceStartTime, RaceEndTime
+import race_config as config
+from race_config import PanelArea, PanelEfficiency, RaceStartTime, RaceEndTime
 
 # Constants
 G_s = 1366  # Solar constant in W/m^2
@@ -8,6 +14,11 @@ G_s_prime = 0.7 * G_s  # Adjusted solar constant for clear day
 _power_coeff = PanelArea * PanelEfficiency
 DT = RaceEndTime - RaceStartTime
 
+# Race days with precomputed sun geometry (later times reuse the last day)
+_MAX_RACE_DAYS = 10
+# Hour angle change per second of race time (rad/s)
+_HOUR_ANGLE_RATE = np.radians(15) / 3600
+
 # Function to calculate the nth day of the year
 def day_of_year(date):
     return date.timetuple().tm_yday
@@ -16,14 +27,14 @@ def day_of_year(date):
 def calculate_B(N):
     return (N - 1) * 360 / 365
 
-# Function to calculate the equation of time (E)
+# Function to calculate the equation of time (E, minutes; Spencer's series)
 def equation_of_time(B):
-    return 229.2 * (0.00018865 * np.cos(np.radians(B)) - 0.0032077 * np.sin(np.radians(B)) +
-                    0.041016 * np.cos(np.radians(2 * B)) - 0.048093 * np.sin(np.radians(2 * B)))
+    return 229.2 * (0.000075 + 0.001868 * np.cos(np.radians(B)) - 0.032077 * np.sin(np.radians(B)) -
+                    0.014615 * np.cos(np.radians(2 * B)) - 0.04089 * np.sin(np.radians(2 * B)))
 
-# Function to calculate solar local time (T_s)
+# Function to calculate solar local time (T_s), longitudes east-positive
 def solar_local_time(standard_time, longitude, standard_meridian, E):
-    return standard_time + (4 * (standard_meridian - longitude) + E) / 60
+    return standard_time + (4 * (longitude - standard_meridian) + E) / 60
 
 # Function to calculate hour angle (ω)
 def hour_angle(T_s):
@@ -40,36 +51,92 @@ def solar_irradiance(G_s_prime, latitude, declination, hour_angle):
     hour_angle_rad = np.radians(hour_angle)
     return G_s_prime * (np.cos(latitude_rad) * np.cos(declination_rad) * np.cos(hour_angle_rad) + np.sin(latitude_rad) * np.sin(declination_rad))
 
+@dataclass(frozen=True)
+class SolarGeometry:
+    """Time-independent solar terms of a route, so an irradiance evaluation is a single cosine.
+
+    With T_s = standard_time + longitude_shift + E(day) / 60 the beam irradiance is
+    G_s' * (cos_lat * cos_decl[day] * cos(omega) + sin_lat * sin_decl[day]).
+    """
+    cos_lat: np.ndarray  # per node
+    sin_lat: np.ndarray  # per node
+    longitude_shift: np.ndarray  # h, 4 * (longitude - standard meridian) / 60 per node (east-positive)
+    time_correction: np.ndarray  # h, equation of time / 60 per race day
+    cos_decl: np.ndarray  # per race day
+    sin_decl: np.ndarray  # per race day
+
+    @classmethod
+    def for_route(cls, latitude: np.ndarray, longitude: np.ndarray,
+                  race_date: date | None = None) -> "SolarGeometry":
+        """Geometry of the route nodes for `_MAX_RACE_DAYS` days from `race_date` (default `RaceDate`)."""
+        if race_date is None:
+            race_date = date.fromisoformat(config.RaceDate)
+        latitude_rad = np.radians(latitude)
+        # Meridian of the race clock's time zone (142.5 deg E for ACST)
+        standard_meridian = 15 * config.RaceUtcOffset / 3600
+
+        N = day_of_year(race_date) + np.arange(_MAX_RACE_DAYS)
+        declination_rad = np.radians(sun_declination_angle(N))
+        return cls(
+            cos_lat=np.cos(latitude_rad),
+            sin_lat=np.sin(latitude_rad),
+            longitude_shift=4 * (longitude - standard_meridian) / 60,
+            time_correction=equation_of_time(calculate_B(N)) / 60,
+            cos_decl=np.cos(declination_rad),
+            sin_decl=np.sin(declination_rad),
+        )
+
+    def _terms(self, day: np.ndarray, time_of_day: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(hour angle in rad, cos_lat * cos_decl, sin_lat * sin_decl) at local times of day (s) on race days."""
+        day = np.minimum(np.asarray(day).astype(int), _MAX_RACE_DAYS - 1)
+        T_s = time_of_day / 3600 + self.longitude_shift + self.time_correction[day]
+        omega = np.radians(hour_angle(T_s))
+        return omega, self.cos_lat * self.cos_decl[day], self.sin_lat * self.sin_decl[day]
+
+    def irradiance_at(self, day: np.ndarray, time_of_day: np.ndarray) -> np.ndarray:
+        """Beam irradiance (W/m^2) at local times of day (s after midnight) on race days `day` (0: `RaceDate`)."""
+        omega, cos_term, sin_term = self._terms(day, time_of_day)
+        return (G_s_prime * (cos_term * np.cos(omega) + sin_term)).clip(0)
+
+    def irradiance(self, globaltime: np.ndarray) -> np.ndarray:
+        """Beam irradiance (W/m^2) at race times `globaltime`, zero while the sun is down."""
+        return self.irradiance_at(globaltime // DT, RaceStartTime + globaltime % DT)
+
+    def irradiance_gradient(self, globaltime: np.ndarray) -> np.ndarray:
+        """Derivative of `irradiance` with respect to time (W/m^2/s)."""
+        omega, cos_term, sin_term = self._terms(globaltime // DT, RaceStartTime + globaltime % DT)
+        up = cos_term * np.cos(omega) + sin_term > 0
+        return np.where(up, -G_s_prime * cos_term * np.sin(omega) * _HOUR_ANGLE_RATE, 0.0)
+
+# Geometry of the last few routes/segments seen (the solver evaluates the same ones repeatedly)
+_GEOMETRY_CACHE_SIZE = 32
+_geometries: OrderedDict = OrderedDict()
+_geometries_lock = threading.Lock()
+
+def route_geometry(latitude_array: np.ndarray, longitude_array: np.ndarray) -> SolarGeometry:
+    """Cached `SolarGeometry.for_route` for these coordinates and the configured `RaceDate` and `RaceUtcOffset`."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(latitude_array, dtype=float).tobytes())
+    h.update(np.ascontiguousarray(longitude_array, dtype=float).tobytes())
+    key = (h.digest(), config.RaceDate, config.RaceUtcOffset)
+
+    with _geometries_lock:
+        geometry = _geometries.get(key)
+        if geometry is not None:
+            _geometries.move_to_end(key)
+            return geometry
+
+    geometry = SolarGeometry.for_route(np.asarray(latitude_array, dtype=float),
+                                       np.asarray(longitude_array, dtype=float))
+    with _geometries_lock:
+        _geometries[key] = geometry
+        if len(_geometries) > _GEOMETRY_CACHE_SIZE:
+            _geometries.popitem(last=False)
+    return geometry
+
 # Main function to calculate incident solar power
 def calculate_incident_solarpower(globaltime, latitude_array, longitude_array):
-    # Assume a fixed date for simplicity, can be changed as needed
-    date = datetime.now()
-
-    # Calculate the day of the year
-    N = day_of_year(date)
-    B = calculate_B(N)
-
-    # Calculate the standard meridian
-    standard_meridian = 15 * (longitude_array / 15).astype(int)
-
-    # Calculate the equation of time
-    E = equation_of_time(B)
-
-    time = globaltime % DT
-
-    # Calculate the standard time in hours (decimal)
-    standard_time = time / 3600
-
-    # Calculate the solar local time for each point
-    T_s = solar_local_time(standard_time, longitude_array, standard_meridian, E)
-    # Calculate the hour angle for each point
-    omega = hour_angle(T_s)
-    # Calculate the sun declination angle
-    delta = sun_declination_angle(N)
-    # Calculate the solar irradiance for each point
-    G_b = solar_irradiance(G_s_prime, latitude_array, delta, omega)
-    
-    return G_b * _power_coeff
+    return route_geometry(latitude_array, longitude_array).irradiance(globaltime) * _power_coeff
 
 # # Example usage
 # if __name__ == "__main__":
@@ -81,4 +148,3 @@ def calculate_incident_solarpower(globaltime, latitude_array, longitude_array):
 #     # Calculate the incident solar power
 #     power = calculate_incident_solarpower(globaltime, latitude_array, longitude_array)
 #     print(f"Incident Solar Power: {power} W")
-
@@ -0,0 +1,193 @@
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import race_config as config
+from run_store import load_output
+
+# Output columns the analytics need
+ANALYTICS_COLUMNS = ['Time', 'EnergyConsumption', 'Solar', 'Battery']
+
+@dataclass(frozen=True)
+class RunBatch:
+    """Output rows of several runs concatenated, with the run of every row.
+
+    Every statistic is computed for all runs at once; per-run results are indexed like `names`.
+    """
+    names: list[str]
+    run: np.ndarray  # run index of every row (rows of a run are contiguous and in order)
+    time: np.ndarray  # s, race time at the row
+    energy: np.ndarray  # Wh drawn by the car over the step ending at the row (NaN at segment starts)
+    solar: np.ndarray  # Wh of solar gain over the same step
+    battery: np.ndarray  # % state of charge
+
+    @property
+    def n_runs(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_frames(cls, frames: dict[str, pd.DataFrame]) -> "RunBatch":
+        """Batch of runs given as `run_dat.csv`-style DataFrames, keyed by run name."""
+        names = list(frames)
+        lengths = [len(frames[name]) for name in names]
+        return cls(
+            names=names,
+            run=np.repeat(np.arange(len(names)), lengths),
+            **{
+                field: np.concatenate([frames[name][column].to_numpy(dtype=np.float64) for name in names])
+                for field, column in zip(('time', 'energy', 'solar', 'battery'), ANALYTICS_COLUMNS)
+            },
+        )
+
+def load_runs(paths: list[str]) -> RunBatch:
+    """Batch of stored runs (run store directories or CSVs), reading only the needed columns."""
+    return RunBatch.from_frames({path: load_output(path, ANALYTICS_COLUMNS) for path in paths})
+
+def bin_labels(edges: tuple) -> list[str]:
+    """Labels of the bins defined by upper `edges` (the last bin is everything above them)."""
+    return [f"<={edges[0]}"] + [f"{low}-{high}" for low, high in zip(edges[:-1], edges[1:])] + [f">{edges[-1]}"]
+
+def battery_power(runs: RunBatch) -> tuple[np.ndarray, np.ndarray]:
+    """Duration and net battery power of the step ending at every row.
+
+    Rows starting a segment (NaN energy: the step spans a stop) and the first row of every
+    run get zero duration and NaN power, so they carry no weight in any statistic.
+
+    Returns:
+        tuple: (dt in s, power in W, positive while discharging)
+    """
+    dt = np.zeros_like(runs.time)
+    dt[1:] = np.diff(runs.time)
+    valid = np.isfinite(runs.energy) & np.isfinite(runs.solar) & (dt > 0)
+    valid[1:] &= runs.run[1:] == runs.run[:-1]
+    valid[0] = False
+
+    dt = np.where(valid, dt, 0.0)
+    power = np.full_like(runs.time, np.nan)
+    power[valid] = (runs.energy[valid] - runs.solar[valid]) * 3600 / dt[valid]
+    return dt, power
+
+def c_rate(runs: RunBatch) -> np.ndarray:
+    """C-rate (1/h) of the battery current at every row, charging or discharging (NaN where undefined)."""
+    return np.abs(battery_power(runs)[1]) / config.BatteryCapacity
+
+def c_rate_residency(runs: RunBatch, edges: tuple | None = None) -> np.ndarray:
+    """Hours every run spends in each C-rate bin.
+
+    Args:
+        edges: Upper bin edges (default `CRateBins`); bins are (low, high].
+
+    Returns:
+        np.ndarray: (n_runs, len(edges) + 1) hours
+    """
+    edges = config.CRateBins if edges is None else edges
+    dt, power = battery_power(runs)
+    bins = np.digitize(np.abs(np.nan_to_num(power)) / config.BatteryCapacity, edges, right=True)
+    n_bins = len(edges) + 1
+    hours = np.bincount(runs.run * n_bins + bins, weights=dt / 3600, minlength=runs.n_runs * n_bins)
+    return hours.reshape(runs.n_runs, n_bins)
+
+def turning_points(runs: RunBatch) -> np.ndarray:
+    """Rows where the state of charge changes direction, plus the first and last row of every run."""
+    soc = runs.battery
+    same_run = runs.run[1:] == runs.run[:-1]
+    direction = np.where(same_run, np.sign(np.diff(soc)), 0)
+
+    # Flat stretches are skipped: a step turns if it moves opposite to the previous moving step
+    moving = np.flatnonzero(direction)
+    turns = moving[1:][(direction[moving[1:]] != direction[moving[:-1]])
+                       & (runs.run[moving[1:]] == runs.run[moving[:-1]])]
+
+    run_starts = np.flatnonzero(np.r_[True, ~same_run])
+    run_ends = np.r_[run_starts[1:] - 1, len(soc) - 1]
+    return np.unique(np.concatenate([run_starts, turns, run_ends]))
+
+def dod_cycles(runs: RunBatch, edges: tuple | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Depth-of-discharge swings of every run, counted between consecutive turning points.
+
+    Each fall of the state of charge from a peak to the next valley is one discharge
+    half-cycle of that depth (peak-valley counting: small swings nested inside a larger
+    one are counted separately rather than rainflow-paired).
+
+    Args:
+        edges: Upper bin edges (% SoC, default `DoDBins`) of the swing histogram.
+
+    Returns:
+        tuple: (swing counts (n_runs, len(edges) + 1), equivalent full cycles (n_runs,),
+        deepest swing in % (n_runs,))
+    """
+    edges = config.DoDBins if edges is None else edges
+    points = turning_points(runs)
+    swing = np.diff(runs.battery[points])
+    run = runs.run[points[1:]]
+    discharge = (swing < 0) & (run == runs.run[points[:-1]])
+    depth, run = -swing[discharge], run[discharge]
+
+    n_bins = len(edges) + 1
+    counts = np.bincount(run * n_bins + np.digitize(depth, edges, right=True), minlength=runs.n_runs * n_bins)
+    equivalent_cycles = np.bincount(run, weights=depth, minlength=runs.n_runs) / 100
+    deepest = np.zeros(runs.n_runs)
+    np.maximum.at(deepest, run, depth)
+    return counts.reshape(runs.n_runs, n_bins), equivalent_cycles, deepest
+
+def peak_power(runs: RunBatch, windows: tuple | None = None) -> np.ndarray:
+    """Highest average net battery power of every run over windows of driving time.
+
+    Stops are left out of the time axis, so a window only covers time on the road. The
+    cumulative energy is piecewise linear between rows, so the best window always starts
+    or ends at a row; both are evaluated for every row.
+
+    Args:
+        windows: Window lengths in s (default `PeakPowerWindows`).
+
+    Returns:
+        np.ndarray: (n_runs, len(windows)) W, NaN where a run is shorter than the window
+    """
+    windows = config.PeakPowerWindows if windows is None else windows
+    dt, power = battery_power(runs)
+    energy = np.where(dt > 0, np.nan_to_num(power) * dt / 3600, 0.0)
+
+    # Driving time and energy since the start of the run
+    run_starts = np.flatnonzero(np.r_[True, runs.run[1:] != runs.run[:-1]])
+    drive_time = np.cumsum(dt)
+    drive_energy = np.cumsum(energy)
+    drive_time -= drive_time[run_starts][runs.run]
+    drive_energy -= drive_energy[run_starts][runs.run]
+    duration = drive_time[np.r_[run_starts[1:] - 1, len(dt) - 1]]
+
+    # All runs on one time axis, separated by more than the longest window
+    offsets = np.r_[0.0, np.cumsum(duration + max(windows) + 1)[:-1]]
+    axis = drive_time + offsets[runs.run]
+
+    peaks = np.full((runs.n_runs, len(windows)), -np.inf)
+    for j, window in enumerate(windows):
+        # Windows starting at a row, then windows ending at one
+        gain_after = np.interp(axis + window, axis, drive_energy) - drive_energy
+        gain_before = drive_energy - np.interp(axis - window, axis, drive_energy)
+        for gain, valid in ((gain_after, drive_time + window <= duration[runs.run]),
+                            (gain_before, drive_time >= window)):
+            np.maximum.at(peaks[:, j], runs.run[valid], gain[valid] * 3600 / window)
+    return np.where(np.isfinite(peaks), peaks, np.nan)
+
+def summarize(runs: RunBatch) -> pd.DataFrame:
+    """Battery stress of every run, one row per run (for comparing strategies)."""
+    residency = c_rate_residency(runs)
+    counts, equivalent_cycles, deepest = dod_cycles(runs)
+    peaks = peak_power(runs)
+
+    summary = pd.DataFrame({'equivalent_cycles': equivalent_cycles, 'max_dod': deepest}, index=runs.names)
+    for label, hours in zip(bin_labels(config.CRateBins), residency.T):
+        summary[f"hours C {label}"] = hours
+    for label, count in zip(bin_labels(config.DoDBins), counts.T):
+        summary[f"swings DoD {label}%"] = count
+    for window, peak in zip(config.PeakPowerWindows, peaks.T):
+        summary[f"peak W {window}s"] = peak
+    return summary
+
+if __name__ == '__main__':
+    # python battery_analytics.py [run store directories or csvs...] (default: the last run)
+    paths = sys.argv[1:]
+    runs = load_runs(paths) if paths else RunBatch.from_frames({'last run': load_output(columns=ANALYTICS_COLUMNS)})
+    print(summarize(runs).T.to_string())
@@ -0,0 +1,237 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import warnings
+from dataclasses import dataclass, asdict
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import scipy
+
+import race_config as config
+from car import calculate_power
+from constraints import battery_acc_constraint_func
+from context import SegmentContext
+from evaluation import clear_cache
+from profiles import extract_profiles
+from route_store import load_route
+import fullmodelrunner
+import instrumentation
+import model
+
+# Settings switched off while benchmarking: every solve starts from the same guess and
+# nothing is written to disk (instrumentation log, run stream, run store, warm-start cache)
+_DISABLED_SETTINGS = ("UseWarmStartCache", "Instrumentation", "RunStream", "WriteRunStore")
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    """Cost of one benchmark at one route size."""
+    name: str
+    nodes: int  # velocity nodes of the route/segment
+    time: float  # s, best of the timed repeats
+    peak_memory: float  # MB allocated at the peak of one run (tracemalloc)
+    evaluations: int  # car/solar model evaluations of a velocity profile (evaluation cache misses)
+    thermal_solves: int  # winding temperature solves
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}/{self.nodes}"
+
+def synthetic_context(n_nodes: int, index_no: int = 0) -> SegmentContext:
+    """Segment `index_no` of `processed_route_data.csv` resampled to `n_nodes` velocity nodes.
+
+    Every route column is interpolated along the rows and the segment length is kept, so
+    the solves stay comparable across sizes (same distance, battery targets and terrain).
+    """
+    columns = load_route().segment(index_no)
+    n_rows = len(columns["step_distance"])
+    x = np.linspace(0, n_rows - 1, n_nodes - 1)
+    resampled = {name: np.interp(x, np.arange(n_rows), values) for name, values in columns.items()}
+
+    length = columns["step_distance"].sum()
+    resampled["step_distance"] = np.full(n_nodes - 1, length / (n_nodes - 1))
+    resampled["cumulative_distance"] = (columns["cumulative_distance"][0] * 1000 - columns["step_distance"][0]
+                                        + np.cumsum(resampled["step_distance"])) / 1000
+    return SegmentContext.from_columns(
+        resampled,
+        initial_energy=config.BatteryCapacity * config.BatteryLevelWayPoints[index_no],
+        final_energy=config.BatteryCapacity * config.BatteryLevelWayPoints[index_no + 1],
+    )
+
+def _profile(ctx: SegmentContext) -> np.ndarray:
+    """Flat `InitialGuessVelocity` profile, at rest at both ends."""
+    return np.concatenate([[0], np.full(ctx.n_points - 2, config.InitialGuessVelocity), [0]])
+
+def _power_kernel(ctx: SegmentContext) -> Callable[[], object]:
+    avg_speed = np.full(len(ctx.segments), float(config.InitialGuessVelocity))
+    acceleration = np.zeros(len(ctx.segments))
+    return lambda: calculate_power(avg_speed, acceleration, ctx.slopes, ctx.wind_speed, ctx.wind_dir)
+
+def _battery_constraint(ctx: SegmentContext) -> Callable[[], object]:
+    v_prof = _profile(ctx)
+
+    def run():
+        clear_cache()  # measure the evaluation itself, not a cache hit
+        return battery_acc_constraint_func(v_prof, ctx)
+    return run
+
+def _profiles(ctx: SegmentContext) -> Callable[[], object]:
+    v_prof = _profile(ctx)
+
+    def run():
+        clear_cache()
+        return extract_profiles(v_prof, ctx)
+    return run
+
+def _segment_solve(ctx: SegmentContext) -> Callable[[], object]:
+    return lambda: model.main(ctx, max_iter=config.BenchmarkSolverMaxIter)
+
+# name: (factory of the benchmarked call for a context, node counts, timed repeats)
+BENCHMARKS = {
+    "calculate_power": (_power_kernel, config.BenchmarkSizes, 10),
+    "battery_acc_constraint_func": (_battery_constraint, config.BenchmarkSizes, 10),
+    "extract_profiles": (_profiles, config.BenchmarkSizes, 10),
+    "model.main": (_segment_solve, config.BenchmarkSolverSizes, 3),
+}
+
+def _measure(name: str, nodes: int, run: Callable[[], object], repeats: int) -> BenchmarkResult:
+    """Counts and peak memory from a traced run, then the best wall time of `repeats` untraced runs."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        clear_cache()
+        tracemalloc.start()
+        try:
+            with instrumentation.counting() as counters:
+                run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+
+    return BenchmarkResult(name, nodes, min(times), peak / 2**20, counters.evaluations, counters.thermal_calls)
+
+def run_benchmarks(names: list[str] | None = None) -> list[BenchmarkResult]:
+    """Runs the selected benchmarks (default: all, plus the full race) and prints one line per result.
+
+    The `_DISABLED_SETTINGS` are off meanwhile, and the solver warnings of the deliberately
+    short `BenchmarkSolverMaxIter` solves are silenced.
+    """
+    names = list(BENCHMARKS) + ["fullmodelrunner.main"] if names is None else names
+    saved = {name: getattr(config, name) for name in _DISABLED_SETTINGS}
+    results = []
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="segment at", category=RuntimeWarning)
+        try:
+            for name in _DISABLED_SETTINGS:
+                setattr(config, name, False)
+            for name in names:
+                if name == "fullmodelrunner.main":
+                    # The waypoints are route rows, so the full race only runs on the real route
+                    nodes = len(load_route()) + fullmodelrunner.N_SEGMENTS
+                    runs = [(nodes, fullmodelrunner.run_race, 3)]
+                else:
+                    factory, sizes, repeats = BENCHMARKS[name]
+                    runs = [(n, factory(synthetic_context(n)), repeats) for n in sizes]
+
+                for nodes, run, repeats in runs:
+                    result = _measure(name, nodes, run, repeats)
+                    print(f"{result.key:<40} {result.time * 1000:10.2f} ms {result.peak_memory:9.2f} MB "
+                          f"{result.evaluations:7d} evals {result.thermal_solves:7d} thermal")
+                    results.append(result)
+        finally:
+            for name, value in saved.items():
+                setattr(config, name, value)
+    return results
+
+def compare(results: list[BenchmarkResult], baselines: dict) -> list[str]:
+    """Regressions of `results` against stored baselines.
+
+    Time and memory are flagged beyond `BenchmarkTimeTolerance` / `BenchmarkMemoryTolerance`
+    (relative); the evaluation counts are deterministic, so any increase is flagged.
+    """
+    regressions = []
+    for result in results:
+        baseline = baselines.get("results", {}).get(result.key)
+        if baseline is None:
+            continue
+        if (result.time > baseline["time"] * (1 + config.BenchmarkTimeTolerance)
+                and result.time - baseline["time"] > config.BenchmarkMinTimeDifference):
+            regressions.append(f"{result.key}: time {result.time * 1000:.2f} ms (baseline {baseline['time'] * 1000:.2f} ms)")
+        if result.peak_memory > baseline["peak_memory"] * (1 + config.BenchmarkMemoryTolerance):
+            regressions.append(f"{result.key}: peak memory {result.peak_memory:.2f} MB "
+                               f"(baseline {baseline['peak_memory']:.2f} MB)")
+        for count in ("evaluations", "thermal_solves"):
+            if getattr(result, count) > baseline[count]:
+                regressions.append(f"{result.key}: {count} {getattr(result, count)} (baseline {baseline[count]})")
+    return regressions
+
+def load_baselines(path: str | None = None) -> dict:
+    path = path or config.BenchmarkBaselineFile
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _machine() -> dict:
+    """Platform and library versions the timings depend on."""
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "pandas": pd.__version__,
+    }
+
+def save_baselines(results: list[BenchmarkResult], path: str | None = None) -> None:
+    """Stores results as the new baselines, merged into the existing ones (by name and size)."""
+    path = path or config.BenchmarkBaselineFile
+    baselines = load_baselines(path)
+    baselines["machine"] = _machine()
+    stored = baselines.setdefault("results", {})
+    for result in results:
+        stored[result.key] = {k: v for k, v in asdict(result).items() if k not in ("name", "nodes")}
+    baselines["results"] = dict(sorted(stored.items()))
+
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2)
+        f.write("\n")
+
+def main(update: bool = False, names: list[str] | None = None) -> list[str]:
+    """Runs the benchmarks and reports regressions against the baselines (or replaces them).
+
+    Returns:
+        list of regression messages (empty if none or when updating)
+    """
+    results = run_benchmarks(names)
+    if update:
+        save_baselines(results)
+        print(f"Baselines written to {config.BenchmarkBaselineFile}")
+        return []
+
+    baselines = load_baselines()
+    if baselines.get("machine", _machine()) != _machine():
+        print(f"Note: baselines were recorded on {baselines['machine']}, this is {_machine()}")
+    regressions = compare(results, baselines)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if not regressions:
+        print("No regressions")
+    return regressions
+
+if __name__ == "__main__":
+    # python benchmark.py [--update] [benchmark names...]
+    args = sys.argv[1:]
+    update = "--update" in args
+    names = [arg for arg in args if arg != "--update"] or None
+    sys.exit(1 if main(update, names) else 0)
@@ -1,19 +1,206 @@
+from dataclasses import dataclass, fields, replace
+from functools import cached_property
+
 import numpy as np
 
-from race_config import (
-    Mass, ZeroSpeedCrr, AirDensity, CDA, R_Out, Ta,
-    GravityAcc, EPSILON
-)
+import race_config as config
+import instrumentation
+from race_config import GravityAcc, EPSILON
+
+# Motor model coefficients (see _motor_losses)
+_REMANENCE_SLOPE = -0.0006
+_RESISTANCE_SLOPE = 0.00022425
+_CURRENT_COEFF = 0.561
+_THERMAL_RESISTANCE = 0.455
+
+@dataclass(frozen=True, eq=False)
+class CarParams:
+    """Physical car parameters, with the model coefficients derived from them.
+
+    Every field is either a scalar or an array of shape (K, 1). Arrays broadcast against
+    the (N,) route arrays, so one model call evaluates K car variants at once and returns
+    (K, N) results (see `sweep`).
+    """
+    mass: float | np.ndarray  # kg
+    zero_speed_crr: float | np.ndarray
+    cda: float | np.ndarray  # m^2
+    r_out: float | np.ndarray  # outer radius of wheel (m)
+    ta: float | np.ndarray  # ambient temperature (K)
+    air_density: float | np.ndarray  # kg/m^3
+    panel_area: float | np.ndarray  # m^2
+    panel_efficiency: float | np.ndarray
+    bus_voltage: float | np.ndarray  # V
+    max_current: float | np.ndarray  # A
+    battery_capacity: float | np.ndarray  # Wh
+
+    @classmethod
+    def from_config(cls) -> "CarParams":
+        """Parameters currently set in race_config."""
+        return cls(
+            mass=config.Mass, zero_speed_crr=config.ZeroSpeedCrr, cda=config.CDA, r_out=config.R_Out,
+            ta=config.Ta, air_density=config.AirDensity, panel_area=config.PanelArea,
+            panel_efficiency=config.PanelEfficiency, bus_voltage=config.BusVoltage,
+            max_current=config.MaxCurrent, battery_capacity=config.BatteryCapacity,
+        )
+
+    def sweep(self, **values: np.ndarray) -> "CarParams":
+        """Batch of K variants of these parameters, e.g. `car.sweep(mass=np.linspace(250, 300, K))`.
+
+        All given arrays must have the same length K (use np.meshgrid(...).ravel() for a grid);
+        the remaining parameters are shared by all variants.
+        """
+        return replace(self, **{name: np.asarray(v, dtype=float).reshape(-1, 1) for name, v in values.items()})
+
+    @property
+    def size(self) -> int:
+        """Number of variants K (1 for scalar parameters)."""
+        return int(np.prod(np.broadcast_shapes(*(np.shape(getattr(self, f.name)) for f in fields(self)))))
+
+    @cached_property
+    def frictional_torque_coeff(self):
+        return self.r_out * self.mass * GravityAcc * self.zero_speed_crr
+
+    @cached_property
+    def drag_coeff(self):
+        return 0.5 * self.cda * self.air_density * (self.r_out ** 3) / (self.r_out ** 2)
+
+    @cached_property
+    def slope_coeff(self):
+        return self.mass * GravityAcc
+
+    @cached_property
+    def windage_loss_coeff(self):
+        return (170.4 * 10**-6) / (self.r_out ** 2)
+
+    @cached_property
+    def eddy_coeff(self):
+        return 9.602 * (10**-6) / (self.r_out ** 2)
+
+    @cached_property
+    def panel_power_coeff(self):
+        return self.panel_area * self.panel_efficiency
+
+    @cached_property
+    def max_power(self):
+        return self.max_current * self.bus_voltage
+
+# Parameters used when no CarParams is passed (race_config at import time)
+DEFAULT_CAR = CarParams.from_config()
+
+# Thermal solver settings
+_FIXED_POINT_TOL = 0.001  # K
+_NEWTON_TOL = 0.001  # K, residual before the final step (quadratic convergence makes the result much tighter)
+_NEWTON_MAX_ITER = 8
+
+def _motor_losses(torque: np.ndarray, speed2: np.ndarray, winding_temp: np.ndarray,
+                  car: CarParams) -> tuple[np.ndarray, np.ndarray]:
+    """Copper and eddy current losses of the hub motor at a given winding temperature.
 
-# Constants
-_FRICTIONAL_TORQUE_COEFF = R_Out * Mass * GravityAcc * ZeroSpeedCrr
-_DRAG_COEFF_BASE = 0.5 * CDA * AirDensity * (R_Out ** 3)
-_DRAG_COEFF = _DRAG_COEFF_BASE / (R_Out ** 2)
-_SLOPE_COEFF = Mass * GravityAcc
-_WINDAGE_LOSS_COEFF = (170.4 * 10**-6) / (R_Out ** 2)
+    Returns:
+        tuple: (copper_loss, eddy_loss)
+    """
+    # B = 1.6716 - 0.0006 * (Ta + temp_prev)  # simplified magnetic remanence
+    magnetic_remanence = 1.6716 + _REMANENCE_SLOPE * (car.ta + winding_temp)
+    rms_current = _CURRENT_COEFF * magnetic_remanence * torque
+
+    # resistance = 0.00022425 * temp_prev - 0.00820525  # winding resistance
+    winding_resistance = _RESISTANCE_SLOPE * winding_temp - 0.00820525
+
+    copper_loss = 3 * rms_current ** 2 * winding_resistance
+    eddy_loss = (car.eddy_coeff * magnetic_remanence ** 2 / winding_resistance) * speed2
+    return copper_loss, eddy_loss
+
+def _motor_loss_temp_derivative(torque: np.ndarray, speed2: np.ndarray, winding_temp: np.ndarray,
+                                car: CarParams) -> np.ndarray:
+    """Derivative of the total motor loss (copper + eddy) with respect to winding temperature."""
+    magnetic_remanence = 1.6716 + _REMANENCE_SLOPE * (car.ta + winding_temp)
+    winding_resistance = _RESISTANCE_SLOPE * winding_temp - 0.00820525
+
+    d_copper = 3 * _CURRENT_COEFF ** 2 * torque ** 2 * (
+        2 * magnetic_remanence * _REMANENCE_SLOPE * winding_resistance
+        + magnetic_remanence ** 2 * _RESISTANCE_SLOPE
+    )
+    d_eddy = car.eddy_coeff * speed2 * (
+        2 * magnetic_remanence * _REMANENCE_SLOPE * winding_resistance
+        - magnetic_remanence ** 2 * _RESISTANCE_SLOPE
+    ) / winding_resistance ** 2
+    return d_copper + d_eddy
+
+def _motor_loss_partials(torque: np.ndarray, speed: np.ndarray, winding_temp: np.ndarray,
+                         car: CarParams) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Partial derivatives of the total motor loss (copper + eddy) at a fixed winding temperature.
+
+    Returns:
+        tuple: (d_loss/d_torque, d_loss/d_speed, d_loss/d_temp)
+    """
+    magnetic_remanence = 1.6716 + _REMANENCE_SLOPE * (car.ta + winding_temp)
+    winding_resistance = _RESISTANCE_SLOPE * winding_temp - 0.00820525
+
+    d_torque = 6 * _CURRENT_COEFF ** 2 * torque * magnetic_remanence ** 2 * winding_resistance
+    d_speed = 2 * car.eddy_coeff * magnetic_remanence ** 2 / winding_resistance * speed
+    return d_torque, d_speed, _motor_loss_temp_derivative(torque, speed ** 2, winding_temp, car)
+
+def _calculate_torque(speed: np.ndarray, slope: np.ndarray, wind_speed: np.ndarray, wind_dir: np.ndarray,
+                      car: CarParams) -> np.ndarray:
+    """Wheel torque from rolling resistance and drag (relative to the wind)."""
+    drag_torque = car.drag_coeff * (speed ** 2 + wind_speed**2 - 2 * speed * wind_speed * np.cos(np.radians(wind_dir)))
+    return car.frictional_torque_coeff * np.cos(np.radians(slope)) + drag_torque
+
+def _solve_winding_temperature_fixed_point(torque: np.ndarray, speed2: np.ndarray, car: CarParams) -> np.ndarray:
+    """Fixed-point iteration for the steady-state winding temperature."""
+    temp_prev = car.ta  # Initial guess for winding temperature
+
+    while True:
+        instrumentation.count("thermal_iterations")
+        copper_loss, eddy_loss = _motor_losses(torque, speed2, temp_prev, car)
+        winding_temp = _THERMAL_RESISTANCE * (copper_loss + eddy_loss) + car.ta
+    
+        converged = np.abs(winding_temp - temp_prev) < _FIXED_POINT_TOL
+        if np.all(converged):
+            return temp_prev
+
+        temp_prev = np.where(converged, temp_prev, winding_temp)
 
+def _solve_winding_temperature_newton(torque: np.ndarray, speed2: np.ndarray, car: CarParams) -> np.ndarray:
+    """Vectorized Newton solve of Tw = 0.455 * (Pc(Tw) + Pe(Tw)) + Ta.
+
+    With B and R linear in Tw the losses reduce to B^2 * (kc * R + ke / R), where kc and ke
+    do not depend on the temperature and are computed once. Newton then converges
+    quadratically from the ambient temperature in a few steps over the whole array.
+    """
+    copper_coeff = _THERMAL_RESISTANCE * 3 * (_CURRENT_COEFF * torque) ** 2
+    eddy_coeff = _THERMAL_RESISTANCE * car.eddy_coeff * speed2
+    winding_temp = np.full(np.broadcast(torque, speed2, car.ta).shape, car.ta, dtype=float)
+
+    for _ in range(_NEWTON_MAX_ITER):
+        instrumentation.count("thermal_iterations")
+        magnetic_remanence = 1.6716 + _REMANENCE_SLOPE * (car.ta + winding_temp)
+        winding_resistance = _RESISTANCE_SLOPE * winding_temp - 0.00820525
+        loss_factor = copper_coeff * winding_resistance + eddy_coeff / winding_resistance
+
+        residual = magnetic_remanence ** 2 * loss_factor + car.ta - winding_temp
+        d_residual = (
+            2 * magnetic_remanence * _REMANENCE_SLOPE * loss_factor
+            + magnetic_remanence ** 2 * _RESISTANCE_SLOPE * (copper_coeff - eddy_coeff / winding_resistance ** 2)
+            - 1
+        )
+        winding_temp = winding_temp - residual / d_residual
+        if np.max(np.abs(residual)) < _NEWTON_TOL:
+            break
+
+    return winding_temp
+
+def _solve_winding_temperature(torque: np.ndarray, speed2: np.ndarray, car: CarParams) -> np.ndarray:
+    """Steady-state winding temperature using the configured `ThermalSolver`."""
+    instrumentation.count("thermal_calls")
+    if config.ThermalSolver == "fixed_point":
+        return _solve_winding_temperature_fixed_point(torque, speed2, car)
+    return _solve_winding_temperature_newton(torque, speed2, car)
+
+@instrumentation.timed("calculate_power")
 def calculate_power(speed: np.ndarray, acceleration: np.ndarray, slope: np.ndarray, 
-                    wind_speed: np.ndarray, wind_dir: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+                    wind_speed: np.ndarray, wind_dir: np.ndarray,
+                    car: CarParams | None = None) -> tuple[np.ndarray, np.ndarray]:
     """Calculates net power consumption and output power for the car.
 
     Renames:
@@ -22,45 +209,103 @@ def calculate_power(speed: np.ndarray, acceleration: np.ndarray, slope: np.ndarr
     - Pe (eddy current losses)
     - Tw (winding temperature)
 
+    A batched `car` (see `CarParams.sweep`) returns (K, N) arrays for (N,) route inputs.
+
     Returns:
         tuple: (net_power_clipped, output_power)
     """
+    if car is None:
+        car = DEFAULT_CAR
     speed2 = speed ** 2
-
-    # Calculate drag torque considering wind speed and relative direction
-    drag_torque = _DRAG_COEFF * (speed2 + wind_speed**2 - 2 * speed * wind_speed * np.cos(np.radians(wind_dir)))
-    torque = _FRICTIONAL_TORQUE_COEFF * np.cos(np.radians(slope)) + drag_torque
+    torque = _calculate_torque(speed, slope, wind_speed, wind_dir, car)
     
     # Thermal iteration for winding temperature and electrical losses
-    temp_prev = Ta  # Initial guess for winding temperature
-
-    while True:
-        # B = 1.6716 - 0.0006 * (Ta + temp_prev)  # simplified magnetic remanence
-        magnetic_remanence = 1.6716 - 0.0006 * (Ta + temp_prev)
-        rms_current = 0.561 * magnetic_remanence * torque
-        
-        # resistance = 0.00022425 * temp_prev - 0.00820525  # winding resistance
-        winding_resistance = 0.00022425 * temp_prev - 0.00820525
-        
-        copper_loss = 3 * rms_current ** 2 * winding_resistance
-        eddy_loss = (9.602 * (10**-6) * ((magnetic_remanence / R_Out) ** 2) / winding_resistance) * speed2
-        
-        winding_temp = 0.455 * (copper_loss + eddy_loss) + Ta
-    
-        converged = np.abs(winding_temp - temp_prev) < 0.001
-        if np.all(converged):
-            break
-
-        temp_prev = np.where(converged, temp_prev, winding_temp)
+    winding_temp = _solve_winding_temperature(torque, speed2, car)
+    copper_loss, eddy_loss = _motor_losses(torque, speed2, winding_temp, car)
 
     # Power calculations
-    output_power = torque * speed / R_Out
-    windage_loss = speed2 * _WINDAGE_LOSS_COEFF
-    acceleration_power = (Mass * acceleration + _SLOPE_COEFF * np.sin(np.radians(slope))) * speed
+    output_power = torque * speed / car.r_out
+    windage_loss = speed2 * car.windage_loss_coeff
+    acceleration_power = (car.mass * acceleration + car.slope_coeff * np.sin(np.radians(slope))) * speed
 
     net_power = output_power + windage_loss + copper_loss + eddy_loss + acceleration_power
     return net_power.clip(0), output_power
 
+@instrumentation.timed("calculate_power_gradient")
+def calculate_power_gradient(speed: np.ndarray, acceleration: np.ndarray, slope: np.ndarray, 
+                             wind_speed: np.ndarray, wind_dir: np.ndarray,
+                             car: CarParams | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Element-wise derivatives of the clipped net power from `calculate_power`.
+
+    The winding temperature is differentiated through its converged fixed point
+    (implicit function theorem), so the result is exact for the converged losses.
+
+    Returns:
+        tuple: (d_net_power/d_speed, d_net_power/d_acceleration)
+    """
+    if car is None:
+        car = DEFAULT_CAR
+    speed2 = speed ** 2
+    torque = _calculate_torque(speed, slope, wind_speed, wind_dir, car)
+    d_torque_d_speed = car.drag_coeff * (2 * speed - 2 * wind_speed * np.cos(np.radians(wind_dir)))
+
+    winding_temp = _solve_winding_temperature(torque, speed2, car)
+    copper_loss, eddy_loss = _motor_losses(torque, speed2, winding_temp, car)
+    loss_d_torque, loss_d_speed, loss_d_temp = _motor_loss_partials(torque, speed, winding_temp, car)
+
+    # Explicit loss sensitivity, then the temperature feedback through Tw = 0.455 * losses + Ta
+    loss_d_speed_explicit = loss_d_speed + loss_d_torque * d_torque_d_speed
+    d_temp_d_speed = _THERMAL_RESISTANCE * loss_d_speed_explicit / (1 - _THERMAL_RESISTANCE * loss_d_temp)
+    d_loss_d_speed = loss_d_speed_explicit + loss_d_temp * d_temp_d_speed
+
+    output_power = torque * speed / car.r_out
+    acceleration_force = car.mass * acceleration + car.slope_coeff * np.sin(np.radians(slope))
+    net_power = output_power + speed2 * car.windage_loss_coeff + copper_loss + eddy_loss + acceleration_force * speed
+
+    d_speed = (
+        (d_torque_d_speed * speed + torque) / car.r_out
+        + 2 * speed * car.windage_loss_coeff
+        + d_loss_d_speed
+        + acceleration_force
+    )
+    d_acceleration = car.mass * speed
+
+    # clip(0) flattens the power wherever the car is regenerating/coasting
+    active = net_power > 0
+    return np.where(active, d_speed, 0.0), np.where(active, d_acceleration, 0.0)
+
+def calculate_power_wind_gradient(speed: np.ndarray, acceleration: np.ndarray, slope: np.ndarray,
+                                  wind_speed: np.ndarray, wind_dir: np.ndarray,
+                                  car: CarParams | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Element-wise derivatives of the clipped net power with respect to the wind.
+
+    Used when the wind varies with the arrival time (forecast_index), so the power depends
+    on the velocity profile through the time as well.
+
+    Returns:
+        tuple: (d_net_power/d_wind_speed, d_net_power/d_wind_dir per degree)
+    """
+    if car is None:
+        car = DEFAULT_CAR
+    speed2 = speed ** 2
+    torque = _calculate_torque(speed, slope, wind_speed, wind_dir, car)
+    wind_dir_rad = np.radians(wind_dir)
+    d_torque_d_wind_speed = car.drag_coeff * (2 * wind_speed - 2 * speed * np.cos(wind_dir_rad))
+    d_torque_d_wind_dir = car.drag_coeff * 2 * speed * wind_speed * np.sin(wind_dir_rad) * np.pi / 180
+
+    winding_temp = _solve_winding_temperature(torque, speed2, car)
+    copper_loss, eddy_loss = _motor_losses(torque, speed2, winding_temp, car)
+    loss_d_torque, _, loss_d_temp = _motor_loss_partials(torque, speed, winding_temp, car)
+
+    # Output power and losses through the torque, with the same temperature feedback as calculate_power_gradient
+    d_net_d_torque = speed / car.r_out + loss_d_torque / (1 - _THERMAL_RESISTANCE * loss_d_temp)
+
+    net_power = (torque * speed / car.r_out + speed2 * car.windage_loss_coeff + copper_loss + eddy_loss
+                 + (car.mass * acceleration + car.slope_coeff * np.sin(np.radians(slope))) * speed)
+    active = net_power > 0
+    return (np.where(active, d_net_d_torque * d_torque_d_wind_speed, 0.0),
+            np.where(active, d_net_d_torque * d_torque_d_wind_dir, 0.0))
+
 def calculate_dt(start_speed: np.ndarray, stop_speed: np.ndarray, dx: np.ndarray) -> np.ndarray:
     """Calculates time interval (dt) between two points given constant acceleration."""
     dt = 2 * dx / (start_speed + stop_speed + EPSILON)
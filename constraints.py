@@ -1,9 +1,11 @@
 import numpy as np
-import race_config as config
-from race_config import BatteryCapacity, DeepDischargeCap, MaxVelocity, Mass, MaxCurrent, BusVoltage
-import state
-from car import calculate_dt, calculate_power
-from solar import calculate_incident_solarpower
+from scipy import sparse
+from race_config import BatteryCapacity, DeepDischargeCap, MaxVelocity, MaxCurrent, BusVoltage, EPSILON
+from context import SegmentContext
+from car import calculate_dt, calculate_power_gradient, calculate_power_wind_gradient
+from evaluation import evaluate
+from solar import calculate_incident_solarpower_gradient
+import instrumentation
 
 SafeBatteryLevel = BatteryCapacity * DeepDischargeCap
 MaxPower = MaxCurrent * BusVoltage
@@ -20,51 +22,184 @@ def get_bounds(n_segments: int) -> list[tuple[float, float]]:
     """
     return ([(0, 0)] + [(0.01, MaxVelocity)] * (n_segments - 2) + [(0, 0)])
 
-def objective(velocity_profile: np.ndarray, segment_array: np.ndarray) -> float:
+@instrumentation.timed("objective")
+def objective(velocity_profile: np.ndarray, ctx: SegmentContext) -> float:
     """Calculates total race time (the objective to minimize)."""
-    v_start, v_stop, segments = _trim_arrays(velocity_profile[:-1], velocity_profile[1:], segment_array)
+    v_start, v_stop, segments = _trim_arrays(velocity_profile[:-1], velocity_profile[1:], ctx.segments)
     dt = calculate_dt(v_start, v_stop, segments)
     return float(np.sum(dt))
 
-def battery_acc_constraint_func(v_prof: np.ndarray, segment_array: np.ndarray, 
-                                slope_array: np.ndarray, latitude_array: np.ndarray, 
-                                longitude_array: np.ndarray, wind_speed: np.ndarray, 
-                                wind_dir: np.ndarray) -> tuple[float, float]:
-    """Ensures battery doesn't deplete and power doesn't exceed MaxPower."""
-    v_start, v_stop, segments, slopes, lats, longs, ws, wd = _trim_arrays(
-        v_prof[:-1], v_prof[1:], segment_array, slope_array, 
-        latitude_array, longitude_array, wind_speed, wind_dir
+def _bidiagonal(start: np.ndarray, stop: np.ndarray, n_points: int) -> sparse.csr_matrix:
+    """(segments x points) matrix with `start` on the diagonal and `stop` one column to the right.
+
+    Segment i only depends on the speeds at its end points, nodes i and i + 1.
+    """
+    n_segments = len(start)
+    return sparse.csr_matrix(
+        (np.column_stack([start, stop]).ravel(), (np.arange(n_segments)[:, None] + [0, 1]).ravel(),
+         np.arange(0, 2 * n_segments + 1, 2)),
+        shape=(n_segments, n_points),
     )
-    
-    avg_speed = (v_start + v_stop) / 2
-    dt = calculate_dt(v_start, v_stop, segments)
-    acceleration = (v_stop - v_start) / dt
 
-    net_power, _ = calculate_power(avg_speed, acceleration, slopes, ws, wd)
-    solar_power = calculate_incident_solarpower(dt.cumsum() + state.TimeOffset, lats, longs)
+def _cumulative_jacobian(start: np.ndarray, stop: np.ndarray, d_dt: np.ndarray, time_rate: np.ndarray,
+                         n_points: int) -> sparse.csr_matrix:
+    """Sparse (segments x points) Jacobian of the running sum over segments of f_k, where
 
-    energy_consumption = ((net_power - solar_power) * dt).cumsum() / 3600
-    battery_profile = state.InitialBatteryCapacity - energy_consumption - SafeBatteryLevel
+        d f_k = start[k] dv_k + stop[k] dv_{k+1} + time_rate[k] d(arrival time of segment k)
 
-    return float(np.min(battery_profile)), float(MaxPower - np.max(net_power))
+    and the arrival time is the running sum of dt (d dt_k = d_dt[k] (dv_k + dv_{k+1})).
+    Row i only involves nodes 0..i + 1, so the matrix is lower triangular plus the first
+    superdiagonal; its CSR arrays are filled in directly from closed-form entries.
+    """
+    n_segments = len(start)
+    rows, cols = np.tril_indices(n_segments, k=1, m=n_points)
+    indptr = np.concatenate([[0], np.cumsum(np.minimum(np.arange(n_segments) + 2, n_points))])
 
-def final_battery_constraint_func(v_prof: np.ndarray, segment_array: np.ndarray, 
-                                  slope_array: np.ndarray, latitude_array: np.ndarray, 
-                                  longitude_array: np.ndarray, wind_speed: np.ndarray, 
-                                  wind_dir: np.ndarray) -> tuple[float, float]:
-    """Ensures final battery level meets the strategy target."""
-    v_start, v_stop, segments, slopes, lats, longs, ws, wd = _trim_arrays(
-        v_prof[:-1], v_prof[1:], segment_array, slope_array, 
-        latitude_array, longitude_array, wind_speed, wind_dir
+    def at_node(values: np.ndarray) -> np.ndarray:
+        """values[j] on the segment starting at node j (zero past the last segment)."""
+        return np.concatenate([values, np.zeros(n_points - n_segments)])[cols]
+
+    def before_node(values: np.ndarray) -> np.ndarray:
+        """values[j - 1] on the segment ending at node j (zero before the first)."""
+        return np.concatenate([[0.0], values, np.zeros(n_points - n_segments - 1)])[cols]
+
+    # sum_{m <= k <= i} time_rate[k]: the weight of d dt_m in the running sum up to row i
+    sums = np.concatenate([[0.0], np.cumsum(time_rate)])
+    sums = np.concatenate([sums, np.full(n_points - n_segments, sums[-1])])
+    in_triangle = cols <= rows
+    values = (
+        in_triangle * (at_node(start) + (sums[rows + 1] - sums[cols]) * at_node(d_dt))
+        + before_node(stop) + (sums[rows + 1] - sums[np.maximum(cols - 1, 0)]) * before_node(d_dt)
     )
-    
-    avg_speed = (v_start + v_stop) / 2
+    return sparse.csr_matrix((values, cols, indptr), shape=(n_segments, n_points))
+
+def _dt_derivative(v_start: np.ndarray, v_stop: np.ndarray, dt: np.ndarray) -> np.ndarray:
+    """Derivative of each segment's dt with respect to either of its end speeds (they are equal)."""
+    return -dt / (v_start + v_stop + EPSILON)
+
+def _energy_jacobian(v_prof: np.ndarray, ctx: SegmentContext) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Net power and cumulative energy consumption together with their velocity derivatives.
+
+    The chain runs through `calculate_dt`, the acceleration, `calculate_power` (including the
+    thermal fixed point) and the time dependence of `calculate_incident_solarpower` and, with
+    UseForecastWind, of the wind.
+
+    Returns:
+        tuple: (net_power, energy_consumption, d_net_power, d_energy_consumption), where the
+        derivatives are sparse (segments x points) matrices. d_energy_consumption is lower
+        triangular plus the first superdiagonal (n^2 / 2 entries); d_net_power is bidiagonal,
+        or lower triangular too with UseForecastWind.
+    """
+    ev = evaluate(v_prof, ctx)
+    if ev.jacobian is not None:
+        return ev.jacobian
+
+    _, slopes, lats, longs, ws, wd = ev.route
+    dt, acceleration, net_power, solar_power = ev.dt, ev.acceleration, ev.net_power, ev.solar_power
+
+    d_dt = _dt_derivative(ev.v_start, ev.v_stop, dt)
+
+    # acceleration = (v_stop - v_start) / dt
+    d_acc_start = (-1 - acceleration * d_dt) / dt
+    d_acc_stop = (1 - acceleration * d_dt) / dt
+
+    p_speed, p_acc = calculate_power_gradient(ev.avg_speed, acceleration, slopes, ws, wd)
+    power_start = 0.5 * p_speed + p_acc * d_acc_start
+    power_stop = 0.5 * p_speed + p_acc * d_acc_stop
+    d_power = _bidiagonal(power_start, power_stop, len(v_prof))
+
+    # Solar power (and forecast wind) change with the arrival time of each segment
+    time_rate = -calculate_incident_solarpower_gradient(dt.cumsum() + ctx.time_offset, lats, longs)
+    if ev.wind_rates is not None:
+        # Forecast wind depends on the arrival time, so the power couples to all earlier nodes
+        p_ws, p_wd = calculate_power_wind_gradient(ev.avg_speed, acceleration, slopes, ws, wd)
+        wind_rate = p_ws * ev.wind_rates[0] + p_wd * ev.wind_rates[1]
+        d_time = _cumulative_jacobian(d_dt, d_dt, d_dt, np.zeros(len(dt)), len(v_prof))
+        d_power = d_power + sparse.diags(wind_rate) @ d_time
+        time_rate = time_rate + wind_rate
+
+    # energy = cumsum((net_power - solar_power) * dt / 3600)
+    energy_rate = net_power - solar_power
+    d_energy = _cumulative_jacobian(
+        (dt * power_start + energy_rate * d_dt) / 3600, (dt * power_stop + energy_rate * d_dt) / 3600,
+        d_dt, time_rate * dt / 3600, len(v_prof),
+    )
+
+    ev.jacobian = (net_power, ev.energy_consumption, d_power, d_energy)
+    return ev.jacobian
+
+@instrumentation.timed("objective_jac")
+def objective_jac(velocity_profile: np.ndarray, ctx: SegmentContext) -> np.ndarray:
+    """Gradient of `objective` with respect to the velocity profile."""
+    v_start, v_stop, segments = _trim_arrays(velocity_profile[:-1], velocity_profile[1:], ctx.segments)
     dt = calculate_dt(v_start, v_stop, segments)
-    acceleration = (v_stop - v_start) / dt
+    d_dt = _dt_derivative(v_start, v_stop, dt)
+    gradient = np.zeros(len(velocity_profile))
+    gradient[:len(dt)] += d_dt
+    gradient[1:len(dt) + 1] += d_dt
+    return gradient
+
+def _battery_and_power_margins(v_prof: np.ndarray, ctx: SegmentContext) -> tuple[np.ndarray, np.ndarray]:
+    """Per-node battery margin above SafeBatteryLevel and power margin below MaxPower.
+
+    Returns:
+        tuple: (battery_margin, power_margin), one entry per route segment.
+    """
+    ev = evaluate(v_prof, ctx)
+    battery_profile = ctx.initial_energy - ev.energy_consumption - SafeBatteryLevel
+
+    return battery_profile, MaxPower - ev.net_power
+
+@instrumentation.timed("battery_acc_constraint_func")
+def battery_acc_constraint_func(v_prof: np.ndarray, ctx: SegmentContext) -> tuple[float, float]:
+    """Ensures battery doesn't deplete and power doesn't exceed MaxPower."""
+    battery_margin, power_margin = _battery_and_power_margins(v_prof, ctx)
+    return float(np.min(battery_margin)), float(np.min(power_margin))
 
-    net_power, _ = calculate_power(avg_speed, acceleration, slopes, ws, wd)
-    solar_power = calculate_incident_solarpower(dt.cumsum() + state.TimeOffset, lats, longs)
+@instrumentation.timed("battery_acc_constraint_jac")
+def battery_acc_constraint_jac(v_prof: np.ndarray, ctx: SegmentContext) -> np.ndarray:
+    """Jacobian (2 x points) of `battery_acc_constraint_func`, taken at the active min/max node."""
+    net_power, energy_consumption, d_power, d_energy = _energy_jacobian(v_prof, ctx)
+    return -sparse.vstack([
+        d_energy[np.argmax(energy_consumption)], d_power[np.argmax(net_power)]
+    ]).toarray()
 
-    energy_consumption = ((net_power - solar_power) * dt).cumsum() / 3600
-    final_battery_lev = state.InitialBatteryCapacity - energy_consumption[-1] - state.FinalBatteryCapacity
+@instrumentation.timed("battery_acc_vector_constraint_func")
+def battery_acc_vector_constraint_func(v_prof: np.ndarray, ctx: SegmentContext) -> np.ndarray:
+    """Per-node form of `battery_acc_constraint_func` (all entries must be >= 0).
+
+    Returns:
+        Array of the battery margins at every node followed by the power margins at every node.
+    """
+    battery_margin, power_margin = _battery_and_power_margins(v_prof, ctx)
+    return np.concatenate([battery_margin, power_margin])
+
+@instrumentation.timed("battery_acc_vector_constraint_jac")
+def battery_acc_vector_constraint_jac(v_prof: np.ndarray, ctx: SegmentContext) -> sparse.csr_matrix:
+    """Sparse Jacobian (2 * segments x points) of `battery_acc_vector_constraint_func`.
+
+    The battery block is lower-triangular (plus the first superdiagonal) because of the
+    cumulative energy sum; the power block only couples each segment to its two end nodes
+    (unless UseForecastWind makes it lower-triangular too).
+    """
+    _, _, d_power, d_energy = _energy_jacobian(v_prof, ctx)
+    # Stack the two CSR blocks by concatenating their arrays
+    return sparse.csr_matrix(
+        (-np.concatenate([d_energy.data, d_power.data]), np.concatenate([d_energy.indices, d_power.indices]),
+         np.concatenate([d_energy.indptr, d_power.indptr[1:] + d_energy.nnz])),
+        shape=(d_energy.shape[0] + d_power.shape[0], len(v_prof)),
+    )
+
+@instrumentation.timed("final_battery_constraint_func")
+def final_battery_constraint_func(v_prof: np.ndarray, ctx: SegmentContext) -> tuple[float, float]:
+    """Ensures final battery level meets the strategy target."""
+    ev = evaluate(v_prof, ctx)
+    final_battery_lev = ctx.initial_energy - ev.energy_consumption[-1] - ctx.final_energy
     return float(final_battery_lev), float(-final_battery_lev)
+
+@instrumentation.timed("final_battery_constraint_jac")
+def final_battery_constraint_jac(v_prof: np.ndarray, ctx: SegmentContext) -> np.ndarray:
+    """Jacobian (2 x points) of `final_battery_constraint_func`."""
+    _, _, _, d_energy = _energy_jacobian(v_prof, ctx)
+    final_row = d_energy[-1].toarray()
+    return np.vstack([-final_row, final_row])
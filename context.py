@@ -0,0 +1,101 @@
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+import race_config as config
+from route_store import load_route
+
+@dataclass(frozen=True, eq=False)
+class SegmentContext:
+    """Everything a single segment solve depends on, passed explicitly instead of via `state`.
+
+    Instances are immutable (use `with_initial_energy` / `dataclasses.replace` to derive a
+    modified copy), so several solves can run side by side in one process. Equality is by
+    identity, which is what the evaluation cache keys on.
+    """
+    segments: np.ndarray  # step distance of every route row (m)
+    slopes: np.ndarray  # deg
+    lats: np.ndarray
+    longs: np.ndarray
+    wind_speed: np.ndarray  # m/s
+    wind_dir: np.ndarray  # deg
+    initial_energy: float  # Wh in the battery at the segment start
+    final_energy: float  # Wh target at the segment end
+    time_offset: float = 0.0  # race time at the segment start (s)
+    day: int = 1
+    start_distance: float = 0.0  # m along the whole route where the segment starts
+    enforce_final_energy: bool | None = None  # end exactly at final_energy (None: EnforceWaypointBattery)
+
+    def __post_init__(self):
+        for name in ("segments", "slopes", "lats", "longs", "wind_speed", "wind_dir"):
+            array = np.asarray(getattr(self, name), dtype=float)
+            array.flags.writeable = False
+            object.__setattr__(self, name, array)
+
+    @property
+    def route_arrays(self) -> tuple[np.ndarray, ...]:
+        """(segments, slopes, lats, longs, wind_speed, wind_dir)"""
+        return self.segments, self.slopes, self.lats, self.longs, self.wind_speed, self.wind_dir
+
+    @property
+    def enforces_final_energy(self) -> bool:
+        """True if the solve must end the segment exactly at `final_energy`."""
+        return config.EnforceWaypointBattery if self.enforce_final_energy is None else self.enforce_final_energy
+
+    @property
+    def n_points(self) -> int:
+        """Number of velocity nodes (one more than route rows)."""
+        return len(self.segments) + 1
+
+    def with_initial_energy(self, initial_energy: float) -> "SegmentContext":
+        """Copy of the context starting with a different battery energy."""
+        return replace(self, initial_energy=initial_energy)
+
+    @classmethod
+    def from_columns(cls, columns: dict[str, np.ndarray], initial_energy: float, final_energy: float,
+                     time_offset: float = 0.0, day: int = 1,
+                     enforce_final_energy: bool | None = None) -> "SegmentContext":
+        """Builds a context from named route columns (e.g. `RouteStore.segment` views)."""
+        return cls(
+            *(columns[name] for name in ("step_distance", "slope", "latitude", "longitude", "wind_speed", "wind_dir")),
+            initial_energy=initial_energy,
+            final_energy=final_energy,
+            time_offset=time_offset,
+            day=day,
+            start_distance=float(columns["cumulative_distance"][0] * 1000 - columns["step_distance"][0]),
+            enforce_final_energy=enforce_final_energy,
+        )
+
+    @classmethod
+    def from_route_df(cls, route_df: pd.DataFrame, initial_energy: float, final_energy: float,
+                      time_offset: float = 0.0, day: int = 1) -> "SegmentContext":
+        """Builds a context from a route DataFrame in the `processed_route_data.csv` layout."""
+        return cls(
+            *(route_df.iloc[:, i].to_numpy() for i in (0, 2, 3, 4, 5, 6)),
+            initial_energy=initial_energy,
+            final_energy=final_energy,
+            time_offset=time_offset,
+            day=day,
+        )
+
+def make_segment_context(day_no: int, index_no: int, time_offset: float = 0.0,
+                         levels: list[float] | None = None,
+                         enforce_final_energy: bool | None = None) -> SegmentContext:
+    """Context of segment `index_no` using the waypoints in race_config.
+
+    Args:
+        levels: Battery level (fraction of `BatteryCapacity`) at every waypoint
+            (`BatteryLevelWayPoints` by default).
+        enforce_final_energy: Whether the segment must end exactly at its next level
+            (`EnforceWaypointBattery` by default).
+    """
+    levels = config.BatteryLevelWayPoints if levels is None else levels
+    return SegmentContext.from_columns(
+        load_route().segment(index_no),
+        initial_energy=config.BatteryCapacity * levels[index_no],  # Wh
+        final_energy=config.BatteryCapacity * levels[index_no+1],  # Wh
+        time_offset=time_offset,
+        day=day_no,
+        enforce_final_energy=enforce_final_energy,
+    )
@@ -1,9 +1,17 @@
+import sys
+import threading
+
 import dash
-from dash import dcc, html
+from dash import dcc, html, Input, Output, State, Patch
+from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
 import pandas as pd
 import numpy as np
+
 import race_config as config
+from downsample import downsample
+import run_stream
+from run_store import load_output
 
 # Custom CSS styles
 custom_styles = {
@@ -21,9 +29,55 @@ external_stylesheets = [
     "https://fonts.googleapis.com/css2?family=Quicksand:wght@300..700&family=Roboto+Slab:wght@100..900&family=Space+Grotesk:wght@300..700&display=swap",
 ]
 
+def _series_trace(series: dict, graph_id: str, name: str) -> go.Scattergl:
+    """WebGL trace of a graph's data series, downsampled over the whole x range."""
+    x, y = downsample(*series[graph_id])
+    return go.Scattergl(x=x, y=y, mode='lines+markers', name=name)
+
+def _visible_range(relayout_data: dict | None) -> tuple[float, float] | None:
+    """x range after a zoom/pan (None after a reset); PreventUpdate for other relayouts."""
+    if not relayout_data:
+        raise PreventUpdate
+    if 'xaxis.range[0]' in relayout_data:
+        return float(relayout_data['xaxis.range[0]']), float(relayout_data['xaxis.range[1]'])
+    if 'xaxis.range' in relayout_data:
+        return tuple(map(float, relayout_data['xaxis.range']))
+    if relayout_data.get('xaxis.autorange'):
+        return None
+    raise PreventUpdate
+
+def _zoom_callback(x: np.ndarray, y: np.ndarray):
+    """Callback replacing the data trace with a downsampled window of the visible x range."""
+    def update(relayout_data):
+        x_window, y_window = downsample(x, y, x_range=_visible_range(relayout_data))
+        figure = Patch()
+        figure['data'][0]['x'] = x_window
+        figure['data'][0]['y'] = y_window
+        return figure
+    return update
+
+def _series(distances, velocity_profile, acceleration_profile, battery_profile, energy_consumption_profile,
+            solar_profile, time) -> dict:
+    """(x, y) data series of every graph, keyed by graph id."""
+    return {
+        'velocity-profile': (distances, velocity_profile),
+        'kmphvelocity-profile': (distances, velocity_profile * 3.6),
+        'acceleration-profile': (distances[1:], acceleration_profile[1:]),
+        'battery-profile': (distances, battery_profile),
+        'energy-consumption-profile': (distances[1:], energy_consumption_profile[1:]),
+        'net-energy-consumption-profile': (distances[1:], energy_consumption_profile[1:].cumsum()),
+        'solar-profile': (distances[1:], solar_profile[1:]),
+        'net-solar-profile': (distances[1:], solar_profile[1:].cumsum()),
+        'time-profile': (distances, time / 3600),
+    }
+
 # Initialize Dash app
 def create_app(distances, velocity_profile, acceleration_profile, battery_profile, energy_consumption_profile, solar_profile, time):
     app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+
+    # Full-resolution data series of every graph; the browser only gets a downsampled window
+    series = _series(distances, velocity_profile, acceleration_profile, battery_profile,
+                     energy_consumption_profile, solar_profile, time)
     
     avg_vel = distances[-1] / (time[-1] - 4.5 * 3600) if (time[-1] - 4.5 * 3600) != 0 else 0
     
@@ -78,11 +132,11 @@ def create_app(distances, velocity_profile, acceleration_profile, battery_profil
                 id='velocity-profile',
                 figure={
                     'data': [
-                        go.Scatter(x=distances, y=velocity_profile, mode='lines+markers', name='Velocity (m/s)'),
-                        go.Scatter(x=[min(distances), max(distances)], y=[config.MaxVelocity, config.MaxVelocity], mode='lines', name="Max Velocity", line=dict(color='red', dash='dot')),
-                        go.Scatter(x=[min(distances), max(distances)], y=[avg_vel, avg_vel], mode='lines', name="Avg Velocity", line=dict(color='green', dash='dot')),
+                        _series_trace(series, 'velocity-profile', 'Velocity (m/s)'),
+                        go.Scattergl(x=[distances[0], distances[-1]], y=[config.MaxVelocity, config.MaxVelocity], mode='lines', name="Max Velocity", line=dict(color='red', dash='dot')),
+                        go.Scattergl(x=[distances[0], distances[-1]], y=[avg_vel, avg_vel], mode='lines', name="Avg Velocity", line=dict(color='green', dash='dot')),
                     ],
-                    'layout': go.Layout(title='Velocity Profile (m/s)', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'm/s'})
+                    'layout': go.Layout(uirevision='zoom', title='Velocity Profile (m/s)', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'm/s'})
                 },
                 style={'width': '93%', 'display': 'inline-block', **custom_styles}
             ),
@@ -90,11 +144,11 @@ def create_app(distances, velocity_profile, acceleration_profile, battery_profil
                 id='kmphvelocity-profile',
                 figure={
                     'data': [
-                        go.Scatter(x=distances, y=velocity_profile * 3.6, mode='lines+markers', name='Velocity (km/h)'),
-                        go.Scatter(x=[min(distances), max(distances)], y=[config.MaxVelocity * 3.6, config.MaxVelocity * 3.6], mode='lines', name="Max Velocity", line=dict(color='red', dash='dot')),
-                        go.Scatter(x=[min(distances), max(distances)], y=[avg_vel * 3.6, avg_vel * 3.6], mode='lines', name="Avg Velocity", line=dict(color='green', dash='dot')),
+                        _series_trace(series, 'kmphvelocity-profile', 'Velocity (km/h)'),
+                        go.Scattergl(x=[distances[0], distances[-1]], y=[config.MaxVelocity * 3.6, config.MaxVelocity * 3.6], mode='lines', name="Max Velocity", line=dict(color='red', dash='dot')),
+                        go.Scattergl(x=[distances[0], distances[-1]], y=[avg_vel * 3.6, avg_vel * 3.6], mode='lines', name="Avg Velocity", line=dict(color='green', dash='dot')),
                     ],
-                    'layout': go.Layout(title='Velocity Profile (km/h)', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'km/h'})
+                    'layout': go.Layout(uirevision='zoom', title='Velocity Profile (km/h)', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'km/h'})
                 },
                 style={'width': '93%', 'display': 'inline-block', **custom_styles}
             ),
@@ -109,9 +163,9 @@ def create_app(distances, velocity_profile, acceleration_profile, battery_profil
                 ], style={'width': '30%', 'display': 'inline-block', 'vertical-align': 'top', **custom_styles}),
                 html.Div([
                     html.H2("Data Analysis", style={'text-align': 'center', 'font-family': '"Space Grotesk", sans-serif'}),
-                    html.P(f"Max Velocity: {round(max(velocity_profile), 3)} m/s ({round(max(velocity_profile)*3.6, 2)} km/h)"),
+                    html.P(f"Max Velocity: {round(np.max(velocity_profile), 3)} m/s ({round(np.max(velocity_profile)*3.6, 2)} km/h)"),
                     html.P(f"Avg Velocity: {round(avg_vel, 3)} m/s ({round(avg_vel*3.6, 2)} km/h)"),
-                    html.P(f"Average Battery Level: {sum(battery_profile) / len(battery_profile):.2f}%")
+                    html.P(f"Average Battery Level: {np.mean(battery_profile):.2f}%")
                 ], style={'width': '60%', 'display': 'inline-block', 'vertical-align': 'top', **custom_styles}),
             ], style={'width': '93%', 'display': 'flex', 'justify-content': 'center'}),
 
@@ -119,8 +173,8 @@ def create_app(distances, velocity_profile, acceleration_profile, battery_profil
             dcc.Graph(
                 id='acceleration-profile',
                 figure={
-                    'data': [go.Scatter(x=distances[1:], y=acceleration_profile[1:], mode='lines+markers', name='Acceleration')],
-                    'layout': go.Layout(title='Acceleration Profile', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'm/s^2'})
+                    'data': [_series_trace(series, 'acceleration-profile', 'Acceleration')],
+                    'layout': go.Layout(uirevision='zoom', title='Acceleration Profile', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'm/s^2'})
                 },
                 style={'width': '45%', 'display': 'inline-block', **custom_styles}
             ),
@@ -128,11 +182,11 @@ def create_app(distances, velocity_profile, acceleration_profile, battery_profil
                 id='battery-profile',
                 figure={
                     'data': [
-                        go.Scatter(x=distances, y=battery_profile, mode='lines+markers', name='Battery %'),
-                        go.Scatter(x=[min(distances), max(distances)], y=[100, 100], mode='lines', name="Max", line=dict(color='red', dash='dot')),
-                        go.Scatter(x=[min(distances), max(distances)], y=[config.DeepDischargeCap * 100, config.DeepDischargeCap * 100], mode='lines', name="Min", line=dict(color='orange', dash='dot')),
+                        _series_trace(series, 'battery-profile', 'Battery %'),
+                        go.Scattergl(x=[distances[0], distances[-1]], y=[100, 100], mode='lines', name="Max", line=dict(color='red', dash='dot')),
+                        go.Scattergl(x=[distances[0], distances[-1]], y=[config.DeepDischargeCap * 100, config.DeepDischargeCap * 100], mode='lines', name="Min", line=dict(color='orange', dash='dot')),
                     ],
-                    'layout': go.Layout(title='Battery Level Profile', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Charge (%)'})
+                    'layout': go.Layout(uirevision='zoom', title='Battery Level Profile', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Charge (%)'})
                 },
                 style={'width': '45%', 'display': 'inline-block', **custom_styles}
             ),
@@ -141,16 +195,16 @@ def create_app(distances, velocity_profile, acceleration_profile, battery_profil
             dcc.Graph(
                 id='energy-consumption-profile',
                 figure={
-                    'data': [go.Scatter(x=distances[1:], y=energy_consumption_profile[1:], mode='lines+markers', name='Energy (Wh)')],
-                    'layout': go.Layout(title='Segment Energy Consumption', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Wh'})
+                    'data': [_series_trace(series, 'energy-consumption-profile', 'Energy (Wh)')],
+                    'layout': go.Layout(uirevision='zoom', title='Segment Energy Consumption', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Wh'})
                 },
                 style={'width': '45%', 'display': 'inline-block', **custom_styles}
             ),
             dcc.Graph(
                 id='net-energy-consumption-profile',
                 figure={
-                    'data': [go.Scatter(x=distances[1:], y=energy_consumption_profile[1:].cumsum(), mode='lines+markers', name='Net Energy (Wh)')],
-                    'layout': go.Layout(title='Cumulative Energy Consumption', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Wh'})
+                    'data': [_series_trace(series, 'net-energy-consumption-profile', 'Net Energy (Wh)')],
+                    'layout': go.Layout(uirevision='zoom', title='Cumulative Energy Consumption', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Wh'})
                 },
                 style={'width': '45%', 'display': 'inline-block', **custom_styles}
             ),
@@ -159,16 +213,16 @@ def create_app(distances, velocity_profile, acceleration_profile, battery_profil
             dcc.Graph(
                 id='solar-profile',
                 figure={
-                    'data': [go.Scatter(x=distances[1:], y=solar_profile[1:], mode='lines+markers', name='Solar (Wh)')],
-                    'layout': go.Layout(title='Segment Solar Gain', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Wh'})
+                    'data': [_series_trace(series, 'solar-profile', 'Solar (Wh)')],
+                    'layout': go.Layout(uirevision='zoom', title='Segment Solar Gain', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Wh'})
                 },
                 style={'width': '45%', 'display': 'inline-block', **custom_styles}
             ),
             dcc.Graph(
                 id='net-solar-profile',
                 figure={
-                    'data': [go.Scatter(x=distances[1:], y=solar_profile[1:].cumsum(), mode='lines+markers', name='Net Solar (Wh)')],
-                    'layout': go.Layout(title='Cumulative Solar Gain', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Wh'})
+                    'data': [_series_trace(series, 'net-solar-profile', 'Net Solar (Wh)')],
+                    'layout': go.Layout(uirevision='zoom', title='Cumulative Solar Gain', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Wh'})
                 },
                 style={'width': '45%', 'display': 'inline-block', **custom_styles}
             ),
@@ -177,20 +231,185 @@ def create_app(distances, velocity_profile, acceleration_profile, battery_profil
             dcc.Graph(
                 id='time-profile',
                 figure={
-                    'data': [go.Scatter(x=distances, y=time / 3600, mode='lines+markers', name='Time (hrs)')],
-                    'layout': go.Layout(title='Time vs Distance', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Total Time (hrs)'})
+                    'data': [_series_trace(series, 'time-profile', 'Time (hrs)')],
+                    'layout': go.Layout(uirevision='zoom', title='Time vs Distance', xaxis={'title': 'Distance (m)'}, yaxis={'title': 'Total Time (hrs)'})
                 },
                 style={'width': '93%', 'display': 'inline-block', **custom_styles}
             ),
         ], style={'display': 'flex', 'flex-wrap': 'wrap', 'justify-content': 'center'})
     ], style={'background-color': '#ffffff', 'padding': '20px'})
-    
+
+    for graph_id, (x, y) in series.items():
+        app.callback(
+            Output(graph_id, 'figure'), Input(graph_id, 'relayoutData'), prevent_initial_call=True
+        )(_zoom_callback(x, y))
+
+    return app
+
+# Graphs of the live view: (id, title, y axis title, trace name, width)
+LIVE_GRAPHS = [
+    ('velocity-profile', 'Velocity Profile (m/s)', 'm/s', 'Velocity (m/s)', '93%'),
+    ('kmphvelocity-profile', 'Velocity Profile (km/h)', 'km/h', 'Velocity (km/h)', '93%'),
+    ('acceleration-profile', 'Acceleration Profile', 'm/s^2', 'Acceleration', '45%'),
+    ('battery-profile', 'Battery Level Profile', 'Charge (%)', 'Battery %', '45%'),
+    ('energy-consumption-profile', 'Segment Energy Consumption', 'Wh', 'Energy (Wh)', '45%'),
+    ('net-energy-consumption-profile', 'Cumulative Energy Consumption', 'Wh', 'Net Energy (Wh)', '45%'),
+    ('solar-profile', 'Segment Solar Gain', 'Wh', 'Solar (Wh)', '45%'),
+    ('net-solar-profile', 'Cumulative Solar Gain', 'Wh', 'Net Solar (Wh)', '45%'),
+    ('time-profile', 'Time vs Distance', 'Total Time (hrs)', 'Time (hrs)', '93%'),
+]
+
+class StreamFollower:
+    """Server-side view of a run stream: the latest solution of every segment so far.
+
+    Browsers only keep how much of it they have drawn (`run_id`, `revision`, `rows`).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.run_id = None
+        self.n_segments = 0
+        self.segments: dict[int, dict] = {}
+        self.revision = 0  # bumped when an already drawn segment may have changed
+        self.total_time = None  # s, once the run finished
+        self.last_iteration = None
+        self._lock = threading.Lock()
+
+    def poll(self) -> None:
+        """Applies the events appended since the last poll."""
+        with self._lock:
+            events, offset = run_stream.read_events(self.path, self.offset)
+            if offset < self.offset:
+                # The file was truncated by a new run; its "start" event resets everything
+                self.revision += 1
+            self.offset = offset
+            for event in events:
+                kind = event.get('event')
+                if kind == 'start':
+                    self.run_id, self.n_segments = event['run_id'], event['segments']
+                    self.segments, self.total_time, self.last_iteration = {}, None, None
+                    self.revision += 1
+                elif kind == 'segment':
+                    if event['segment'] in self.segments:
+                        self.revision += 1  # re-solved segment, e.g. a later pass of main_parallel
+                    self.segments[event['segment']] = event['columns']
+                elif kind == 'finish':
+                    self.total_time = event['total_time']
+                elif kind == 'iteration':
+                    self.last_iteration = event
+
+    def contiguous(self) -> list[dict]:
+        """Columns of the solved segments from the start of the route up to the first gap."""
+        with self._lock:
+            columns = []
+            while len(columns) in self.segments:
+                columns.append(self.segments[len(columns)])
+            return columns
+
+    def status(self, n_drawn: int) -> str:
+        if self.run_id is None:
+            return f"Waiting for a run ({self.path})"
+        text = f"Run {self.run_id}: {len(self.segments)}/{self.n_segments} segments solved, {n_drawn} drawn"
+        if self.total_time is not None:
+            text += f", finished: {self.total_time / 3600:.4f} hrs"
+        elif self.last_iteration is not None:
+            text += (f", segment {self.last_iteration.get('segment')} iteration {self.last_iteration['iteration']}"
+                     f" (objective {self.last_iteration['objective'] / 3600:.4f} hrs)")
+        return text
+
+def _stream_series(columns: list[dict]) -> tuple[dict, int]:
+    """Graph series of consecutive segments, as `create_app` computes them from `run_dat.csv`.
+
+    Returns:
+        tuple: (series, number of output rows)
+    """
+    data = {
+        name: np.nan_to_num(np.concatenate([np.asarray(segment[name], dtype=float) for segment in columns]))
+        for name in ['CumulativeDistance', 'Velocity', 'Acceleration', 'Battery', 'EnergyConsumption', 'Solar', 'Time']
+    }
+    series = _series(data['CumulativeDistance'].cumsum(), data['Velocity'], data['Acceleration'], data['Battery'],
+                     data['EnergyConsumption'], data['Solar'], data['Time'])
+    return series, len(data['Velocity'])
+
+def _live_figure(graph_id: str, title: str, y_title: str, name: str, x=(), y=()) -> dict:
+    return {
+        'data': [go.Scattergl(x=x, y=y, mode='lines+markers', name=name)],
+        'layout': go.Layout(uirevision='zoom', title=title, xaxis={'title': 'Distance (m)'}, yaxis={'title': y_title}),
+    }
+
+def create_live_app(stream_path: str | None = None):
+    """Dashboard following a race while it is solved, fed by the run stream (`RunStreamFile`).
+
+    Every `DashboardRefreshInterval` the browser polls for new segments: segments continuing
+    the drawn part of the route are appended to the traces (`extendData`, downsampled per
+    chunk), while a new run or a re-solved segment redraws the figures.
+    """
+    follower = StreamFollower(stream_path or config.RunStreamFile)
+    app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+    graph_ids = [graph[0] for graph in LIVE_GRAPHS]
+
+    app.layout = html.Div([
+        html.H1("Live Strategy Dashboard", style={'text-align': 'center', 'font-family': '"Roboto Slab", serif'}),
+        html.P(id='stream-status', style={'text-align': 'center', **custom_styles}),
+        html.Div([
+            dcc.Graph(id=graph_id, figure=_live_figure(graph_id, title, y_title, name),
+                      style={'width': width, 'display': 'inline-block', **custom_styles})
+            for graph_id, title, y_title, name, width in LIVE_GRAPHS
+        ], style={'display': 'flex', 'flex-wrap': 'wrap', 'justify-content': 'center'}),
+        dcc.Interval(id='stream-interval', interval=config.DashboardRefreshInterval),
+        # What this browser has drawn so far
+        dcc.Store(id='stream-drawn', data={'run_id': None, 'revision': -1, 'rows': 0, 'segments': 0}),
+    ], style={'background-color': '#ffffff', 'padding': '20px'})
+
+    @app.callback(
+        [Output(graph_id, 'extendData') for graph_id in graph_ids]
+        + [Output(graph_id, 'figure') for graph_id in graph_ids]
+        + [Output('stream-drawn', 'data'), Output('stream-status', 'children')],
+        Input('stream-interval', 'n_intervals'),
+        State('stream-drawn', 'data'),
+    )
+    def update(_, drawn):
+        follower.poll()
+        columns = follower.contiguous()
+        redraw = drawn['run_id'] != follower.run_id or drawn['revision'] != follower.revision
+        no_extend = [dash.no_update] * len(graph_ids)
+        no_figures = [dash.no_update] * len(graph_ids)
+        status = follower.status(len(columns))
+
+        if not redraw and len(columns) == drawn['segments']:
+            return no_extend + no_figures + [dash.no_update, status]
+
+        state = {'run_id': follower.run_id, 'revision': follower.revision, 'rows': 0, 'segments': len(columns)}
+        if not columns:
+            figures = [_live_figure(*graph[:4]) for graph in LIVE_GRAPHS]
+            return no_extend + figures + [state, status]
+
+        series, state['rows'] = _stream_series(columns)
+        if redraw:
+            figures = [_live_figure(*graph[:4], *downsample(*series[graph[0]])) for graph in LIVE_GRAPHS]
+            return no_extend + figures + [state, status]
+
+        # Only the rows after the drawn ones; series that skip the first row are one shorter
+        extend = []
+        for graph_id in graph_ids:
+            x, y = series[graph_id]
+            start = max(drawn['rows'] - (state['rows'] - len(x)), 0)
+            x_new, y_new = downsample(x[start:], y[start:])
+            extend.append(({'x': [x_new], 'y': [y_new]}, [0]))
+        return extend + no_figures + [state, status]
+
     return app
 
 if __name__ == '__main__':
-    # Load and clean simulation data
+    if '--live' in sys.argv[1:]:
+        # Follow the race being solved (python dashboard.py --live)
+        create_live_app().run(debug=True)
+        sys.exit()
+
+    # Load and clean simulation data: python dashboard.py [run store directory or csv]
+    # (default: the run store if present, else run_dat.csv)
     try:
-        output_df = pd.read_csv("run_dat.csv").fillna(0)
+        output_df = load_output(sys.argv[1] if len(sys.argv) > 1 else None).fillna(0)
         # Handle cases where column names might differ (e.g., lowercase/uppercase)
         cols = {c.lower(): c for c in output_df.columns}
         
@@ -209,4 +428,4 @@ if __name__ == '__main__':
         dashboard_app.run(debug=True)
     except Exception as e:
         print(f"Error loading dashboard data: {e}")
-        print("Ensure 'run_dat.csv' exists and has correct columns.")
+        print(f"Ensure '{config.RunStoreDir}' or 'run_dat.csv' exists and has correct columns.")
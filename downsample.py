@@ -0,0 +1,79 @@
+import numpy as np
+
+import race_config as config
+
+def minmax_indices(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """Indices of the first, last, minimum and maximum point of every bucket (in order).
+
+    Keeps every spike visible at up to 4 points per bucket; fully vectorized, so it is
+    the cheaper choice for very long series.
+    """
+    n = len(y)
+    if n <= 4 * n_buckets:
+        return np.arange(n)
+    size = -(-n // n_buckets)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+
+    # Buckets are rows of the padded array; the NaN padding never wins
+    starts = np.arange(n_buckets) * size
+    low = np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1) + starts
+    high = np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1) + starts
+    indices = np.unique(np.concatenate([[0, n - 1], starts, low, high]))
+    return indices[indices < n]
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets selection of `n_out` points (Steinarsson, 2013).
+
+    Every bucket keeps the point forming the largest triangle with the point kept before
+    it and the mean of the next bucket, which preserves the visual shape of the line.
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    # Bucket boundaries of the n - 2 inner points, and the mean of every bucket from prefix sums
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(int) + 1
+    edges[-1] = n - 1
+    x_sum = np.concatenate([[0.0], np.cumsum(x)])
+    y_sum = np.concatenate([[0.0], np.cumsum(y)])
+    next_start, next_stop = edges[1:], np.append(edges[2:], n)
+    mean_x = (x_sum[next_stop] - x_sum[next_start]) / (next_stop - next_start)
+    mean_y = (y_sum[next_stop] - y_sum[next_start]) / (next_stop - next_start)
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        area = np.abs((x[a] - mean_x[i]) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (mean_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def downsample(x: np.ndarray, y: np.ndarray, max_points: int | None = None,
+               x_range: tuple[float, float] | None = None,
+               method: str | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """At most about `max_points` points of a series sorted by x, within `x_range` if given.
+
+    One point either side of the range is kept, so lines run to the plot edges.
+
+    Args:
+        max_points: Output size (default `DashboardMaxPoints`).
+        x_range: Visible (x_min, x_max); None for the whole series.
+        method: "lttb" or "minmax" (default `DashboardDownsampleMethod`).
+    """
+    max_points = max_points or config.DashboardMaxPoints
+    method = method or config.DashboardDownsampleMethod
+    start, stop = 0, len(x)
+    if x_range is not None:
+        start = max(int(np.searchsorted(x, x_range[0], side="left")) - 1, 0)
+        stop = min(int(np.searchsorted(x, x_range[1], side="right")) + 1, len(x))
+    x, y = x[start:stop], y[start:stop]
+
+    if method == "minmax":
+        indices = minmax_indices(y, max(max_points // 4, 1))
+    else:
+        indices = lttb_indices(x, y, max_points)
+    return x[indices], y[indices]
@@ -0,0 +1,173 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import race_config as config
+from car import calculate_power
+from constraints import SafeBatteryLevel, MaxPower
+from joint_model import JointRoute, joint_objective, load_joint_route, race_state
+
+# W above MaxPower tolerated before a node counts as a violation (the plan sits on the limit)
+_POWER_TOLERANCE = 1.0
+
+@dataclass(frozen=True)
+class Scenarios:
+    """Weather perturbations of an ensemble, one entry per scenario.
+
+    Built by `sample_scenarios`, or directly from forecast members (e.g. the ratio of a
+    member's wind/irradiance to the values the plan was made with).
+    """
+    wind_scale: np.ndarray  # multiplier on the route wind speed
+    wind_offset: np.ndarray  # deg added to the route wind direction
+    irradiance_scale: np.ndarray  # multiplier on the solar irradiance, while racing and at stops
+
+    def __len__(self) -> int:
+        return len(self.wind_scale)
+
+    def chunk(self, start: int, stop: int) -> "Scenarios":
+        return Scenarios(self.wind_scale[start:stop], self.wind_offset[start:stop], self.irradiance_scale[start:stop])
+
+@dataclass(frozen=True)
+class EnsembleResult:
+    """Outcome of a fixed velocity plan over every scenario.
+
+    The finish time is a single number: the plan fixes the speed at every node, so the
+    weather only changes the energy the plan needs, not the time it takes.
+    """
+    finish_time: float  # s, including stops
+    min_battery_margin: np.ndarray  # Wh above SafeBatteryLevel at the lowest point of the race
+    final_battery: np.ndarray  # Wh at the finish line
+    battery_violation: np.ndarray  # battery below SafeBatteryLevel somewhere
+    power_violation: np.ndarray  # motor power above MaxPower somewhere
+
+    def summary(self) -> dict:
+        """Percentiles of the margins and violation rates."""
+        percentiles = (5, 50, 95)
+        return {
+            "scenarios": len(self.final_battery),
+            "finish_time_hrs": self.finish_time / 3600,
+            **{f"min_battery_margin_p{p}": float(v) for p, v in zip(percentiles, np.percentile(self.min_battery_margin, percentiles))},
+            **{f"final_battery_p{p}": float(v) for p, v in zip(percentiles, np.percentile(self.final_battery, percentiles))},
+            "battery_violation_rate": float(self.battery_violation.mean()),
+            "power_violation_rate": float(self.power_violation.mean()),
+        }
+
+def sample_scenarios(n: int, seed: int | None = None) -> Scenarios:
+    """Independent normal perturbations with the `Ensemble*Std` spreads from race_config."""
+    rng = np.random.default_rng(seed)
+    return Scenarios(
+        wind_scale=np.clip(rng.normal(1, config.EnsembleWindSpeedStd, n), 0, None),
+        wind_offset=rng.normal(0, config.EnsembleWindDirStd, n),
+        irradiance_scale=np.clip(rng.normal(1, config.EnsembleIrradianceStd, n), 0, None),
+    )
+
+def load_plan(path: str = "run_dat.csv", route: JointRoute | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Whole-race velocity profile and planned start-of-stage battery from an output file.
+
+    Consecutive segments share their (stationary) waypoint node, which is stored once in
+    the returned profile.
+
+    Returns:
+        tuple: (velocity profile, battery energy in Wh at the start of every stage)
+    """
+    if route is None:
+        route = load_joint_route()
+    plan_df = pd.read_csv(path)
+    velocity = plan_df['Velocity'].to_numpy()
+    stage_points = np.diff(np.concatenate([[-1], route.stage_end_rows])) + 1
+    if len(velocity) != stage_points.sum():
+        raise ValueError(f"{path} has {len(velocity)} rows, the route needs {stage_points.sum()}")
+
+    first_rows = np.concatenate([[0], np.cumsum(stage_points)[:-1]])
+    stage_start_energy = plan_df['Battery'].to_numpy()[first_rows] * config.BatteryCapacity / 100
+    return np.delete(velocity, first_rows[1:]), stage_start_energy
+
+def _evaluate_chunk(v_prof: np.ndarray, route: JointRoute, scenarios: Scenarios,
+                    stage_start_energy: np.ndarray | None = None) -> tuple[np.ndarray, ...]:
+    """Battery and power of the plan over a chunk of scenarios, vectorized along a (K,) axis.
+
+    Without `stage_start_energy` the battery is carried through the whole race. With it,
+    every stage starts from its planned energy (as in `fullmodelrunner`, which plans each
+    segment from its BatteryLevelWayPoints level) corrected by the scenario's change in
+    the preceding stop's charge. Either way the battery is capped at BatteryCapacity.
+
+    Returns:
+        tuple: (min_battery_margin, final_battery, battery_violation, power_violation), each (K,)
+    """
+    # Time, speed and the clear-sky solar/stop energy only depend on the plan
+    s = race_state(v_prof, route)
+    avg_speed = (v_prof[:-1] + v_prof[1:]) / 2
+
+    net_power, _ = calculate_power(
+        avg_speed, s["acceleration"], route.slopes,
+        route.wind_speed * scenarios.wind_scale[:, None],
+        route.wind_dir + scenarios.wind_offset[:, None],
+    )
+    irradiance = scenarios.irradiance_scale[:, None]
+    energy = (net_power - s["solar_power"] * irradiance) * s["dt"] / 3600
+
+    battery_start = np.full(len(scenarios), route.initial_energy)
+    min_battery = battery_start.copy()
+    for stage_no, end_row in enumerate(route.stage_end_rows):
+        rows = route.stage == stage_no
+        battery = battery_start[:, None] - energy[:, rows].cumsum(axis=1)
+        min_battery = np.minimum(min_battery, battery.min(axis=1))
+        if stage_no == len(s["stop_gain"]):
+            battery_start = battery[:, -1]
+        elif stage_start_energy is None:
+            battery_start = np.minimum(config.BatteryCapacity, battery[:, -1] + s["stop_gain"][stage_no] * irradiance[:, 0])
+        else:
+            battery_start = np.minimum(config.BatteryCapacity, stage_start_energy[stage_no + 1]
+                                       + s["stop_gain"][stage_no] * (irradiance[:, 0] - 1))
+
+    return (
+        min_battery - SafeBatteryLevel,
+        battery_start,
+        min_battery < SafeBatteryLevel,
+        (net_power > MaxPower + _POWER_TOLERANCE).any(axis=1),
+    )
+
+def run_ensemble(v_prof: np.ndarray, scenarios: Scenarios, route: JointRoute | None = None,
+                 stage_start_energy: np.ndarray | None = None, chunk_size: int | None = None,
+                 max_workers: int | None = 1) -> EnsembleResult:
+    """Evaluates a whole-race velocity plan over every weather scenario.
+
+    Scenarios are evaluated `chunk_size` at a time (bounding memory to chunk_size x route
+    rows per array); with `max_workers` other than 1 the chunks are spread over a process pool.
+    See `_evaluate_chunk` for how `stage_start_energy` changes the battery bookkeeping.
+    """
+    if route is None:
+        route = load_joint_route()
+    chunk_size = chunk_size or config.EnsembleChunkSize
+    chunks = [scenarios.chunk(i, i + chunk_size) for i in range(0, len(scenarios), chunk_size)]
+
+    if max_workers == 1 or len(chunks) == 1:
+        parts = [_evaluate_chunk(v_prof, route, chunk, stage_start_energy) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            n = len(chunks)
+            parts = list(pool.map(_evaluate_chunk, [v_prof] * n, [route] * n, chunks, [stage_start_energy] * n))
+
+    finish_time = joint_objective(v_prof, route)
+    return EnsembleResult(finish_time, *(np.concatenate(arrays) for arrays in zip(*parts)))
+
+def main() -> EnsembleResult:
+    """Runs the configured ensemble over the plan in `run_dat.csv` and prints the risk summary."""
+    route = load_joint_route()
+    v_prof, stage_start_energy = load_plan("run_dat.csv", route)
+    scenarios = sample_scenarios(config.EnsembleScenarios, config.EnsembleSeed)
+
+    print(f"--- Evaluating plan over {len(scenarios)} weather scenarios ---")
+    start = time.perf_counter()
+    result = run_ensemble(v_prof, scenarios, route, stage_start_energy, max_workers=config.EnsembleWorkers)
+    print(f"done in {time.perf_counter() - start:.1f} s")
+
+    for name, value in result.summary().items():
+        print(f"{name}: {value:.4f}" if isinstance(value, float) else f"{name}: {value}")
+    return result
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+import race_config as config
+from context import SegmentContext
+from car import CarParams, calculate_dt, calculate_power
+from forecast_index import load_forecast_index
+from solar import calculate_incident_solarpower
+import instrumentation
+
+# Number of distinct velocity profiles kept (the solver revisits only the last few)
+_CACHE_SIZE = 8
+
+# Settings read by `_evaluate`; an evaluation is only reused under the same values
+_KEY_SETTINGS = ("ThermalSolver", "SolarModel", "UseForecastWind")
+
+# One cache per thread, so concurrent solves do not evict each other's entries; clear_cache
+# bumps the generation, which drops every thread's cache on its next use
+_local = threading.local()
+_generation = 0
+
+@dataclass
+class SegmentEvaluation:
+    """Car and solar model evaluated once for a velocity profile over a route segment.
+
+    All arrays have one entry per route segment (trimmed to the shortest input), with a
+    leading (K,) axis for batched evaluations (`evaluate_batch`).
+    """
+    v_start: np.ndarray
+    v_stop: np.ndarray
+    route: tuple[np.ndarray, ...]  # (segments, slopes, lats, longs, wind_speed, wind_dir)
+    avg_speed: np.ndarray
+    dt: np.ndarray
+    acceleration: np.ndarray
+    net_power: np.ndarray
+    solar_power: np.ndarray
+    energy_consumption: np.ndarray  # cumulative net energy drawn from the battery (Wh)
+    jacobian: tuple | None = None  # filled in by constraints._energy_jacobian
+    wind_rates: tuple | None = None  # (d_wind_speed/dt, d_wind_dir/dt) at arrival, with UseForecastWind
+
+def clear_cache() -> None:
+    """Drops all cached evaluations (of every thread)."""
+    global _generation
+    _generation += 1
+
+def _thread_cache() -> OrderedDict:
+    """The evaluation cache of the calling thread."""
+    if getattr(_local, "generation", None) != _generation:
+        _local.cache, _local.generation = OrderedDict(), _generation
+    return _local.cache
+
+def _cache_key(v_prof: np.ndarray, ctx: SegmentContext) -> tuple:
+    """Content hash of the velocity profile, the identity of the segment context and the model settings.
+
+    Each cache entry holds a reference to its context, so its id cannot be reused by
+    another context while the entry is alive.
+    """
+    digest = hashlib.blake2b(v_prof.tobytes(), digest_size=16).digest()
+    return digest, id(ctx), tuple(getattr(config, name) for name in _KEY_SETTINGS)
+
+@instrumentation.timed("evaluate")
+def _evaluate(v_prof: np.ndarray, ctx: SegmentContext, car: CarParams | None = None) -> SegmentEvaluation:
+    """Evaluates velocity profile(s) of shape (..., n_points) without caching."""
+    route_arrays = ctx.route_arrays
+    min_len = min(v_prof.shape[-1] - 1, *(len(a) for a in route_arrays))
+    v_start, v_stop = v_prof[..., :min_len], v_prof[..., 1:min_len + 1]
+    segments, slopes, lats, longs, ws, wd = (a[:min_len] for a in route_arrays)
+
+    avg_speed = (v_start + v_stop) / 2
+    dt = calculate_dt(v_start, v_stop, segments)
+    acceleration = (v_stop - v_start) / dt
+    global_time = dt.cumsum(axis=-1) + ctx.time_offset
+
+    # Forecast wind where the car actually is at that time, instead of the route's static columns
+    wind_rates = None
+    if config.UseForecastWind:
+        index = load_forecast_index()
+        ws, ws_rate = index.sample("wind_speed", global_time, lats, longs)
+        wd, wd_rate = index.sample("wind_angle", global_time, lats, longs)
+        wind_rates = (ws_rate, wd_rate)
+
+    net_power, _ = calculate_power(avg_speed, acceleration, slopes, ws, wd, car)
+    solar_power = calculate_incident_solarpower(global_time, lats, longs, car)
+
+    return SegmentEvaluation(
+        v_start=v_start,
+        v_stop=v_stop,
+        route=(segments, slopes, lats, longs, ws, wd),
+        avg_speed=avg_speed,
+        dt=dt,
+        acceleration=acceleration,
+        net_power=net_power,
+        solar_power=solar_power,
+        energy_consumption=((net_power - solar_power) * dt).cumsum(axis=-1) / 3600,
+        wind_rates=wind_rates,
+    )
+
+def evaluate_batch(v_prof: np.ndarray, ctx: SegmentContext, car: CarParams) -> SegmentEvaluation:
+    """Evaluates K car variants (and optionally K velocity profiles) in one vectorized pass.
+
+    Args:
+        v_prof: Velocity profile of shape (n_points,) shared by all variants, or (K, n_points).
+        ctx: Segment context.
+        car: Batched car parameters (`CarParams.sweep`).
+
+    Returns:
+        SegmentEvaluation whose power/energy arrays have shape (K, n_segments) (the
+        kinematic ones only when v_prof is batched too). Not cached.
+    """
+    return _evaluate(np.asarray(v_prof, dtype=float), ctx, car)
+
+def evaluate(v_prof: np.ndarray, ctx: SegmentContext) -> SegmentEvaluation:
+    """Returns the (cached) evaluation of a velocity profile over a segment."""
+    v_prof = np.array(v_prof, dtype=float)  # copy: solvers may reuse their x buffer
+    key = _cache_key(v_prof, ctx)
+    cache = _thread_cache()
+
+    entry = cache.get(key)
+    if entry is not None and entry[0] is ctx:
+        cache.move_to_end(key)
+        instrumentation.count("cache_hits")
+        return entry[1]
+    instrumentation.count("evaluations")
+
+    evaluation = _evaluate(v_prof, ctx)
+
+    cache[key] = (ctx, evaluation)
+    if len(cache) > _CACHE_SIZE:
+        cache.popitem(last=False)
+    return evaluation
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import race_config as config
+from forecast_ingest import RouteForecast
+from route_store import load_route
+
+DT = config.RaceEndTime - config.RaceStartTime
+
+# Query positions resolved to forecast points, for the last few segments seen
+_ROWS_CACHE_SIZE = 32
+
+def local_epoch(day: np.ndarray, time_of_day: np.ndarray, origin: float = 0.0) -> np.ndarray:
+    """Wall-clock time (s since the epoch, UTC) of a local time of day on race day `day` (0: `RaceDate`), minus `origin`.
+
+    Subtracting a nearby `origin` first keeps the sub-second resolution the time derivatives need.
+    """
+    day0 = datetime.fromisoformat(config.RaceDate).replace(tzinfo=timezone.utc).timestamp() - config.RaceUtcOffset
+    return (day0 - origin) + day * 86400 + time_of_day
+
+def race_epoch(globaltime: np.ndarray, origin: float = 0.0) -> np.ndarray:
+    """Wall-clock time (s since the epoch, UTC) of race times as used by the solver, minus `origin`.
+
+    Race time only runs while racing: every `DT` seconds of it is one race day starting at
+    `RaceStartTime` local time on `RaceDate` (+ day number).
+    """
+    return local_epoch(globaltime // DT, config.RaceStartTime + globaltime % DT, origin)
+
+def _heading(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    """Compass bearing (deg) of the route at every point, from the previous point."""
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    lat0, lon0 = np.concatenate([lat[:1], lat[:-1]]), np.concatenate([lon[:1], lon[:-1]])
+    lat0[0], lon0[0] = 2 * lat[0] - lat[1], 2 * lon[0] - lon[1]
+    y = np.sin(lon - lon0) * np.cos(lat)
+    x = np.cos(lat0) * np.sin(lat) - np.sin(lat0) * np.cos(lat) * np.cos(lon - lon0)
+    return np.degrees(np.arctan2(y, x))
+
+def relative_wind_angle(wind_from: np.ndarray, heading: np.ndarray) -> np.ndarray:
+    """Meteorological wind direction (where it blows from) as the route's wind angle.
+
+    The car model takes the angle between the wind's and the car's direction of travel,
+    so 0 is a pure tailwind and 180 a pure headwind.
+    """
+    return wind_from + 180 - heading
+
+@dataclass(frozen=True, eq=False)
+class ForecastIndex:
+    """Forecast GHI and wind over (route point x time), queried at solver race times.
+
+    Values are linear in time between forecast periods (held constant outside), so
+    `sample` also returns exact time derivatives for the analytic Jacobians.
+    """
+    latitude: np.ndarray  # (P,)
+    longitude: np.ndarray  # (P,)
+    times: np.ndarray  # (T,) s since the epoch, UTC
+    ghi: np.ndarray  # W/m^2, (P, T)
+    wind_speed: np.ndarray  # m/s, (P, T)
+    wind_angle: np.ndarray  # deg relative to the direction of travel, unwrapped along time, (P, T)
+    _rows: OrderedDict = field(default_factory=OrderedDict, repr=False)
+    _rows_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @classmethod
+    def from_route_forecast(cls, forecast: RouteForecast, latitude: np.ndarray,
+                            longitude: np.ndarray) -> "ForecastIndex":
+        """Index over an ingested forecast whose rows are the given route points."""
+        wind_angle = relative_wind_angle(forecast.wind_dir, _heading(latitude, longitude)[:, None])
+        return cls(
+            np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float), forecast.times,
+            forecast.ghi, forecast.wind_speed, np.unwrap(wind_angle, period=360, axis=1),
+        )
+
+    @classmethod
+    def from_route_csv(cls, path: str = "updated_route_data.csv") -> "ForecastIndex":
+        """Time-independent index from the GHI/WIND_SPEED/WIND_DIRECTION columns of a route file.
+
+        Rows without values are filled by linear interpolation between the rows that have them.
+        """
+        df = pd.read_csv(path)
+        latitude, longitude = df.iloc[:, 3].to_numpy(dtype=float), df.iloc[:, 4].to_numpy(dtype=float)
+        rows = np.arange(len(df))
+
+        columns = []
+        for name in ("GHI", "WIND_SPEED", "WIND_DIRECTION"):
+            values = df[name].to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+            if not valid.any():
+                raise ValueError(f"{path} has no {name} values")
+            columns.append(np.interp(rows, rows[valid], values[valid])[:, None])
+
+        ghi, wind_speed, wind_dir = columns
+        return cls(latitude, longitude, np.zeros(1), ghi, wind_speed,
+                   relative_wind_angle(wind_dir, _heading(latitude, longitude)[:, None]))
+
+    def _points(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        """Index of the nearest forecast point to every query position (cached per query array)."""
+        key = hashlib.blake2b(np.ascontiguousarray(latitude).tobytes() + np.ascontiguousarray(longitude).tobytes(),
+                              digest_size=16).digest()
+        with self._rows_lock:
+            points = self._rows.get(key)
+            if points is not None:
+                self._rows.move_to_end(key)
+                return points
+
+        distance2 = (np.subtract.outer(latitude, self.latitude) ** 2
+                     + (np.subtract.outer(longitude, self.longitude) * np.cos(np.radians(latitude))[:, None]) ** 2)
+        points = np.argmin(distance2, axis=1)
+        with self._rows_lock:
+            self._rows[key] = points
+            if len(self._rows) > _ROWS_CACHE_SIZE:
+                self._rows.popitem(last=False)
+        return points
+
+    def sample(self, name: str, globaltime: np.ndarray, latitude: np.ndarray,
+               longitude: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Value of forecast field `name` ("ghi", "wind_speed" or "wind_angle") at race times and positions.
+
+        Returns:
+            tuple: (values, d_values/d_globaltime)
+        """
+        return self._interpolate(name, race_epoch(globaltime, self.times[0]), latitude, longitude)
+
+    def sample_at(self, name: str, day: np.ndarray, time_of_day: np.ndarray, latitude: np.ndarray,
+                  longitude: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """As `sample`, at local times of day (s after midnight) on race days `day`, also outside racing hours."""
+        return self._interpolate(name, local_epoch(day, time_of_day, self.times[0]), latitude, longitude)
+
+    def _interpolate(self, name: str, elapsed: np.ndarray, latitude: np.ndarray,
+                     longitude: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Field `name` at wall-clock times `elapsed` (s after the first forecast period), with its time derivative."""
+        values = getattr(self, name)
+        points = self._points(latitude, longitude)
+        if len(self.times) == 1:
+            value = np.broadcast_to(values[points, 0], np.shape(elapsed))
+            return value, np.zeros(np.shape(elapsed))
+
+        times = self.times - self.times[0]
+        i = np.clip(np.searchsorted(times, elapsed, side="right") - 1, 0, len(times) - 2)
+        span = times[i + 1] - times[i]
+        inside = (elapsed >= 0) & (elapsed <= times[-1])
+        weight = np.clip((elapsed - times[i]) / span, 0, 1)
+
+        start, stop = values[points, i], values[points, i + 1]
+        return start + weight * (stop - start), np.where(inside, (stop - start) / span, 0.0)
+
+_index: ForecastIndex | None = None
+_index_version: tuple | None = None  # (path, modification time) the index was built from
+_index_lock = threading.Lock()
+
+def clear_forecast_index() -> None:
+    """Drops the loaded index, so the next `load_forecast_index` reads `ForecastIndexSource` again."""
+    global _index, _index_version
+    with _index_lock:
+        _index, _index_version = None, None
+
+def load_forecast_index() -> ForecastIndex:
+    """The process-wide index over `ForecastIndexSource` (an ingested .npz or a route .csv).
+
+    The index is rebuilt when the setting or the file changes, e.g. after `forecast_ingest.py`
+    wrote a new forecast.
+    """
+    global _index, _index_version
+    path = config.ForecastIndexSource
+    try:
+        version = (path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"forecast index source {path} (ForecastIndexSource) does not exist: "
+            f"run the forecast ingestion first (python forecast_ingest.py writes {config.ForecastFile} "
+            f"and updated_route_data.csv)"
+        ) from None
+
+    with _index_lock:
+        if _index is None or _index_version != version:
+            if os.path.splitext(path)[1] == ".npz":
+                route = load_route()
+                _index = ForecastIndex.from_route_forecast(
+                    RouteForecast.load(path), route["latitude"], route["longitude"]
+                )
+            else:
+                _index = ForecastIndex.from_route_csv(path)
+            _index_version = version
+        return _index
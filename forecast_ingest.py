@@ -0,0 +1,154 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import race_config as config
+from route_store import load_route
+
+# Forecast fields requested per cell, in the order they are stored
+FORECAST_FIELDS = ("ghi", "wind_speed_100m", "wind_direction_100m")
+
+@dataclass(frozen=True)
+class RouteForecast:
+    """Forecast time series of every route row (rows sharing a grid cell share a series)."""
+    times: np.ndarray  # s since the epoch (UTC), end of every forecast period
+    ghi: np.ndarray  # W/m^2, (route rows, times)
+    wind_speed: np.ndarray  # m/s, (route rows, times)
+    wind_dir: np.ndarray  # deg, (route rows, times)
+    issue_time: int  # s since the epoch, forecast issue the data belongs to
+
+    def save(self, path: str) -> None:
+        np.savez(path, times=self.times, ghi=self.ghi, wind_speed=self.wind_speed,
+                 wind_dir=self.wind_dir, issue_time=self.issue_time)
+
+    @classmethod
+    def load(cls, path: str) -> "RouteForecast":
+        with np.load(path) as data:
+            return cls(data["times"], data["ghi"], data["wind_speed"], data["wind_dir"], int(data["issue_time"]))
+
+def grid_cells(latitude: np.ndarray, longitude: np.ndarray,
+               resolution: float) -> tuple[np.ndarray, np.ndarray]:
+    """Snaps route points to a lat/long grid.
+
+    Returns:
+        tuple: (unique cell centres (M, 2) as lat/long, cell index of every route point)
+    """
+    index = np.round(np.column_stack([latitude, longitude]) / resolution).astype(int)
+    cells, inverse = np.unique(index, axis=0, return_inverse=True)
+    return cells * resolution, inverse.ravel()
+
+def current_issue_time(now: float | None = None) -> int:
+    """Issue time of the latest forecast: `now` floored to `ForecastIssueInterval`."""
+    now = time.time() if now is None else now
+    return int(now // config.ForecastIssueInterval * config.ForecastIssueInterval)
+
+def _cache_path(cell: np.ndarray, issue_time: int) -> str:
+    return os.path.join(config.ForecastCacheDir, str(issue_time), f"{cell[0]:.4f}_{cell[1]:.4f}.csv")
+
+def _make_session(pool_size: int) -> requests.Session:
+    """Session whose connection pool matches the number of worker threads, with retries on throttling."""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _fetch_cell(session: requests.Session, cell: np.ndarray, issue_time: int) -> pd.DataFrame | None:
+    """Forecast of one grid cell from the on-disk cache, downloading it if it is not there yet.
+
+    Returns None (and prints the error) if the download fails; nothing is cached then.
+    """
+    path = _cache_path(cell, issue_time)
+    if os.path.exists(path):
+        return pd.read_csv(path)
+
+    params = {
+        "latitude": cell[0],
+        "longitude": cell[1],
+        "hours": config.ForecastHours,
+        "output_parameters": ",".join(FORECAST_FIELDS),
+        "period": config.ForecastPeriod,
+        "format": "csv",
+    }
+    api_key = os.environ.get(config.ForecastApiKeyEnv)
+    if api_key:
+        params["api_key"] = api_key
+
+    try:
+        response = session.get(config.ForecastApiUrl, params=params, timeout=config.ForecastTimeout)
+        response.raise_for_status()
+        df = pd.read_csv(StringIO(response.text))
+    except (requests.RequestException, pd.errors.ParserError) as e:
+        print(f"Error downloading forecast for cell {cell[0]:.4f}, {cell[1]:.4f}: {e}")
+        return None
+
+    # Write then rename, so an interrupted refresh never leaves a partial cache entry
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return df
+
+def ingest(latitude: np.ndarray | None = None, longitude: np.ndarray | None = None,
+           issue_time: int | None = None) -> RouteForecast:
+    """Fetches the forecast for every route row (default: the whole `processed_route_data.csv`).
+
+    Route points are deduplicated into `ForecastGridResolution` cells, which are fetched
+    concurrently over a pool of `ForecastWorkers` connections. Cells already cached for the
+    same issue time are not downloaded again. Rows of cells that could not be fetched are NaN.
+    """
+    if latitude is None or longitude is None:
+        route = load_route()
+        latitude, longitude = route["latitude"], route["longitude"]
+    issue_time = current_issue_time() if issue_time is None else issue_time
+
+    cells, cell_of_row = grid_cells(np.asarray(latitude), np.asarray(longitude), config.ForecastGridResolution)
+    with _make_session(config.ForecastWorkers) as session, ThreadPoolExecutor(config.ForecastWorkers) as pool:
+        frames = list(pool.map(lambda cell: _fetch_cell(session, cell, issue_time), cells))
+
+    fetched = [df for df in frames if df is not None]
+    if not fetched:
+        raise RuntimeError(f"no forecast could be fetched from {config.ForecastApiUrl}")
+    times = pd.to_datetime(fetched[0]["period_end"], utc=True).astype("int64").to_numpy() / 1e9
+
+    # One series per cell on a common time axis, then gathered onto the route rows
+    values = np.full((len(FORECAST_FIELDS), len(cells), len(times)), np.nan)
+    for i, df in enumerate(frames):
+        if df is None:
+            continue
+        cell_times = pd.to_datetime(df["period_end"], utc=True).astype("int64").to_numpy() / 1e9
+        for f, field in enumerate(FORECAST_FIELDS):
+            values[f, i] = np.interp(times, cell_times, df[field].to_numpy(dtype=float), left=np.nan, right=np.nan)
+
+    ghi, wind_speed, wind_dir = values[:, cell_of_row]
+    print(f"Forecast for {len(cell_of_row)} route rows from {len(cells)} grid cells "
+          f"({len(cells) - len(fetched)} failed)")
+    return RouteForecast(times, ghi, wind_speed, wind_dir, issue_time)
+
+def main() -> None:
+    """Refreshes the route forecast and writes it to `ForecastFile` and `updated_route_data.csv`."""
+    start = time.perf_counter()
+    forecast = ingest()
+    forecast.save(config.ForecastFile)
+
+    # Latest values alongside the route, in the columns `updated_route_data.csv` always had
+    df = load_route().to_dataframe()
+    df["GHI"] = forecast.ghi[:, 0]
+    df["WIND_SPEED"] = forecast.wind_speed[:, 0]
+    df["WIND_DIRECTION"] = forecast.wind_dir[:, 0]
+    df.to_csv("updated_route_data.csv", index=False)
+
+    print(f"Forecast saved to {config.ForecastFile} and updated_route_data.csv "
+          f"in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,283 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pandas as pd
 import numpy as np
 
-import state
+from context import make_segment_context
+from route_store import load_route
 import race_config as config
 from model import main as run_model_main
-from offrace_solar_calc import calculate_energy
+import multires
+import instrumentation
+import run_stream
+from run_store import RunWriter
+from offrace_solar_calc import calculate_race_energy, overnight_energy
 
+N_SEGMENTS = len(config.DF_WayPoints) - 1
 
-def main() -> None:
-    """Orchestrates the multi-day race simulation and saves aggregated results."""
-    results_list = []
-    current_day = 1
-    total_time = 0.0
-    energy_stop_gain = 0.0
+# Outputs written by a full race run; off by default, so other callers of the model (waypoint
+# search, benchmarks, tests) leave no files behind
+_RUN_OUTPUT_SETTINGS = ("Instrumentation", "RunStream", "WriteRunStore")
 
-    print("--- Starting Full Race Simulation ---")
 
-    for waypoint_idx in range(13):
-        # Check if we are at a standard waypoint or a day-end waypoint
-        is_day_end = config.DF_WayPoints[waypoint_idx + 1] in config.DayEnd_WayPoints
-        
-        state.set_day_state(current_day, waypoint_idx, total_time)
-        
-        # Add energy gained during charging at the stop to initial battery for the segment
-        state.InitialBatteryCapacity = min(
-            config.BatteryCapacity, 
-            energy_stop_gain + state.InitialBatteryCapacity
+def _is_day_end(waypoint_idx: int) -> bool:
+    """True if the segment ends at a day-end waypoint (overnight stop) rather than a control stop."""
+    return config.DF_WayPoints[waypoint_idx + 1] in config.DayEnd_WayPoints
+
+
+def _stop_energy_gain(waypoint_idx: int, arrival_time: float) -> tuple[float, float]:
+    """Energy gained at the stop after a segment and the race time spent there.
+
+    Returns:
+        tuple: (energy_stop_gain in Wh, stop_duration in seconds)
+    """
+    # The car stands at the last route row of the segment
+    route = load_route()
+    stop_row = min(config.DF_WayPoints[waypoint_idx + 1], len(route)) - 1
+    latitude, longitude = route["latitude"][stop_row], route["longitude"][stop_row]
+
+    if not _is_day_end(waypoint_idx):
+        # Short control stop energy gain calculation
+        energy_stop_gain = calculate_race_energy(
+            arrival_time,
+            arrival_time + config.CONTROL_STOP_DURATION,
+            latitude, longitude,
         )
-        
-        print(f"Running Segment {waypoint_idx + 1}/13 (Day {current_day})...")
-        segment_df, segment_time = run_model_main(state.route_df)
-        results_list.append(segment_df)
+        return energy_stop_gain, config.CONTROL_STOP_DURATION
+
+    # End of day energy gain calculation (evening and next morning charging)
+    return overnight_energy(arrival_time, latitude, longitude), 0.0
+
+
+def _segment_days() -> list[int]:
+    """Race day of every segment."""
+    days, current_day = [], 1
+    for waypoint_idx in range(N_SEGMENTS):
+        days.append(current_day)
+        if _is_day_end(waypoint_idx):
+            current_day += 1
+    return days
+
+
+def _chain_segments(segment_times: list[float]) -> tuple[np.ndarray, np.ndarray]:
+    """Start time offset and carried-over stop energy of every segment, given all segment times.
+
+    Reproduces the bookkeeping of the sequential `main` without solving anything.
+    """
+    offsets, gains = np.zeros(N_SEGMENTS), np.zeros(N_SEGMENTS)
+    total_time, energy_stop_gain = 0.0, 0.0
+    for waypoint_idx, segment_time in enumerate(segment_times):
+        offsets[waypoint_idx], gains[waypoint_idx] = total_time, energy_stop_gain
         total_time += segment_time
+        energy_stop_gain, stop_duration = _stop_energy_gain(waypoint_idx, total_time)
+        total_time += stop_duration
+    return offsets, gains
+
+
+def _solve_segment(waypoint_idx: int, day: int, time_offset: float, energy_stop_gain: float,
+                   v_initial: np.ndarray | None = None, levels: list[float] | None = None,
+                   enforce_final_energy: bool | None = None) -> tuple[pd.DataFrame, float]:
+    """Solves one segment in isolation (also used as the process pool worker)."""
+    ctx = make_segment_context(day, waypoint_idx, time_offset, levels, enforce_final_energy)
+
+    # Add energy gained during charging at the stop to initial battery for the segment
+    ctx = ctx.with_initial_energy(min(
+        config.BatteryCapacity,
+        energy_stop_gain + ctx.initial_energy
+    ))
+    with instrumentation.labelled(segment=waypoint_idx, day=day):
+        if config.MultiResolution:
+            return multires.solve_segment(ctx, waypoint_idx, v_initial)
+        return run_model_main(ctx, v_initial)
+
+
+def _solve_segment_recorded(*args) -> tuple[pd.DataFrame, float, list[instrumentation.SolveRecord]]:
+    """`_solve_segment` returning the instrumentation of its solves too (process pool worker)."""
+    with instrumentation.collecting() as records:
+        segment_df, segment_time = _solve_segment(*args)
+    return segment_df, segment_time, records
+
+
+def _segment_metadata(waypoint_idx: int, day: int, time_offset: float, energy_stop_gain: float,
+                      segment_time: float, records: list[instrumentation.SolveRecord],
+                      levels: list[float] | None = None) -> dict:
+    """Run store metadata of a solved segment.
+
+    The solver fields summarize the segment's recorded solves (None with `Instrumentation` off);
+    success/message are those of the last solve (the finest level with `MultiResolution`).
+    """
+    last = records[-1] if records else None
+    levels = config.BatteryLevelWayPoints if levels is None else levels
+    return {
+        "day": day,
+        "waypoints": [config.DF_WayPoints[waypoint_idx], config.DF_WayPoints[waypoint_idx + 1]],
+        "battery_targets": [levels[waypoint_idx], levels[waypoint_idx + 1]],
+        "time_offset": time_offset,
+        "energy_stop_gain": energy_stop_gain,
+        "segment_time": segment_time,
+        "solves": len(records),
+        "success": None if last is None else last.success,
+        "message": None if last is None else last.message,
+        "solver_iterations": sum(record.solver_iterations for record in records) if records else None,
+        "evaluations": sum(record.evaluations for record in records) if records else None,
+    }
+
+
+class RaceOutputs:
+    """Incremental outputs of a race run: the run stream and the run store (per `RunStream` /
+    `WriteRunStore`).
+
+    Opened by `main` and `main_parallel` only. Other callers of `run_race` (waypoint search
+    workers, benchmarks) pass none, so concurrent evaluations never touch these files.
+    """
+
+    def __init__(self, **metadata):
+        run_stream.start_run(N_SEGMENTS)
+        self.store = RunWriter(config.RunStoreDir, N_SEGMENTS, **metadata) if config.WriteRunStore else None
+
+    def write_segment(self, waypoint_idx: int, day: int, segment_df: pd.DataFrame, segment_time: float,
+                      metadata: dict, pass_no: int | None = None) -> None:
+        run_stream.publish_segment(waypoint_idx, day, segment_df, segment_time, pass_no)
+        if self.store is not None:
+            self.store.write_segment(waypoint_idx, segment_df, **metadata)
+
+    def finish(self, total_time: float, **metadata) -> None:
+        run_stream.finish_run(total_time)
+        if self.store is not None:
+            self.store.finish(total_time=total_time, **metadata)
 
-        if not is_day_end:
-            # Short control stop energy gain calculation
-            energy_stop_gain = calculate_energy(
-                total_time, 
-                total_time + config.CONTROL_STOP_DURATION
+
+def run_race(v_initials: list[np.ndarray | None] | None = None,
+             outputs: RaceOutputs | None = None, levels: list[float] | None = None,
+             enforce_final_energy: bool | None = None) -> tuple[list[pd.DataFrame], float]:
+    """Solves all segments in order, carrying race time and stop energy between them.
+
+    Args:
+        v_initials: Optional per-segment warm-start velocity profiles.
+        outputs: Optional run stream/store every solved segment is written to (the caller
+            finishes it).
+        levels: Battery level at every waypoint (`BatteryLevelWayPoints` by default).
+        enforce_final_energy: Whether every segment must end exactly at its next level
+            (`EnforceWaypointBattery` by default).
+
+    Returns:
+        tuple: (per-segment result DataFrames, total race time in seconds)
+    """
+    results_list = []
+    days = _segment_days()
+    total_time = 0.0
+    energy_stop_gain = 0.0
+
+    with instrumentation.collecting() as records:
+        for waypoint_idx in range(N_SEGMENTS):
+            print(f"Running Segment {waypoint_idx + 1}/{N_SEGMENTS} (Day {days[waypoint_idx]})...")
+            n_records = len(records)
+            segment_df, segment_time = _solve_segment(
+                waypoint_idx, days[waypoint_idx], total_time, energy_stop_gain,
+                None if v_initials is None else v_initials[waypoint_idx], levels, enforce_final_energy
             )
-            total_time += config.CONTROL_STOP_DURATION
-        else:
-            # End of day energy gain calculation (e.g., overnight/morning charging)
-            # Strategy: Charge between 5 PM - 6 PM and 5 AM - 8 AM
-            energy_stop_gain = calculate_energy(17 * 3600, 18 * 3600)
-            energy_stop_gain += calculate_energy(5 * 3600, 8 * 3600)
-            current_day += 1
+            results_list.append(segment_df)
+            if outputs is not None:
+                outputs.write_segment(waypoint_idx, days[waypoint_idx], segment_df, segment_time, _segment_metadata(
+                    waypoint_idx, days[waypoint_idx], total_time, energy_stop_gain, segment_time, records[n_records:],
+                    levels
+                ))
+            total_time += segment_time
+
+            energy_stop_gain, stop_duration = _stop_energy_gain(waypoint_idx, total_time)
+            total_time += stop_duration
+
+    instrumentation.report_race(records)
+    return results_list, total_time
+
+
+def _enable_run_outputs() -> None:
+    """Switches on the instrumentation log, run stream and run store (also in pool workers)."""
+    for setting in _RUN_OUTPUT_SETTINGS:
+        setattr(config, setting, True)
+
+
+def main() -> None:
+    """Orchestrates the multi-day race simulation and saves aggregated results."""
+    _enable_run_outputs()
+    print("--- Starting Full Race Simulation ---")
+
+    outputs = RaceOutputs(mode="sequential")
+    results_list, total_time = run_race(outputs=outputs)
 
     # Aggregate and save results
     full_race_df = pd.concat(results_list)
     full_race_df.to_csv('run_dat.csv', index=False)
-    
+    outputs.finish(total_time)
+
     print("--- Simulation Complete ---")
     print(f"Results saved to `run_dat.csv` ({len(full_race_df)} records)")
 
+
+def main_parallel(max_workers: int | None = None) -> None:
+    """Parallel variant of `main`: all segments are solved at once on a process pool.
+
+    Segments only depend on their predecessors through the start time offset and the
+    energy gained at the preceding stop. The first pass uses offsets estimated from
+    `InitialGuessVelocity`; afterwards the real offsets/gains are chained from the solved
+    segment times and only segments whose inputs moved by more than
+    `ParallelTimeTolerance` / `ParallelEnergyTolerance` are re-solved, warm-started from
+    their previous solution, until nothing moves.
+    """
+    _enable_run_outputs()
+    days = _segment_days()
+    distances = [load_route().segment(i)["step_distance"].sum() for i in range(N_SEGMENTS)]
+    offsets, gains = _chain_segments([d / config.InitialGuessVelocity for d in distances])
+
+    results_list: list[pd.DataFrame | None] = [None] * N_SEGMENTS
+    segment_times = [0.0] * N_SEGMENTS
+    used_offsets, used_gains = offsets.copy(), gains.copy()
+    pending = list(range(N_SEGMENTS))
+    records: list[instrumentation.SolveRecord] = []
+
+    print(f"--- Starting Parallel Race Simulation ({N_SEGMENTS} segments) ---")
+    outputs = RaceOutputs(mode="parallel")
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_enable_run_outputs) as pool:
+        for pass_no in range(1, N_SEGMENTS + 1):
+            print(f"Pass {pass_no}: solving segments {[i + 1 for i in pending]}")
+            futures = {
+                pool.submit(
+                    _solve_segment_recorded, i, days[i], offsets[i], gains[i],
+                    None if results_list[i] is None else results_list[i]['Velocity'].to_numpy()
+                ): i
+                for i in pending
+            }
+            # Published as they finish, so the live dashboard fills in while the pass runs
+            for future in as_completed(futures):
+                i = futures[future]
+                results_list[i], segment_times[i], segment_records = future.result()
+                records.extend(segment_records)
+                outputs.write_segment(i, days[i], results_list[i], segment_times[i], {
+                    **_segment_metadata(i, days[i], offsets[i], gains[i], segment_times[i], segment_records),
+                    "passes": pass_no,
+                }, pass_no)
+                used_offsets[i], used_gains[i] = offsets[i], gains[i]
+
+            offsets, gains = _chain_segments(segment_times)
+            pending = [
+                i for i in range(N_SEGMENTS)
+                if abs(offsets[i] - used_offsets[i]) > config.ParallelTimeTolerance
+                or abs(gains[i] - used_gains[i]) > config.ParallelEnergyTolerance
+            ]
+            if not pending:
+                break
+
+    instrumentation.report_race(records)
+    full_race_df = pd.concat(results_list)
+    full_race_df.to_csv('run_dat.csv', index=False)
+    outputs.finish(offsets[-1] + segment_times[-1], passes=pass_no)
+
+    print(f"--- Simulation Complete after {pass_no} passes ---")
+    print(f"Results saved to `run_dat.csv` ({len(full_race_df)} records)")
+
 if __name__ == "__main__":
-    main()
+    if config.ParallelSegments:
+        main_parallel(config.ParallelWorkers)
+    else:
+        main()
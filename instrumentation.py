@@ -0,0 +1,178 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Iterator
+
+import race_config as config
+import run_stream
+
+# Per-thread state: the solve being recorded, labels of the enclosing scope, collectors and counters
+_local = threading.local()
+
+@dataclass
+class WorkCounters:
+    """Model work done by one thread inside a `counting` scope (e.g. one solve).
+
+    Counted whether or not `Instrumentation` is on; solves running on other threads
+    count into their own scopes.
+    """
+    evaluations: int = 0  # car/solar model evaluations (evaluation cache misses)
+    cache_hits: int = 0
+    thermal_calls: int = 0  # winding temperature solves
+    thermal_iterations: int = 0
+
+@dataclass
+class SolveRecord:
+    """Instrumentation of one `model.main` solve.
+
+    Call times are inclusive: e.g. the constraint time contains the evaluations it triggered,
+    which in turn contain `calculate_power`.
+    """
+    labels: dict = field(default_factory=dict)  # segment/day from the caller, plus the context's size and offsets
+    calls: dict = field(default_factory=dict)  # name -> [count, seconds]
+    iterations: list = field(default_factory=list)  # per solver iteration: objective and worst constraint
+    thermal_iterations: int = 0
+    evaluations: int = 0  # car/solar model evaluations (evaluation cache misses)
+    cache_hits: int = 0
+    solver_iterations: int = 0
+    success: bool = False
+    message: str = ""
+    race_time: float = 0.0  # s, objective of the result
+    wall_time: float = 0.0  # s
+
+    def add_call(self, name: str, seconds: float) -> None:
+        entry = self.calls.get(name)
+        if entry is None:
+            self.calls[name] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_iteration(self, iteration: dict) -> None:
+        """Adds a solver iteration to the trace (and to the run stream with `RunStreamIterations`)."""
+        self.iterations.append(iteration)
+        if config.RunStreamIterations:
+            run_stream.publish({"event": "iteration", **self.labels, "iteration": len(self.iterations), **iteration})
+
+def timed(name: str) -> Callable:
+    """Decorator counting the calls and cumulative time of a function in the active `SolveRecord`.
+
+    Outside a recorded solve (or with `Instrumentation` off) the only cost is one
+    thread-local lookup per call.
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            record = getattr(_local, "record", None)
+            if record is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record.add_call(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+@contextmanager
+def labelled(**labels) -> Iterator[None]:
+    """Adds labels (e.g. segment=3, day=1) to every solve recorded in this scope."""
+    previous = getattr(_local, "labels", {})
+    _local.labels = {**previous, **labels}
+    try:
+        yield
+    finally:
+        _local.labels = previous
+
+@contextmanager
+def recording(**labels) -> Iterator[SolveRecord]:
+    """Records one solve; on exit it is written as a "solve" event and passed to any collectors."""
+    record = SolveRecord(labels={**getattr(_local, "labels", {}), **labels})
+    previous, _local.record = getattr(_local, "record", None), record
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.wall_time = time.perf_counter() - start
+        _local.record = previous
+        emit({"event": "solve", **asdict(record)})
+        for collector in getattr(_local, "collectors", []):
+            collector.append(record)
+
+@contextmanager
+def paused() -> Iterator[None]:
+    """Suspends call counting, e.g. for the instrumentation's own objective/constraint calls."""
+    previous, _local.record = getattr(_local, "record", None), None
+    try:
+        yield
+    finally:
+        _local.record = previous
+
+@contextmanager
+def counting() -> Iterator[WorkCounters]:
+    """Counts the model work done by this thread in this scope (nested scopes all count it)."""
+    counters = WorkCounters()
+    previous = getattr(_local, "counters", [])
+    _local.counters = previous + [counters]
+    try:
+        yield counters
+    finally:
+        _local.counters = previous
+
+def count(name: str, amount: int = 1) -> None:
+    """Adds `amount` to counter `name` of every `counting` scope active on this thread."""
+    for counters in getattr(_local, "counters", ()):
+        setattr(counters, name, getattr(counters, name) + amount)
+
+@contextmanager
+def collecting() -> Iterator[list[SolveRecord]]:
+    """Collects the records of all solves finished in this scope (same thread)."""
+    records: list[SolveRecord] = []
+    collectors = getattr(_local, "collectors", [])
+    _local.collectors = collectors + [records]
+    try:
+        yield records
+    finally:
+        _local.collectors = collectors
+
+def summarize(records: list[SolveRecord]) -> dict:
+    """Totals over several solves (e.g. a whole race)."""
+    calls: dict = {}
+    for record in records:
+        for name, (count, seconds) in record.calls.items():
+            total = calls.setdefault(name, [0, 0.0])
+            total[0] += count
+            total[1] += seconds
+    return {
+        "solves": len(records),
+        "failed_solves": sum(not record.success for record in records),
+        "calls": calls,
+        "thermal_iterations": sum(record.thermal_iterations for record in records),
+        "evaluations": sum(record.evaluations for record in records),
+        "cache_hits": sum(record.cache_hits for record in records),
+        "solver_iterations": sum(record.solver_iterations for record in records),
+        "wall_time": sum(record.wall_time for record in records),
+    }
+
+def emit(event: dict) -> None:
+    """Appends an event to `InstrumentationFile` as one JSON line (no-op with `Instrumentation` off).
+
+    Lines from parallel worker processes do not interleave (see `run_stream.append_line`).
+    """
+    if config.Instrumentation:
+        run_stream.append_line(config.InstrumentationFile, {"timestamp": time.time(), "pid": os.getpid(), **event})
+
+def report_race(records: list[SolveRecord]) -> dict:
+    """Writes the "race" event for a finished race and prints where the solver time went."""
+    summary = summarize(records)
+    emit({"event": "race", **summary})
+    if config.Instrumentation:
+        print(f"Solver time: {summary['wall_time']:.2f} s over {summary['solves']} solves "
+              f"({summary['solver_iterations']} iterations, {summary['evaluations']} evaluations, "
+              f"{summary['thermal_iterations']} thermal iterations)")
+        for name, (count, seconds) in sorted(summary["calls"].items(), key=lambda item: -item[1][1]):
+            print(f"  {name}: {count} calls, {seconds:.3f} s")
+    return summary
@@ -0,0 +1,471 @@
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import minimize, Bounds, NonlinearConstraint
+from scipy.sparse.linalg import LinearOperator
+
+import race_config as config
+from car import CarParams, calculate_dt, calculate_power, calculate_power_gradient, calculate_power_wind_gradient
+from constraints import SafeBatteryLevel, MaxPower
+from forecast_index import load_forecast_index
+from route_store import load_route
+from offrace_solar_calc import calculate_race_energy, overnight_energy, race_energy_rate
+from solar import calculate_incident_solarpower, calculate_incident_solarpower_gradient
+
+PROFILE_COLUMNS = ['CumulativeDistance', 'Velocity', 'Acceleration', 'Battery', 'EnergyConsumption', 'Solar', 'Time']
+
+@dataclass(frozen=True)
+class JointRoute:
+    """Whole-race route with the waypoint stops modeled as fixed time/energy events.
+
+    Stage `s` is the stretch between waypoints s and s + 1; the stop after stage s
+    (s < n_stages - 1) lasts `stop_duration[s]` and adds energy to the battery.
+    """
+    segments: np.ndarray
+    slopes: np.ndarray
+    lats: np.ndarray
+    longs: np.ndarray
+    wind_speed: np.ndarray
+    wind_dir: np.ndarray
+    stage: np.ndarray  # stage index of every route row
+    stage_end_rows: np.ndarray  # last route row of every stage
+    stop_duration: np.ndarray  # s, per stop
+    is_control_stop: np.ndarray  # control stop (time dependent gain) vs overnight stop
+    initial_energy: float  # Wh
+    final_energy: float  # Wh, battery target at the finish line
+
+def load_joint_route(path: str = "processed_route_data.csv") -> JointRoute:
+    """Builds the whole-race problem from the route file and the waypoints in race_config."""
+    columns = load_route(path).rows(config.DF_WayPoints[0], config.DF_WayPoints[-1])
+    n_rows = len(columns["step_distance"])
+    # The last waypoint may point past the end of the file (slicing clips it the same way)
+    waypoints = np.minimum(config.DF_WayPoints, config.DF_WayPoints[0] + n_rows) - config.DF_WayPoints[0]
+    n_stages = len(waypoints) - 1
+
+    stage = np.repeat(np.arange(n_stages), np.diff(waypoints))
+    is_control_stop = np.array([
+        config.DF_WayPoints[s + 1] not in config.DayEnd_WayPoints for s in range(n_stages - 1)
+    ], dtype=bool)
+
+    return JointRoute(
+        *(columns[name] for name in ("step_distance", "slope", "latitude", "longitude", "wind_speed", "wind_dir")),
+        stage=stage,
+        stage_end_rows=waypoints[1:] - 1,
+        stop_duration=np.where(is_control_stop, config.CONTROL_STOP_DURATION, 0.0),
+        is_control_stop=is_control_stop,
+        initial_energy=config.BatteryCapacity * config.BatteryLevelWayPoints[0],
+        final_energy=config.BatteryCapacity * config.BatteryLevelWayPoints[-1],
+    )
+
+def get_joint_bounds(route: JointRoute) -> list[tuple[float, float]]:
+    """Velocity bounds: the car is stationary at every waypoint and within MaxVelocity elsewhere."""
+    bounds = [(0.01, config.MaxVelocity)] * (len(route.segments) + 1)
+    for node in np.concatenate([[0], route.stage_end_rows + 1]):
+        bounds[node] = (0, 0)
+    return bounds
+
+def _stop_offsets(route: JointRoute) -> np.ndarray:
+    """Race time spent at stops before each route row."""
+    return np.concatenate([[0.0], np.cumsum(route.stop_duration)])[route.stage]
+
+def _stage_start_rows(route: JointRoute) -> np.ndarray:
+    """First route row of every stage."""
+    return np.concatenate([[0], route.stage_end_rows[:-1] + 1])
+
+def _wind(global_time: np.ndarray, route: JointRoute) -> tuple[np.ndarray, np.ndarray, tuple | None]:
+    """Wind speed and angle on every route row, with their time derivatives.
+
+    With UseForecastWind the forecast is sampled where the car is at the end of the row (as
+    in the segment model), else the route's static columns are used.
+
+    Returns:
+        tuple: (wind_speed, wind_dir, (d_wind_speed/dt, d_wind_dir/dt) or None)
+    """
+    if not config.UseForecastWind:
+        return route.wind_speed, route.wind_dir, None
+    index = load_forecast_index()
+    wind_speed, wind_speed_rate = index.sample("wind_speed", global_time, route.lats, route.longs)
+    wind_dir, wind_dir_rate = index.sample("wind_angle", global_time, route.lats, route.longs)
+    return wind_speed, wind_dir, (wind_speed_rate, wind_dir_rate)
+
+def _stop_gain(global_time: np.ndarray, route: JointRoute) -> np.ndarray:
+    """Energy (Wh) gained at every stop, given the race time at the end of every row.
+
+    A control stop collects the solar energy of its arrival time and duration, an overnight
+    stop that of the evening and next morning, both at the stop position.
+    """
+    stop_rows = route.stage_end_rows[:-1]
+    arrival = global_time[stop_rows]
+    stop_lats, stop_longs = route.lats[stop_rows], route.longs[stop_rows]
+    return np.where(
+        route.is_control_stop,
+        calculate_race_energy(arrival, arrival + route.stop_duration, stop_lats, stop_longs),
+        overnight_energy(arrival, stop_lats, stop_longs),
+    )
+
+def _stop_gain_rate(global_time: np.ndarray, route: JointRoute) -> np.ndarray:
+    """d/dT of `_stop_gain` with respect to the arrival time (Wh/s); overnight gains only change with the day."""
+    stop_rows = route.stage_end_rows[:-1]
+    arrival = global_time[stop_rows]
+    stop_lats, stop_longs = route.lats[stop_rows], route.longs[stop_rows]
+    return np.where(
+        route.is_control_stop,
+        race_energy_rate(arrival + route.stop_duration, stop_lats, stop_longs)
+        - race_energy_rate(arrival, stop_lats, stop_longs),
+        0.0,
+    )
+
+def _joint_state(v_prof: np.ndarray, route: JointRoute, car: CarParams | None = None) -> dict:
+    """Time, power, solar and battery trajectories over the whole race, simulated forward.
+
+    The battery is continuous across stops: each stop adds its solar gain, which for a
+    control stop depends on the arrival time and hence on the velocity profile.
+    """
+    v_start, v_stop = v_prof[:-1], v_prof[1:]
+    avg_speed = (v_start + v_stop) / 2
+    dt = calculate_dt(v_start, v_stop, route.segments)
+    acceleration = (v_stop - v_start) / dt
+
+    global_time = dt.cumsum() + _stop_offsets(route)
+    wind_speed, wind_dir, _ = _wind(global_time, route)
+    net_power, _ = calculate_power(avg_speed, acceleration, route.slopes, wind_speed, wind_dir, car)
+    solar_power = calculate_incident_solarpower(global_time, route.lats, route.longs, car)
+
+    stop_gain = _stop_gain(global_time, route)
+    if car is not None:
+        # The stop gains are computed for the configured panel
+        stop_gain = stop_gain * car.panel_power_coeff / (config.PanelArea * config.PanelEfficiency)
+    gained = np.concatenate([np.zeros(np.shape(stop_gain)[:-1] + (1,)), np.cumsum(stop_gain, axis=-1)], axis=-1)
+
+    energy_consumption = ((net_power - solar_power) * dt).cumsum(axis=-1) / 3600
+    return {
+        "dt": dt,
+        "acceleration": acceleration,
+        "global_time": global_time,
+        "net_power": net_power,
+        "solar_power": solar_power,
+        "stop_gain": stop_gain,
+        "battery": route.initial_energy - energy_consumption + gained[..., route.stage],
+    }
+
+def race_state(v_prof: np.ndarray, route: JointRoute, car: CarParams | None = None) -> dict:
+    """Trajectories of a whole-race velocity plan, for evaluating plans outside the optimizer.
+
+    With a batched `car` (`CarParams.sweep`) the power, solar, stop gain and battery arrays
+    get a leading (K,) axis, one trace per car variant.
+
+    Returns:
+        dict: per route row `dt`, `acceleration`, `global_time`, `net_power`, `solar_power`
+        and `battery` (Wh), and the `stop_gain` (Wh) of every stop.
+    """
+    return _joint_state(v_prof, route, car)
+
+def joint_objective(v_prof: np.ndarray, route: JointRoute) -> float:
+    """Total race time including stops."""
+    dt = calculate_dt(v_prof[:-1], v_prof[1:], route.segments)
+    return float(np.sum(dt) + np.sum(route.stop_duration))
+
+def joint_constraint_func(v_prof: np.ndarray, route: JointRoute) -> np.ndarray:
+    """Per-node constraints of the whole race (all entries must be >= 0).
+
+    Returns:
+        Array of [battery above SafeBatteryLevel, power below MaxPower] at every route row,
+        then the battery below BatteryCapacity on the first row of every stage (where the
+        stop charge lands) and finally the final battery margin.
+    """
+    s = _joint_state(v_prof, route)
+    battery = s["battery"]
+    return np.concatenate([
+        battery - SafeBatteryLevel,
+        MaxPower - s["net_power"],
+        config.BatteryCapacity - battery[_stage_start_rows(route)],
+        [battery[-1] - route.final_energy],
+    ])
+
+# Direct transcription (main): besides the speed of every moving node (waypoint nodes are fixed
+# at rest), the race time and the battery energy at the end of every route row are decision
+# variables, all scaled to similar magnitudes. Consecutive rows are linked by defect (equality)
+# constraints, so every constraint involves a few variables and the Jacobians have O(rows) entries.
+_SPEED_SCALE = config.MaxVelocity  # m/s per speed variable unit
+_TIME_SCALE = 3600.0  # s per time variable unit
+
+@dataclass(frozen=True)
+class _Layout:
+    """Positions of the variables in the decision vector."""
+    n_rows: int
+    moving: np.ndarray  # nodes with a speed variable
+    speed_col: np.ndarray  # column of every node's speed, -1 for nodes at rest
+
+    @property
+    def time_col(self) -> np.ndarray:
+        return len(self.moving) + np.arange(self.n_rows)
+
+    @property
+    def energy_col(self) -> np.ndarray:
+        return len(self.moving) + self.n_rows + np.arange(self.n_rows)
+
+    @property
+    def size(self) -> int:
+        return len(self.moving) + 2 * self.n_rows
+
+def _layout(route: JointRoute) -> _Layout:
+    n_nodes = len(route.segments) + 1
+    moving = np.setdiff1d(np.arange(n_nodes), np.concatenate([[0], route.stage_end_rows + 1]))
+    speed_col = np.full(n_nodes, -1)
+    speed_col[moving] = np.arange(len(moving))
+    return _Layout(len(route.segments), moving, speed_col)
+
+def _split(x: np.ndarray, route: JointRoute) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(velocity profile, race times in s, battery energies in Wh) of a decision vector."""
+    layout = _layout(route)
+    v_prof = np.zeros(layout.n_rows + 1)
+    v_prof[layout.moving] = x[:len(layout.moving)] * _SPEED_SCALE
+    return v_prof, x[layout.time_col] * _TIME_SCALE, x[layout.energy_col] * config.BatteryCapacity
+
+def _transcribe(v_prof: np.ndarray, route: JointRoute) -> np.ndarray:
+    """Decision vector with the states of a forward simulation of `v_prof` (all defects zero)."""
+    s = _joint_state(v_prof, route)
+    return np.concatenate([
+        v_prof[_layout(route).moving] / _SPEED_SCALE, s["global_time"] / _TIME_SCALE,
+        s["battery"] / config.BatteryCapacity,
+    ])
+
+def _row_terms(x: np.ndarray, route: JointRoute, with_jacobian: bool = False) -> dict:
+    """Per-row quantities of the transcribed problem (optionally with their derivatives).
+
+    The solar power, the forecast wind and the stop gains are evaluated at the time
+    variables, so they only couple a row to its own time.
+    """
+    v_prof, time, _ = _split(x, route)
+    v_start, v_stop = v_prof[:-1], v_prof[1:]
+    avg_speed = (v_start + v_stop) / 2
+    dt = calculate_dt(v_start, v_stop, route.segments)
+    acceleration = (v_stop - v_start) / dt
+    wind_speed, wind_dir, wind_rates = _wind(time, route)
+    net_power, _ = calculate_power(avg_speed, acceleration, route.slopes, wind_speed, wind_dir)
+    out = {
+        "dt": dt,
+        "net_power": net_power,
+        "solar_power": calculate_incident_solarpower(time, route.lats, route.longs),
+        "stop_gain": _stop_gain(time, route),
+    }
+    if not with_jacobian:
+        return out
+
+    d_dt = -dt / (v_start + v_stop + config.EPSILON)  # same with respect to both end speeds
+    p_speed, p_acc = calculate_power_gradient(avg_speed, acceleration, route.slopes, wind_speed, wind_dir)
+    out["d_dt"] = d_dt
+    out["d_power_start"] = 0.5 * p_speed + p_acc * (-1 - acceleration * d_dt) / dt
+    out["d_power_stop"] = 0.5 * p_speed + p_acc * (1 - acceleration * d_dt) / dt
+    out["d_power_time"] = np.zeros(len(dt))
+    if wind_rates is not None:
+        p_wind_speed, p_wind_dir = calculate_power_wind_gradient(avg_speed, acceleration, route.slopes,
+                                                                 wind_speed, wind_dir)
+        out["d_power_time"] = p_wind_speed * wind_rates[0] + p_wind_dir * wind_rates[1]
+    out["d_solar"] = calculate_incident_solarpower_gradient(time, route.lats, route.longs)
+    out["d_stop_gain"] = _stop_gain_rate(time, route)
+    return out
+
+def _speed_entries(layout: _Layout, rows: np.ndarray, start_values: np.ndarray,
+                   stop_values: np.ndarray) -> list[tuple]:
+    """COO entries of per-row derivatives with respect to the row's start and end speed.
+
+    Nodes at rest have no variable, so their entries are dropped.
+    """
+    entries = []
+    for nodes, values in ((rows, start_values), (rows + 1, stop_values)):
+        cols = layout.speed_col[nodes]
+        keep = cols >= 0
+        entries.append((rows[keep], cols[keep], values[keep] * _SPEED_SCALE))
+    return entries
+
+def joint_defects(x: np.ndarray, route: JointRoute) -> np.ndarray:
+    """Time then battery defects of every row (all must be 0).
+
+    Row i ends `dt` (plus any stop before it) after row i - 1, and its battery energy is the
+    previous one minus the net energy drawn over the row plus any stop gain landing on it.
+    """
+    _, time, energy = _split(x, route)
+    r = _row_terms(x, route)
+    stop_before = np.zeros(len(time))
+    stop_before[route.stage_end_rows[:-1] + 1] = route.stop_duration
+    gain_before = np.zeros(len(time))
+    gain_before[route.stage_end_rows[:-1] + 1] = r["stop_gain"]
+
+    time_prev = np.concatenate([[0.0], time[:-1]])
+    energy_prev = np.concatenate([[route.initial_energy], energy[:-1]])
+    return np.concatenate([
+        (time - time_prev - r["dt"] - stop_before) / _TIME_SCALE,
+        (energy - energy_prev + (r["net_power"] - r["solar_power"]) * r["dt"] / 3600 - gain_before)
+        / config.BatteryCapacity,
+    ])
+
+def joint_defects_jac(x: np.ndarray, route: JointRoute) -> sparse.csr_matrix:
+    """Sparse Jacobian of `joint_defects`: a few entries per row, built directly in COO form."""
+    layout = _layout(route)
+    n = layout.n_rows
+    rows = np.arange(n)
+    time_col, energy_col = layout.time_col, layout.energy_col
+    stop_rows = route.stage_end_rows[:-1]
+    r = _row_terms(x, route, with_jacobian=True)
+    dt, d_dt = r["dt"], r["d_dt"]
+    net_solar = r["net_power"] - r["solar_power"]
+    energy_rows = n + rows
+    energy_scale = 3600 * config.BatteryCapacity  # W s per scaled energy unit
+
+    entries = [
+        # Time defects
+        (rows, time_col, np.ones(n)),
+        (rows[1:], time_col[:-1], -np.ones(n - 1)),
+        *_speed_entries(layout, rows, -d_dt / _TIME_SCALE, -d_dt / _TIME_SCALE),
+        # Battery defects: the solar power and forecast wind of a row depend on its time, the
+        # gain of a stop on the time of the row before it
+        (energy_rows, energy_col, np.ones(n)),
+        (energy_rows[1:], energy_col[:-1], -np.ones(n - 1)),
+        (energy_rows, time_col, (r["d_power_time"] - r["d_solar"]) * dt * _TIME_SCALE / energy_scale),
+        (n + stop_rows + 1, time_col[stop_rows], -r["d_stop_gain"] * _TIME_SCALE / config.BatteryCapacity),
+    ]
+    for row_idx, cols, values in _speed_entries(layout, rows, (r["d_power_start"] * dt + net_solar * d_dt) / energy_scale,
+                                                (r["d_power_stop"] * dt + net_solar * d_dt) / energy_scale):
+        entries.append((n + row_idx, cols, values))
+
+    row_idx, col_idx, values = (np.concatenate(parts) for parts in zip(*entries))
+    return sparse.coo_matrix((values, (row_idx, col_idx)), shape=(2 * n, layout.size)).tocsr()
+
+def joint_power_constraint(x: np.ndarray, route: JointRoute) -> np.ndarray:
+    """Power margin below MaxPower on every row, relative to MaxPower (all must be >= 0)."""
+    return (MaxPower - _row_terms(x, route)["net_power"]) / MaxPower
+
+def joint_power_constraint_jac(x: np.ndarray, route: JointRoute) -> sparse.csr_matrix:
+    """Sparse Jacobian of `joint_power_constraint`: the row's end speeds and, with forecast wind, its time."""
+    layout = _layout(route)
+    rows = np.arange(layout.n_rows)
+    r = _row_terms(x, route, with_jacobian=True)
+    entries = _speed_entries(layout, rows, -r["d_power_start"] / MaxPower, -r["d_power_stop"] / MaxPower)
+    entries.append((rows, layout.time_col, -r["d_power_time"] * _TIME_SCALE / MaxPower))
+    row_idx, col_idx, values = (np.concatenate(parts) for parts in zip(*entries))
+    return sparse.coo_matrix((values, (row_idx, col_idx)), shape=(layout.n_rows, layout.size)).tocsr()
+
+def _hessian_product(jac: Callable[[np.ndarray], sparse.csr_matrix]) -> Callable:
+    """Matrix-free Hessian of a constraint's Lagrangian term, sum_i w_i * hess(c_i)(x).
+
+    Products with a direction p are finite differences of jac(x)^T w along p, so only
+    sparse Jacobians are evaluated and no dense matrix is formed.
+    """
+    def hess(x: np.ndarray, w: np.ndarray) -> LinearOperator:
+        gradient = jac(x).T @ w
+
+        def matvec(p: np.ndarray) -> np.ndarray:
+            p = np.ravel(p)
+            norm = np.linalg.norm(p)
+            if norm == 0:
+                return np.zeros_like(x)
+            h = np.sqrt(np.finfo(float).eps) * max(1.0, np.linalg.norm(x)) / norm
+            return (jac(x + h * p).T @ w - gradient) / h
+        return LinearOperator((len(x), len(x)), matvec=matvec, dtype=float)
+    return hess
+
+def get_joint_state_bounds(route: JointRoute) -> Bounds:
+    """Bounds of the transcribed problem.
+
+    Moving nodes keep within (0.01, MaxVelocity), also at every iterate (the time defects are
+    meaningless for speeds at or below zero); the battery stays above SafeBatteryLevel, below
+    BatteryCapacity on the first row of every stage (where the stop charge lands) and reaches
+    the finish target.
+    """
+    layout = _layout(route)
+    n = layout.n_rows
+    n_moving = len(layout.moving)
+    energy_low = np.full(n, SafeBatteryLevel)
+    energy_low[-1] = max(SafeBatteryLevel, route.final_energy)
+    energy_high = np.full(n, np.inf)
+    energy_high[_stage_start_rows(route)] = config.BatteryCapacity
+    return Bounds(
+        np.concatenate([np.full(n_moving, 0.01 / _SPEED_SCALE), np.zeros(n), energy_low / config.BatteryCapacity]),
+        np.concatenate([np.full(n_moving, config.MaxVelocity / _SPEED_SCALE), np.full(n, np.inf),
+                        energy_high / config.BatteryCapacity]),
+        keep_feasible=np.arange(layout.size) < n_moving,
+    )
+
+def extract_joint_profiles(v_prof: np.ndarray, route: JointRoute) -> pd.DataFrame:
+    """Per-stage profiles in the same layout as `model.main` / `fullmodelrunner` output."""
+    s = _joint_state(v_prof, route)
+    stage_frames = []
+    battery_start = route.initial_energy
+    for stage_no, end_row in enumerate(route.stage_end_rows):
+        rows = np.flatnonzero(route.stage == stage_no)
+        nodes = np.append(rows, end_row + 1)
+        dt = s["dt"][rows]
+        start_time = s["global_time"][rows[0]] - dt[0]
+
+        stage_frames.append(pd.DataFrame(dict(zip(PROFILE_COLUMNS, [
+            np.append([0], route.segments[rows]),
+            v_prof[nodes],
+            np.concatenate(([np.nan], s["acceleration"][rows])),
+            np.concatenate(([battery_start], s["battery"][rows])) * 100 / config.BatteryCapacity,
+            np.concatenate(([np.nan], s["net_power"][rows] * dt / 3600)),
+            np.concatenate(([np.nan], s["solar_power"][rows] * dt / 3600)),
+            np.concatenate(([start_time], s["global_time"][rows])),
+        ]))))
+        if stage_no < len(s["stop_gain"]):
+            battery_start = s["battery"][end_row] + s["stop_gain"][stage_no]
+
+    return pd.concat(stage_frames)
+
+def main(route: JointRoute | None = None) -> tuple[pd.DataFrame, float]:
+    """Optimizes the velocity profile of the entire race in one problem.
+
+    Control stops and overnight charging are fixed time/energy events; the battery is
+    carried across them, so no per-segment `BatteryLevelWayPoints` targets are needed
+    apart from the start and finish levels. The problem is solved in its transcribed form
+    with trust-constr, which keeps the Jacobians sparse.
+
+    Returns:
+        tuple: (out_df, race_time)
+    """
+    if route is None:
+        route = load_joint_route()
+
+    v_initial = np.array([config.InitialGuessVelocity if lo > 0 else 0.0 for lo, _ in get_joint_bounds(route)])
+    x_initial = _transcribe(v_initial, route)
+    n_vars = len(x_initial)
+    race_end = _layout(route).time_col[-1]
+
+    print(f"Starting Joint Race Optimization (Method: trust-constr, {len(v_initial)} points, {n_vars} variables)")
+    print("=" * 60)
+
+    objective_grad = np.zeros(n_vars)
+    objective_grad[race_end] = 1.0
+    defects_jac = lambda x: joint_defects_jac(x, route)
+    power_jac = lambda x: joint_power_constraint_jac(x, route)
+    result = minimize(
+        lambda x: x[race_end], x_initial,
+        jac=lambda x: objective_grad,
+        hess=lambda x: sparse.csr_matrix((n_vars, n_vars)),  # the race time is linear in the variables
+        bounds=get_joint_state_bounds(route),
+        method="trust-constr",
+        constraints=[
+            NonlinearConstraint(lambda x: joint_defects(x, route), 0, 0,
+                                jac=defects_jac, hess=_hessian_product(defects_jac)),
+            NonlinearConstraint(lambda x: joint_power_constraint(x, route), 0, np.inf,
+                                jac=power_jac, hess=_hessian_product(power_jac)),
+        ],
+        options={'maxiter': config.JointMaxIter},
+    )
+
+    # The profiles are re-simulated from the speeds, so the states match them exactly
+    v_optimized = _split(result.x, route)[0]
+    race_time = joint_objective(v_optimized, route)
+
+    print(f"done ({result.message}, {result.nit} iterations, constraint violation {result.constr_violation:.2e}).")
+    print(f"Race Time: {race_time/3600:.4f} hrs")
+
+    return extract_joint_profiles(v_optimized, route), race_time
+
+if __name__ == "__main__":
+    outdf, _ = main()
+    outdf.to_csv('run_dat.csv', index=False)
+    print("Written results to `run_dat.csv`")
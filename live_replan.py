@@ -0,0 +1,308 @@
+import json
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+import race_config as config
+from constraints import get_bounds, objective, objective_jac
+from context import SegmentContext
+from model import build_constraints, is_feasible
+from profiles import extract_profiles
+from route_store import RouteStore, load_route
+import warmstart
+
+DT = config.RaceEndTime - config.RaceStartTime
+N_SEGMENTS = len(config.DF_WayPoints) - 1
+
+# Remaining distance (m) of the current route row below which the car counts as past it
+_MIN_ROW_DISTANCE = 1.0
+
+@dataclass(frozen=True)
+class Telemetry:
+    """One update from the car, as a JSON line {"distance": ..., "soc": ..., "time": ..., "speed": ...}."""
+    distance: float  # m along the whole route
+    soc: float  # battery state of charge in % (as the `Battery` output column)
+    time: float  # race time in s (racing hours only, as `ctx.time_offset`)
+    speed: float = 0.0  # m/s, current velocity
+
+    @classmethod
+    def from_json(cls, line: str) -> "Telemetry":
+        data = json.loads(line)
+        return cls(float(data["distance"]), float(data["soc"]), float(data["time"]), float(data.get("speed", 0.0)))
+
+@dataclass(frozen=True)
+class Plan:
+    """Velocity plan for the rest of the current segment."""
+    index_no: int  # segment (between DF_WayPoints) the plan belongs to
+    distance: np.ndarray  # m along the whole route of every velocity node
+    velocity: np.ndarray  # m/s at every node
+    race_time: float  # s to the end of the segment
+    feasible: bool  # battery and power within limits (model.is_feasible)
+    iterations: int
+    solve_time: float  # s, wall clock including setup
+    out_df: pd.DataFrame  # profiles in the `model.main` output layout, plus the route distance
+
+def horizon_context(telemetry: Telemetry, route: RouteStore | None = None) -> tuple[SegmentContext, int]:
+    """Context of the remaining part of the current segment, starting where the car is.
+
+    The first route row is shortened to the distance left in it; the car starts with the
+    reported battery energy and race time and must reach the segment's waypoint target.
+
+    Returns:
+        tuple: (context, segment index_no)
+    """
+    if route is None:
+        route = load_route()
+    row_end = route["cumulative_distance"] * 1000
+    row = int(np.searchsorted(row_end - _MIN_ROW_DISTANCE, telemetry.distance, side="right"))
+    row = min(row, len(route) - 1)
+    index_no = min(int(np.searchsorted(config.DF_WayPoints, row, side="right")) - 1, N_SEGMENTS - 1)
+
+    columns = route.rows(row, min(config.DF_WayPoints[index_no + 1], len(route)))
+    columns["step_distance"] = columns["step_distance"].copy()
+    columns["step_distance"][0] = np.clip(row_end[row] - telemetry.distance, _MIN_ROW_DISTANCE, columns["step_distance"][0])
+
+    ctx = SegmentContext.from_columns(
+        columns,
+        initial_energy=config.BatteryCapacity * telemetry.soc / 100,  # Wh
+        final_energy=config.BatteryCapacity * config.BatteryLevelWayPoints[index_no + 1],  # Wh
+        time_offset=telemetry.time,
+        day=int(telemetry.time // DT) + 1,
+    )
+    return ctx, index_no
+
+def _initial_guess(ctx: SegmentContext, index_no: int, speed: float, previous: Plan | None) -> np.ndarray:
+    """Previous plan (same segment) shifted onto the new horizon, else the warm-start cache or a flat profile."""
+    if previous is not None and previous.index_no == index_no:
+        v_initial = warmstart.prolong(previous.velocity, previous.distance - ctx.start_distance, ctx)
+    else:
+        v_initial = warmstart.lookup(ctx) if config.UseWarmStartCache else None
+        if v_initial is None:
+            v_initial = np.concatenate([[0], np.ones(ctx.n_points - 2) * config.InitialGuessVelocity, [0]])
+    v_initial[0] = speed
+    return v_initial
+
+class _BudgetExceeded(Exception):
+    """Raised from the solver callback to stop a horizon solve at its latency budget."""
+
+def solve_horizon(ctx: SegmentContext, v_initial: np.ndarray, latency_budget: float,
+                  start: float | None = None) -> tuple[np.ndarray, bool, int]:
+    """Solves a horizon with a wall-clock budget, keeping the fastest feasible iterate.
+
+    The solver is stopped from its callback once `latency_budget` seconds have passed since
+    `start` (default: now). The initial guess competes too, so a feasible warm start is never
+    replaced by an infeasible plan; without any feasible iterate the last one is returned.
+
+    Returns:
+        tuple: (velocity profile, feasible, iterations)
+    """
+    deadline = (time.perf_counter() if start is None else start) + latency_budget
+    best = {"velocity": None, "time": np.inf}
+    last = np.array(v_initial)
+    iterations = 0
+
+    # The first node is pinned to the current speed instead of a standing start
+    bounds = get_bounds(ctx.n_points)
+    bounds[0] = (v_initial[0], v_initial[0])
+    lower, upper = np.array(bounds).T
+
+    def within_bounds(v_prof: np.ndarray) -> np.ndarray:
+        # trust-constr iterates may sit slightly outside the bounds until it converges
+        return np.clip(v_prof, lower, upper)
+
+    def keep_best(v_prof: np.ndarray) -> None:
+        if is_feasible(v_prof, ctx):
+            race_time = objective(v_prof, ctx)
+            if race_time < best["time"]:
+                best["velocity"], best["time"] = np.array(v_prof), race_time
+
+    def callback(v_prof: np.ndarray, *_) -> None:
+        nonlocal iterations, last
+        iterations += 1
+        # Some methods (COBYLA on recent scipy) report iterates without the fixed variables
+        if len(v_prof) == ctx.n_points:
+            last = within_bounds(v_prof)
+            keep_best(last)
+        if time.perf_counter() > deadline:
+            # Not StopIteration: only some scipy versions and methods stop cleanly on it
+            raise _BudgetExceeded
+
+    use_gradients = config.UseAnalyticGradients and config.ModelMethod in config.GradientMethods
+
+    keep_best(v_initial)
+    try:
+        result = minimize(
+            objective, v_initial,
+            args=(ctx,),
+            jac=objective_jac if use_gradients else None,
+            bounds=bounds,
+            method=config.ModelMethod,
+            constraints=build_constraints(ctx, use_gradients),
+            callback=callback,
+        )
+        last = within_bounds(result.x)
+        keep_best(last)
+    except _BudgetExceeded:
+        pass
+
+    if best["velocity"] is None:
+        return last, False, iterations
+    return best["velocity"], True, iterations
+
+class Replanner:
+    """Receding-horizon re-planning: every telemetry update re-solves the rest of the current segment.
+
+    Each solve is warm-started from the previous plan, so the solver only corrects for how
+    far the car drifted from it.
+    """
+
+    def __init__(self, latency_budget: float | None = None, route: RouteStore | None = None):
+        self.latency_budget = config.LiveLatencyBudget if latency_budget is None else latency_budget
+        self.route = load_route() if route is None else route
+        self.plan: Plan | None = None
+
+    def update(self, telemetry: Telemetry) -> Plan:
+        """New plan from a telemetry update, within the latency budget."""
+        start = time.perf_counter()
+        ctx, index_no = horizon_context(telemetry, self.route)
+        v_initial = _initial_guess(ctx, index_no, telemetry.speed, self.plan)
+        velocity, feasible, iterations = solve_horizon(ctx, v_initial, self.latency_budget, start)
+
+        out_df = pd.DataFrame(dict(zip(
+            ['CumulativeDistance', 'Velocity', 'Acceleration', 'Battery', 'EnergyConsumption', 'Solar', 'Time'],
+            extract_profiles(velocity, ctx)
+        )))
+        distance = ctx.start_distance + warmstart.node_distance(ctx)
+        out_df['RouteDistance'] = distance
+
+        self.plan = Plan(index_no, distance, velocity, objective(velocity, ctx), feasible, iterations,
+                         time.perf_counter() - start, out_df)
+        return self.plan
+
+class LatestTelemetry:
+    """Single-slot mailbox between a telemetry reader thread and the re-planner.
+
+    Updates that arrive while a plan is being computed overwrite each other, so the next
+    solve always starts from the newest state instead of working through a backlog.
+    """
+
+    def __init__(self):
+        self._value: Telemetry | None = None
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, telemetry: Telemetry) -> None:
+        with self._condition:
+            self._value = telemetry
+            self._condition.notify()
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def get(self) -> Telemetry | None:
+        """Waits for the next update; None once the source is closed and drained."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._value is not None or self._closed)
+            telemetry, self._value = self._value, None
+            return telemetry
+
+def _put_line(line: str, mailbox: LatestTelemetry) -> None:
+    line = line.strip()
+    if not line:
+        return
+    try:
+        mailbox.put(Telemetry.from_json(line))
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Ignoring telemetry line {line!r}: {e}")
+
+def tail_file(path: str, mailbox: LatestTelemetry, stop: threading.Event) -> None:
+    """Feeds lines appended to `path` into the mailbox.
+
+    Content already in the file when the reader starts is skipped; a file that does not
+    exist yet is read from its first line once it appears.
+    """
+    existed = os.path.exists(path)
+    while not os.path.exists(path) and not stop.is_set():
+        time.sleep(config.LivePollInterval)
+    if stop.is_set():
+        mailbox.close()
+        return
+    with open(path) as f:
+        if existed:
+            f.seek(0, os.SEEK_END)
+        pending = ""
+        while not stop.is_set():
+            chunk = f.read()
+            if not chunk:
+                time.sleep(config.LivePollInterval)
+                continue
+            # Only complete lines; a partially written one waits for the next read
+            *lines, pending = (pending + chunk).split("\n")
+            for line in lines:
+                _put_line(line, mailbox)
+    mailbox.close()
+
+def listen_socket(host: str, port: int, mailbox: LatestTelemetry, stop: threading.Event) -> None:
+    """Feeds JSON lines sent over TCP connections to host:port into the mailbox, one client at a time."""
+    with socket.create_server((host, port)) as server:
+        server.settimeout(config.LivePollInterval)
+        while not stop.is_set():
+            try:
+                connection, _ = server.accept()
+            except TimeoutError:
+                continue
+            with connection, connection.makefile("r") as lines:
+                for line in lines:
+                    _put_line(line, mailbox)
+                    if stop.is_set():
+                        break
+    mailbox.close()
+
+def start_reader(source: str, mailbox: LatestTelemetry, stop: threading.Event) -> threading.Thread:
+    """Starts the reader thread for a telemetry file path or a "tcp://host:port" address."""
+    url = urlparse(source)
+    if url.scheme == "tcp":
+        target, args = listen_socket, (url.hostname, url.port, mailbox, stop)
+    else:
+        target, args = tail_file, (source, mailbox, stop)
+    reader = threading.Thread(target=target, args=args, daemon=True)
+    reader.start()
+    return reader
+
+def _write_plan(plan: Plan, path: str) -> None:
+    """Writes the plan CSV via a temporary file, so readers never see a partial plan."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    plan.out_df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def main(source: str | None = None) -> None:
+    """Re-plans on every telemetry update from `LiveTelemetrySource`, writing each plan to `LivePlanFile`."""
+    source = source or config.LiveTelemetrySource
+    mailbox, stop = LatestTelemetry(), threading.Event()
+    start_reader(source, mailbox, stop)
+    replanner = Replanner()
+    print(f"Waiting for telemetry from {source} (latency budget {replanner.latency_budget:.1f} s)")
+
+    try:
+        while (telemetry := mailbox.get()) is not None:
+            plan = replanner.update(telemetry)
+            _write_plan(plan, config.LivePlanFile)
+            print(f"{telemetry.distance / 1000:.1f} km, {telemetry.soc:.1f}%: segment {plan.index_no} "
+                  f"{'feasible' if plan.feasible else 'INFEASIBLE'} plan, {plan.race_time / 3600:.3f} hrs to go "
+                  f"({plan.iterations} iterations in {plan.solve_time:.2f} s)")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+
+if __name__ == "__main__":
+    main()
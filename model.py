@@ -1,73 +1,184 @@
+import contextlib
+import time
+import warnings
+from typing import Callable
+
 import numpy as np
-from scipy.optimize import minimize
+from scipy.optimize import minimize, NonlinearConstraint
 import pandas as pd
 
 import race_config as config
 import state
-from constraints import get_bounds, objective, battery_acc_constraint_func, final_battery_constraint_func
+from context import SegmentContext, make_segment_context
+from constraints import (
+    get_bounds, objective, objective_jac, battery_acc_constraint_func, battery_acc_constraint_jac,
+    battery_acc_vector_constraint_func, battery_acc_vector_constraint_jac, final_battery_constraint_func,
+    final_battery_constraint_jac
+)
 from profiles import extract_profiles
+import instrumentation
+import warmstart
+
+# Constraint violation (Wh / W) still accepted as feasible, e.g. for solutions cut short by an iteration limit
+FEASIBILITY_TOLERANCE = 0.1
+
+def build_constraints(ctx: SegmentContext, use_gradients: bool) -> list:
+    """scipy constraints of a segment solve for the configured `ConstraintMode`."""
+    if config.ConstraintMode == "vector":
+        # One smooth constraint per node instead of the min/max kink
+        constraints = [
+            NonlinearConstraint(
+                lambda v: battery_acc_vector_constraint_func(v, ctx), 0, np.inf,
+                jac=(lambda v: battery_acc_vector_constraint_jac(v, ctx)) if use_gradients else "2-point",
+            ),
+        ]
+    else:
+        constraints = [
+            {
+                "type": "ineq",
+                "fun": battery_acc_constraint_func,
+                "args": (ctx,),
+            },
+        ]
+        if use_gradients:
+            constraints[0]["jac"] = battery_acc_constraint_jac
+
+    if ctx.enforces_final_energy:
+        # End the segment exactly at the next waypoint battery target
+        constraints.append({
+            "type": "ineq",
+            "fun": final_battery_constraint_func,
+            "args": (ctx,),
+        })
+        if use_gradients:
+            constraints[-1]["jac"] = final_battery_constraint_jac
+    return constraints
 
-def main(route_df: pd.DataFrame) -> tuple[pd.DataFrame, float]:
+def is_feasible(v_prof: np.ndarray, ctx: SegmentContext) -> bool:
+    """True if the profile keeps the battery and motor power within limits (to FEASIBILITY_TOLERANCE)."""
+    return bool(np.min(battery_acc_constraint_func(v_prof, ctx)) > -FEASIBILITY_TOLERANCE)
+
+def _trace_callback(record: instrumentation.SolveRecord, ctx: SegmentContext) -> Callable:
+    """Solver callback adding the objective and worst constraint of every iteration to `record`."""
+    start = time.perf_counter()
+
+    def callback(v_prof: np.ndarray, *_) -> None:
+        with instrumentation.paused():
+            worst_constraint = float(np.min(battery_acc_constraint_func(v_prof, ctx)))
+            if ctx.enforces_final_energy:
+                worst_constraint = min(worst_constraint, *final_battery_constraint_func(v_prof, ctx))
+            record.add_iteration({
+                "objective": objective(v_prof, ctx),
+                "worst_constraint": worst_constraint,
+                "time": time.perf_counter() - start,
+            })
+    return callback
+
+def main(ctx: SegmentContext | pd.DataFrame, v_initial: np.ndarray | None = None,
+         max_iter: int | None = None, tol: float | None = None) -> tuple[pd.DataFrame, float]:
     """Runs the simulation for a single race segment.
 
     Args:
-        route_df: DataFrame containing segment data (distance, slope, coords, winds).
+        ctx: Segment context (route arrays, battery energies, time offset). A bare route
+            DataFrame is still accepted and combined with the globals in `state`.
+        v_initial: Optional warm-start velocity profile (ctx.n_points points).
+            Defaults to the nearest cached solution of this segment (`UseWarmStartCache`),
+            else a flat `InitialGuessVelocity` profile.
+        max_iter: Optional solver iteration limit (`ModelMaxIter` otherwise).
+        tol: Optional solver termination tolerance (`ModelTolerance` otherwise), in seconds of
+            race time for SLSQP.
+
+    A RuntimeWarning is issued if the solver stops without converging or the profile
+    breaks the battery/power limits by more than FEASIBILITY_TOLERANCE.
 
     Returns:
         tuple: (out_df, time_taken)
     """
-    # Extract route data to arrays
-    segment_array = route_df.iloc[:, 0].to_numpy()
-    slope_array = route_df.iloc[:, 2].to_numpy()
-    latitude_array = route_df.iloc[:, 3].to_numpy()
-    longitude_array = route_df.iloc[:, 4].to_numpy()
-    wind_speed = route_df.iloc[:, 5].to_numpy()
-    wind_dir = route_df.iloc[:, 6].to_numpy()
+    if isinstance(ctx, pd.DataFrame):
+        ctx = state.current_context(ctx)
 
     # Initial guess for optimization
-    n_points = len(route_df) + 1
-    v_initial = np.concatenate([[0], np.ones(n_points - 2) * config.InitialGuessVelocity, [0]])
+    n_points = ctx.n_points
+    warm_started = v_initial is not None
+    if v_initial is None and config.UseWarmStartCache:
+        v_initial = warmstart.lookup(ctx)
+        warm_started = v_initial is not None
+    if v_initial is None:
+        v_initial = np.concatenate([[0], np.ones(n_points - 2) * config.InitialGuessVelocity, [0]])
 
     bounds = get_bounds(n_points)
-    constraints = [
-        {
-            "type": "ineq",
-            "fun": battery_acc_constraint_func,
-            "args": (
-                segment_array, slope_array, latitude_array, longitude_array, wind_speed, wind_dir
-            )
-        },
-    ]
-
-    print(f"Starting Optimization (Method: {config.ModelMethod})")
+
+    # Gradient-based methods get the exact Jacobians instead of finite differences
+    use_gradients = config.UseAnalyticGradients and config.ModelMethod in config.GradientMethods
+
+    constraints = build_constraints(ctx, use_gradients)
+
+    print(f"Starting Optimization (Method: {config.ModelMethod}, analytic gradients: {use_gradients}, "
+          f"warm start: {warm_started})")
     print("=" * 60)
 
     # Solver options based on method
     options = {}
     if config.ModelMethod == 'SLSQP':
-        options['verbose'] = 3
+        options['disp'] = True
     elif config.ModelMethod == 'COBYLA':
         options['disp'] = True
+    elif config.ModelMethod == 'trust-constr':
+        options['verbose'] = 1
+    max_iter = config.ModelMaxIter if max_iter is None else max_iter
+    if max_iter is not None:
+        options['maxiter'] = max_iter
 
-    result = minimize(
-        objective, v_initial,
-        args=(segment_array,),
-        bounds=bounds,
-        method=config.ModelMethod,
-        constraints=constraints,
-        options=options
-    )
-    
-    v_optimized = np.array(result.x)
-    time_taken = objective(v_optimized, segment_array)
+    with contextlib.ExitStack() as stack:
+        counters = stack.enter_context(instrumentation.counting())
+        record = None
+        if config.Instrumentation:
+            record = stack.enter_context(instrumentation.recording(
+                start_distance=ctx.start_distance, time_offset=ctx.time_offset, n_points=n_points,
+                method=config.ModelMethod, warm_started=warm_started,
+            ))
+        result = minimize(
+            objective, v_initial,
+            args=(ctx,),
+            jac=objective_jac if use_gradients else None,
+            bounds=bounds,
+            method=config.ModelMethod,
+            constraints=constraints,
+            options=options,
+            tol=config.ModelTolerance if tol is None else tol,
+            callback=None if record is None else _trace_callback(record, ctx),
+        )
+
+        v_optimized = np.array(result.x)
+        time_taken = objective(v_optimized, ctx)
+        if record is not None:
+            record.thermal_iterations = counters.thermal_iterations
+            record.evaluations, record.cache_hits = counters.evaluations, counters.cache_hits
+            record.solver_iterations = int(result.get("nit", len(record.iterations)))
+            record.success, record.message = bool(result.success), str(result.message)
+            record.race_time = time_taken
+
+    feasible = is_feasible(v_optimized, ctx)
+    if not (result.success and feasible):
+        battery_margin, power_margin = battery_acc_constraint_func(v_optimized, ctx)
+        warnings.warn(
+            f"segment at {ctx.start_distance:.0f} m: {result.message} "
+            f"({'feasible' if feasible else 'infeasible'}: battery margin {battery_margin:.3f} Wh, "
+            f"power margin {power_margin:.3f} W)",
+            RuntimeWarning, stacklevel=2,
+        )
 
-    print("done.")
+    if config.UseWarmStartCache and feasible:
+        # Feasible profiles are worth keeping even if the iteration limit stopped the solver
+        warmstart.store(ctx, v_optimized)
+
+    print(f"done. ({result.get('nit', '-')} iterations)")
+    print(f"Thermal solves: {counters.thermal_calls} calls, {counters.thermal_iterations} iterations ({config.ThermalSolver})")
     print(f"Segment Race Time: {time_taken/3600:.4f} hrs")
+    print(f"Evaluation cache: {counters.cache_hits} hits, {counters.evaluations} misses")
 
     # Generate detailed output data
-    profiles = extract_profiles(
-        v_optimized, segment_array, slope_array, latitude_array, longitude_array, wind_speed, wind_dir
-    )
+    profiles = extract_profiles(v_optimized, ctx)
     
     out_df = pd.DataFrame(
         dict(zip(
@@ -79,6 +190,6 @@ def main(route_df: pd.DataFrame) -> tuple[pd.DataFrame, float]:
     return out_df, time_taken
 
 if __name__ == "__main__":
-    outdf, _ = main(state.route_df)
+    outdf, _ = main(make_segment_context(1, 0))
     outdf.to_csv('run_dat.csv', index=False)
     print("Written results to `run_dat.csv`")
\ No newline at end of file
@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import race_config as config
+import model
+from context import SegmentContext, make_segment_context
+from process_route_data import compile_route
+from route_store import RouteStore
+from warmstart import node_distance, prolong
+
+# Raw route aggregated at each group size, built at most once per process
+_levels: dict[int, RouteStore] = {}
+
+def level_route(group_size: int) -> RouteStore:
+    """The raw route (`RawRouteFile`) averaged into rows of `group_size` raw points."""
+    if config.RouteGroupSize % group_size:
+        raise ValueError(f"group size {group_size} must divide RouteGroupSize ({config.RouteGroupSize})")
+    if group_size not in _levels:
+        _levels[group_size] = RouteStore.from_dataframe(compile_route(config.RawRouteFile, group_size))
+    return _levels[group_size]
+
+def level_context(ctx: SegmentContext, index_no: int, group_size: int) -> SegmentContext:
+    """Context of segment `index_no` at another resolution, with the energies/time of `ctx`.
+
+    `DF_WayPoints` index rows of `RouteGroupSize` raw points, so every level splits the
+    route at the same raw points.
+    """
+    if group_size == config.RouteGroupSize:
+        return ctx
+    scale = config.RouteGroupSize // group_size
+    columns = level_route(group_size).rows(config.DF_WayPoints[index_no] * scale,
+                                           config.DF_WayPoints[index_no+1] * scale)
+    return SegmentContext.from_columns(columns, ctx.initial_energy, ctx.final_energy, ctx.time_offset, ctx.day,
+                                       ctx.enforce_final_energy)
+
+def solve_segment(ctx: SegmentContext, index_no: int, v_initial: np.ndarray | None = None
+                  ) -> tuple[pd.DataFrame, float]:
+    """Solves a segment coarse-to-fine over `MultiResolutionLevels`.
+
+    Each level is warm-started from the previous level's solution, interpolated by distance
+    onto the finer grid. The coarser levels stop at `MultiResolutionCoarseTolerance`, as
+    polishing them further does not carry over to the finer grid.
+    A `v_initial` is applied at the level whose grid it matches (e.g. a previous result of
+    this function), skipping the coarser levels; otherwise it is ignored.
+
+    Args:
+        ctx: Segment context at the `processed_route_data.csv` resolution.
+        index_no: Segment (waypoint) index, used to cut the finer routes.
+        v_initial: Optional warm-start velocity profile.
+
+    Returns:
+        tuple: (out_df, time_taken) of the finest level
+    """
+    contexts = [level_context(ctx, index_no, g) for g in config.MultiResolutionLevels]
+
+    first = 0
+    if v_initial is not None:
+        matching = [i for i, c in enumerate(contexts) if c.n_points == len(v_initial)]
+        if matching:
+            first = matching[-1]
+        else:
+            v_initial = None
+
+    for i in range(first, len(contexts)):
+        if i > first:
+            v_initial = prolong(out_df['Velocity'].to_numpy(), node_distance(contexts[i-1]), contexts[i])
+        start = time.perf_counter()
+        max_iter = config.MultiResolutionMaxIter if i > first else None
+        tol = config.MultiResolutionCoarseTolerance if i < len(contexts) - 1 else None
+        out_df, time_taken = model.main(contexts[i], v_initial, max_iter, tol)
+        print(f"Level {config.MultiResolutionLevels[i]} ({contexts[i].n_points} nodes): "
+              f"{time_taken/3600:.4f} hrs in {time.perf_counter() - start:.2f} s")
+
+    return out_df, time_taken
+
+if __name__ == "__main__":
+    outdf, _ = solve_segment(make_segment_context(1, 0), 0)
+    outdf.to_csv('run_dat.csv', index=False)
+    print("Written results to `run_dat.csv`")
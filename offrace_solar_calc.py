@@ -1,38 +1,125 @@
 import numpy as np
-from scipy.integrate import quad
+from scipy.special import erf
+import race_config as config
 from race_config import PanelArea, PanelEfficiency, RaceStartTime, RaceEndTime
+from solar import _calc_solar_irradiance, _PEAK_IRRADIANCE, _SOLAR_NOON, _IRRADIANCE_WIDTH, incident_solarpower_at
 
 # Constants
 DT = RaceEndTime - RaceStartTime
 _power_coeff = PanelArea * PanelEfficiency
 
-def _calc_solar_irradiance(time: float) -> float:
-    """Calculates solar irradiance at a given time using a Gaussian model."""
-    return 1073.099 * np.exp(-0.5 * ((time - 43200) / 11600)**2)
-
-def calculate_incident_solarpower(globaltime: float, latitude: float, longitude: float) -> float:
-    """Calculates incident solar power in Wh at a specific global time."""
-    gt = globaltime % DT
-    intensity = _calc_solar_irradiance(RaceStartTime + gt)
-    return intensity * _power_coeff / 3600
+# Composite Gauss-Legendre rule for the location/time dependent solar models: every interval is
+# split into equal panels of at most _QUADRATURE_PANEL seconds with _QUADRATURE_ORDER nodes each
+_QUADRATURE_PANEL = 600  # s
+_QUADRATURE_ORDER = 5
+_nodes, _weights = np.polynomial.legendre.leggauss(_QUADRATURE_ORDER)
 
 def integrand(t: float) -> float:
     """Integrand function for energy calculation (Solar Power in Wh)."""
     intensity = _calc_solar_irradiance(t)
     return intensity * _power_coeff / 3600
 
-def calculate_energy(interval_start: float, interval_end: float) -> float:
-    """Calculates total solar energy in Wh generated between two time stamps.
+def calculate_energy(interval_start: float | np.ndarray, interval_end: float | np.ndarray, day: int | np.ndarray = 0,
+                     latitude: float | np.ndarray | None = None,
+                     longitude: float | np.ndarray | None = None) -> float | np.ndarray:
+    """Calculates total solar energy in Wh generated between two local times of day.
+
+    The configured `SolarModel` is integrated: the Gaussian irradiance of
+    `solar._calc_solar_irradiance` in closed form, the geometric and forecast models (which
+    need the position) by quadrature. Arrays of intervals are evaluated in one call.
+
+    Args:
+        interval_start: Start time(s) in seconds after midnight.
+        interval_end: End time(s) in seconds after midnight (broadcast against interval_start).
+        day: Race day(s), 0 for `RaceDate`.
+        latitude: Latitude(s) of the car, required by the geometric and forecast models.
+        longitude: Longitude(s) of the car, required by the geometric and forecast models.
+
+    Returns:
+        Total energy in Wh (a float for scalar inputs, else an array).
+    """
+    if config.SolarModel == "gaussian":
+        energy = _energy_since_midnight(np.asarray(interval_end)) - _energy_since_midnight(np.asarray(interval_start))
+    else:
+        if latitude is None or longitude is None:
+            raise ValueError(f'SolarModel "{config.SolarModel}" needs the latitude and longitude of the car')
+        energy = _quadrature(interval_start, interval_end, day, latitude, longitude)
+    return float(energy) if np.ndim(energy) == 0 else energy
+
+def _energy_since_midnight(time_of_day: np.ndarray) -> np.ndarray:
+    """Antiderivative (Wh) of `integrand`, up to a constant."""
+    scale = _IRRADIANCE_WIDTH * np.sqrt(2)
+    coeff = _PEAK_IRRADIANCE * _power_coeff / 3600 * _IRRADIANCE_WIDTH * np.sqrt(np.pi / 2)
+    return coeff * erf((time_of_day - _SOLAR_NOON) / scale)
+
+def _quadrature(interval_start, interval_end, day, latitude, longitude) -> np.ndarray:
+    """Energy (Wh) of `solar.incident_solarpower_at` over the intervals, by composite Gauss-Legendre."""
+    start, end, day, latitude, longitude = np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in (interval_start, interval_end, day, latitude, longitude))
+    )
+    n_panels = max(int(np.ceil(np.max(np.abs(end - start), initial=0) / _QUADRATURE_PANEL)), 1)
+    width = (end - start) / n_panels
+    # (..., panel, node) sample times
+    panel_start = start[..., None] + width[..., None] * np.arange(n_panels)
+    t = panel_start[..., None] + (width[..., None, None] / 2) * (_nodes + 1)
+
+    day, latitude, longitude = (np.broadcast_to(a[..., None, None], t.shape).ravel() for a in (day, latitude, longitude))
+    power = incident_solarpower_at(day, t.ravel(), latitude, longitude).reshape(t.shape)
+    return (power @ _weights).sum(axis=-1) * width / 2 / 3600
+
+def calculate_race_energy(race_start: float | np.ndarray, race_end: float | np.ndarray,
+                          latitude: float | np.ndarray | None = None,
+                          longitude: float | np.ndarray | None = None) -> float | np.ndarray:
+    """Calculates total solar energy in Wh generated between two race times (e.g. a control stop).
+
+    Unlike `calculate_energy`, the times are seconds of race time, mapped to the time of day
+    like the solar model does (RaceStartTime + race_time % DT on day race_time // DT);
+    intervals may span the end of a race day.
 
     Args:
-        interval_start: Start time in seconds.
-        interval_end: End time in seconds.
+        race_start: Start race time(s) in seconds.
+        race_end: End race time(s) in seconds (broadcast against race_start).
+        latitude: Latitude(s) of the car, required by the geometric and forecast models.
+        longitude: Longitude(s) of the car, required by the geometric and forecast models.
 
     Returns:
-        Total energy in Wh.
+        Total energy in Wh (a float for scalar inputs, else an array).
+    """
+    race_start, race_end = np.broadcast_arrays(np.asarray(race_start, dtype=float), np.asarray(race_end, dtype=float))
+    first_day = np.minimum(race_start, race_end) // DT
+    n_days = int(np.max(np.maximum(race_start, race_end) // DT - first_day, initial=0)) + 1
+
+    energy = np.zeros(race_start.shape)
+    for k in range(n_days):
+        day = first_day + k
+        # Part of the interval on race day `day` (empty on days it does not reach)
+        start_in_day = np.clip(race_start - day * DT, 0, DT)
+        end_in_day = np.clip(race_end - day * DT, 0, DT)
+        energy = energy + calculate_energy(RaceStartTime + start_in_day, RaceStartTime + end_in_day, day,
+                                           latitude, longitude)
+    return float(energy) if np.ndim(energy) == 0 else energy
+
+def race_energy_rate(race_time: float | np.ndarray, latitude: float | np.ndarray | None = None,
+                     longitude: float | np.ndarray | None = None) -> float | np.ndarray:
+    """Derivative of `calculate_race_energy` with respect to its end time, in Wh/s."""
+    race_time = np.asarray(race_time, dtype=float)
+    if config.SolarModel == "gaussian":
+        return integrand(RaceStartTime + race_time % DT)
+    if latitude is None or longitude is None:
+        raise ValueError(f'SolarModel "{config.SolarModel}" needs the latitude and longitude of the car')
+    day, latitude, longitude = np.broadcast_arrays(race_time // DT, latitude, longitude)
+    return incident_solarpower_at(day, RaceStartTime + race_time % DT, latitude, longitude) / 3600
+
+def overnight_energy(arrival: float | np.ndarray, latitude: float | np.ndarray | None = None,
+                     longitude: float | np.ndarray | None = None) -> float | np.ndarray:
+    """Energy in Wh collected at an overnight stop reached at race time(s) `arrival`.
+
+    Strategy: charge between 5 PM - 6 PM on the arrival day and 5 AM - 8 AM the next morning.
     """
-    energy, _ = quad(integrand, interval_start, interval_end)
-    return energy
+    day = np.asarray(arrival, dtype=float) // DT
+    energy = np.broadcast_to(calculate_energy(17 * 3600, 18 * 3600, day, latitude, longitude)
+                             + calculate_energy(5 * 3600, 8 * 3600, day + 1, latitude, longitude), day.shape)
+    return float(energy) if np.ndim(energy) == 0 else energy
 
 if __name__ == '__main__':
     # Diagnostic check for energy generation
@@ -4,7 +4,9 @@ import plotly.graph_objs as go
 import pandas as pd
 import numpy as np
 
-import config
+import race_config as config
+from run_store import RUN_COLUMNS, load_output
+import battery_analytics
 
 # Custom CSS styles
 custom_styles = {
@@ -28,51 +30,36 @@ def create_app(
     ):
     app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 
-    # Calculate the derivative of the energy consumption profile and scale it
-    energy_consumption_derivative_scaled = abs(np.gradient(energy_consumption_profile)/305.5)
+    # C-rate of the battery current over every step, and the time spent in each C-rate bin
+    runs = battery_analytics.RunBatch.from_frames({'run': pd.DataFrame({
+        'Time': time, 'EnergyConsumption': energy_consumption_profile, 'Solar': solar_profile, 'Battery': battery_profile,
+    })})
+    c_rate_profile = battery_analytics.c_rate(runs)
+    residency = battery_analytics.c_rate_residency(runs)[0]
 
     app.layout = html.Div([
-        # Your existing layout code...
-        # Add a new graph for the scaled derivative of energy consumption profile
         dcc.Graph(
             id='C_rate-profile',
             figure={
-                'data': [go.Scatter(x=distances[1:], y=energy_consumption_derivative_scaled[1:], mode='lines+markers', name='Energy Consumption Derivative')],
-                'layout': go.Layout(title='C_rate-profile', xaxis={'title': 'Distance'}, yaxis={'title': 'C_rate-profile'})
+                'data': [go.Scatter(x=distances[1:], y=c_rate_profile[1:], mode='lines+markers', name='C-rate')],
+                'layout': go.Layout(title='C_rate-profile', xaxis={'title': 'Distance'}, yaxis={'title': 'C-rate (1/h)'})
             },
             style={'width': '45%', 'display': 'inline-block', **custom_styles}
         ),
-        # Your existing layout code...
+        html.Div([
+            html.H2("Time Spent in Each C-rate Interval", style={'text-align': 'center', 'font-family': '"Space Grotesk", sans-serif'}),
+            html.Ul([html.Li(f"C {label}: {hours:.3f} hrs") for label, hours in zip(battery_analytics.bin_labels(config.CRateBins), residency)])
+        ], style={'width': '25%', 'display': 'inline-block', 'vertical-align': 'top', **custom_styles}),
     ], style={'background-color': '#ffffff', 'padding': '20px'})
-    intervals = [
-    (0,0.05),
-    (0.05,0.1),
-    (0.1,0.15),
-    (0.15, 0.2),
-    (0.2,0.25),
-    (0.25, 0.3),
-    (0.3, 0.4)]
-    def classify_value(value):
-        for i, (low, high) in enumerate(intervals):
-            if low < value <= high:
-                return i + 1
-        return 1  # Return -1 if no interval is found, should not happen with defined intervals
-    classified_data = np.zeros_like(energy_consumption_derivative_scaled, dtype=int)
-    vectorized_classify_value = np.vectorize(classify_value)
-
-# Classify all data points
-    classified_data = vectorized_classify_value(energy_consumption_derivative_scaled)
-
-    print(classified_data)
-        # Output the lengths of each interval
-    interval_lengths = [(classified_data == i).sum() for i in range(1, len(intervals) + 1)]
-    for i, length in enumerate(interval_lengths):
-        print(f"Interval {intervals[i]}: {length*0.081}  in hours")
+
+    for label, hours in zip(battery_analytics.bin_labels(config.CRateBins), residency):
+        print(f"Interval C {label}: {hours:.3f} in hours")
     return app
 
 if __name__ == '__main__':
-    output = pd.read_csv("run_dat.csv")
-    distances, velocity_profile, acceleration_profile, battery_profile, energy_consumption_profile, solar_profile, time = map(np.array, (output[c] for c in output.columns.to_list()))
+    # The run store if present, else run_dat.csv
+    output = load_output(columns=list(RUN_COLUMNS))
+    distances, velocity_profile, acceleration_profile, battery_profile, energy_consumption_profile, solar_profile, time = map(np.array, (output[c] for c in RUN_COLUMNS))
 
     distances = distances.cumsum()
     # time = time.cumsum()
@@ -81,7 +68,7 @@ if __name__ == '__main__':
         distances, velocity_profile, acceleration_profile, battery_profile,
         energy_consumption_profile, solar_profile, time
     )
-    app.run_server(debug=True)
+    app.run(debug=True)
 # import dash
 # from dash import dcc, html
 # import plotly.graph_objs as go
@@ -1,28 +1,86 @@
 import pandas as pd
 import numpy as np
 
-# Load the data from the CSV file
-data = pd.read_csv("processed_route_data_shayan.csv")
+import race_config as config
 
-# Define the number of rows to group for calculating the mean
-group_size = 600 
-outdf = pd.DataFrame(columns=data.columns)
-row_counter = 0
+def _group_starts(step_distance: np.ndarray, group_size: int | None, segment_length: float | None,
+                  start_distance: float = 0.0) -> np.ndarray:
+    """Index of the first raw point of every group.
 
-for i in range(0, len(data), group_size):
-    batch = data[i:(i+group_size)]
-    sd, cd, s, lat, long,windspeed,winddir = map(np.array, (batch[c] for c in data.columns.to_list()))
+    Fixed-size groups take `group_size` consecutive points; length-based groups take every
+    point that starts within the same `segment_length` metres of the route.
+    """
+    if segment_length is None:
+        return np.arange(0, len(step_distance), group_size)
+    point_start = start_distance + np.cumsum(step_distance) - step_distance
+    bins = np.floor(point_start / segment_length)
+    return np.flatnonzero(np.diff(bins, prepend=bins[0] - 1))
 
-    new_step = sd.sum()
-    relelevation = (sd * np.tan(np.radians(s))).sum()
+def _aggregate_groups(columns: list[np.ndarray], starts: np.ndarray) -> list[np.ndarray]:
+    """Aggregates the raw route columns over the groups beginning at `starts`.
 
-    outdf.loc[row_counter] = [
-        new_step, cd[-1], np.degrees(np.arctan(relelevation/new_step)), lat.mean(), long.mean(),
-        windspeed.mean(), winddir.mean()
+    Step distances are summed, the slope is taken from the summed rise over the summed run,
+    and latitude/longitude/wind are averaged. The cumulative distance is that of the last
+    point of each group.
+    """
+    sd, cd, s, lat, long, windspeed, winddir = columns
+    counts = np.diff(np.append(starts, len(sd)))
+
+    new_step = np.add.reduceat(sd, starts)
+    relelevation = np.add.reduceat(sd * np.tan(np.radians(s)), starts)
+
+    return [
+        new_step, cd[starts + counts - 1], np.degrees(np.arctan(relelevation / new_step)),
+        *(np.add.reduceat(c, starts) / counts for c in (lat, long, windspeed, winddir)),
     ]
-    row_counter += 1
 
-# Save the result to a new CSV file
-outdf.to_csv("processed_route_data.csv", index=False)
+def aggregate_route(data: pd.DataFrame, group_size: int | None = None,
+                    segment_length: float | None = None) -> pd.DataFrame:
+    """Averages an in-memory raw route into rows of `group_size` raw points or `segment_length` metres."""
+    columns = [data.iloc[:, i].to_numpy(dtype=np.float64) for i in range(7)]
+    starts = _group_starts(columns[0], group_size, segment_length)
+    return pd.DataFrame(dict(zip(data.columns[:7], _aggregate_groups(columns, starts))))
+
+def compile_route(path: str, group_size: int | None = None, segment_length: float | None = None,
+                  chunksize: int = 1_000_000) -> pd.DataFrame:
+    """Aggregates a raw route CSV read in chunks, so the raw file never has to fit in memory.
+
+    Exactly one of `group_size` (raw points per row) or `segment_length` (metres per row)
+    must be given. The last, possibly incomplete, group of every chunk is carried over to
+    the next one, so the result does not depend on `chunksize` (up to rounding of the
+    running distance at length-based group edges).
+    """
+    if (group_size is None) == (segment_length is None):
+        raise ValueError("give exactly one of group_size or segment_length")
+
+    header, pieces = None, []
+    carry: list[np.ndarray] | None = None
+    carry_distance = 0.0  # route distance before the first carried-over point (m)
+
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        header = chunk.columns[:7]
+        columns = [chunk.iloc[:, i].to_numpy(dtype=np.float64) for i in range(7)]
+        if carry is not None:
+            columns = [np.concatenate([a, b]) for a, b in zip(carry, columns)]
+
+        starts = _group_starts(columns[0], group_size, segment_length, carry_distance)
+        last = starts[-1]
+        if last > 0:
+            pieces.append(_aggregate_groups([c[:last] for c in columns], starts[:-1]))
+        carry = [c[last:] for c in columns]
+        carry_distance += columns[0][:last].sum()
+
+    if header is None:
+        raise ValueError(f"{path} has no route data")
+    pieces.append(_aggregate_groups(carry, np.array([0])))
+
+    return pd.DataFrame({name: np.concatenate([p[i] for p in pieces]) for i, name in enumerate(header)})
+
+if __name__ == "__main__":
+    # Define the number of rows to group for calculating the mean
+    outdf = compile_route(config.RawRouteFile, group_size=config.RouteGroupSize)
+
+    # Save the result to a new CSV file
+    outdf.to_csv("processed_route_data.csv", index=False)
 
-print("Processed data saved to 'processed_route_data.csv'")
+    print("Processed data saved to 'processed_route_data.csv'")
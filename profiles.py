@@ -1,52 +1,53 @@
 import numpy as np
 
 from race_config import BatteryCapacity
-import state
-from car import calculate_dt, calculate_power
-from solar import calculate_incident_solarpower
-
-def extract_profiles(velocity_profile: np.ndarray, segment_array: np.ndarray, 
-                     slope_array: np.ndarray, latitude_array: np.ndarray, 
-                     longitude_array: np.ndarray, winds_array: np.ndarray, 
-                     winddir_array: np.ndarray) -> list[np.ndarray]:
+from car import CarParams
+from context import SegmentContext
+from evaluation import evaluate, evaluate_batch
+
+def extract_profiles(velocity_profile: np.ndarray, ctx: SegmentContext,
+                     car: CarParams | None = None) -> list[np.ndarray]:
     """Extracts detailed simulation profiles for plotting and analysis.
 
+    With a batched `car` (`CarParams.sweep`) the battery, energy and solar profiles get a
+    leading (K,) axis, e.g. battery_levels[k] is the battery trace of variant k.
+
     Returns:
         list of np.ndarray: [distances, velocities, accelerations, battery_levels, 
                             energy_consumptions, solar_gains, time_stamps]
     """
-    v_start, v_stop = velocity_profile[:-1], velocity_profile[1:]
-    avg_speed = (v_start + v_stop) / 2
-    
-    # Calculate intervals
-    dt = calculate_dt(v_start, v_stop, segment_array)
-    acceleration = (v_stop - v_start) / dt
-
-    # Power and solar calculations
-    net_power, _ = calculate_power(avg_speed, acceleration, slope_array, winds_array, winddir_array)
-    solar_power = calculate_incident_solarpower(
-        dt.cumsum() + state.TimeOffset, latitude_array, longitude_array
-    )
+    if car is None:
+        # Served from the evaluation cache when the solver already evaluated this profile
+        ev = evaluate(velocity_profile, ctx)
+        capacity = BatteryCapacity
+    else:
+        ev = evaluate_batch(velocity_profile, ctx, car)
+        capacity = car.battery_capacity
+    dt, acceleration, net_power, solar_power = ev.dt, ev.acceleration, ev.net_power, ev.solar_power
 
     energy_consumption = net_power * dt / 3600
     solar_gain = solar_power * dt / 3600
 
-    net_energy_delta = energy_consumption.cumsum() - solar_gain.cumsum()
+    net_energy_delta = energy_consumption.cumsum(axis=-1) - solar_gain.cumsum(axis=-1)
     
-    battery_charge_wh = state.InitialBatteryCapacity - net_energy_delta
-    battery_levels = np.concatenate(([state.InitialBatteryCapacity], battery_charge_wh))
+    battery_charge_wh = ctx.initial_energy - net_energy_delta
+    battery_levels = _prepend(ctx.initial_energy, battery_charge_wh)
 
     # Convert to percentage
-    battery_percent = battery_levels * 100 / BatteryCapacity
+    battery_percent = battery_levels * 100 / capacity
 
-    dist_points = np.append([0], segment_array)
+    dist_points = np.append([0], ctx.segments)
 
     return [
         dist_points,
         velocity_profile,
-        np.concatenate(([np.nan], acceleration)),
+        _prepend(np.nan, acceleration),
         battery_percent,
-        np.concatenate(([np.nan], energy_consumption)),
-        np.concatenate(([np.nan], solar_gain)),
-        np.concatenate(([0], dt.cumsum())) + state.TimeOffset,
-    ]
\ No newline at end of file
+        _prepend(np.nan, energy_consumption),
+        _prepend(np.nan, solar_gain),
+        _prepend(0, dt.cumsum(axis=-1)) + ctx.time_offset,
+    ]
+
+def _prepend(value: float, profile: np.ndarray) -> np.ndarray:
+    """`profile` with `value` inserted before its first node (along the last axis)."""
+    return np.concatenate((np.full(profile.shape[:-1] + (1,), value), profile), axis=-1)
\ No newline at end of file
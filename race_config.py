@@ -49,15 +49,141 @@ DayEnd_WayPoints = [109, 213, 308, 415, 520]
 
 # ---------------------------------------------------------------------------------------------------------
 # Simulation Settings
-ModelMethod = "COBYLA"
+ModelMethod = "SLSQP"
+# Exact objective/constraint Jacobians are passed to the solver for these methods
+# (COBYLA is derivative-free and ignores them).
+UseAnalyticGradients = True
+GradientMethods = ("SLSQP", "trust-constr")
+# "scalar": battery/power constraints collapsed to their worst node (min/max)
+# "vector": one battery and one power margin per node, with a sparse Jacobian
+ConstraintMode = "vector"
+# Iteration limit of the segment solves (None: the scipy default of ModelMethod, 100 for SLSQP)
+ModelMaxIter = 300
+# Termination tolerance of the segment solves (None: the scipy default of ModelMethod; for SLSQP
+# 1e-6 s of race time, most iterations are then spent on sub-second changes)
+ModelTolerance = None
+# Require each segment to finish at the next BatteryLevelWayPoints level (final_battery_constraint_func)
+EnforceWaypointBattery = False
+# Winding temperature solver in car.calculate_power: "newton" or the original "fixed_point"
+ThermalSolver = "newton"
 InitialGuessVelocity = 25
 
+# Irradiance model in solar.py: the location-blind "gaussian", the "geometric" sun position
+# model of accurate_solarprofile.py (latitude/longitude and day of year dependent) or the
+# "forecast" GHI of forecast_index.py (position and time dependent)
+SolarModel = "gaussian"
+RaceDate = "2023-10-22"  # first race day (ISO date), used by the geometric and forecast models
+RaceUtcOffset = 9.5 * 3600  # s, race clock ahead of UTC (ACST); sets the geometric model's standard meridian and matches forecast time stamps
+
 RaceStartTime = 8 * 3600  # 8:00 am
 RaceEndTime = (17) * 3600  # 5:00 pm
 DT = RaceEndTime - RaceStartTime
 
 CONTROL_STOP_DURATION = 30 * 60
 
+# Parallel full-race runner (fullmodelrunner.main_parallel)
+ParallelSegments = False
+ParallelWorkers = None  # None: one per CPU
+ParallelTimeTolerance = 30  # s, re-solve a segment if its start time moved more than this
+ParallelEnergyTolerance = 1  # Wh, re-solve a segment if its carried-over stop energy moved more than this
+
+# Whole-race joint optimization (joint_model.main), solved with trust-constr on the transcribed
+# problem (speeds, times and battery energies as variables, sparse Jacobians)
+JointMaxIter = 500
+
+# Automatic BatteryLevelWayPoints allocation (waypoint_search.main)
+WaypointSearchStep = 0.05  # initial change of a waypoint level (fraction of capacity)
+WaypointSearchMinStep = 0.005  # stop once the step has shrunk below this
+WaypointSearchMaxIter = 40
+WaypointSearchWorkers = None  # None: one per CPU
+WaypointSearchPenalty = 3600  # s of race time per % of battery below a waypoint/safe level
+
+# Coarse-to-fine solving on the raw route (multires.solve_segment)
+RawRouteFile = "processed_route_data_shayan.csv"
+RouteGroupSize = 600  # raw points per row of processed_route_data.csv (process_route_data.py)
+MultiResolution = False
+MultiResolutionLevels = (600, 150, 30)  # raw points per row, coarse to fine; each must divide RouteGroupSize
+MultiResolutionMaxIter = None  # iteration limit of the warm-started refinement levels (None: ModelMaxIter)
+# Termination tolerance of the coarser levels (s of race time), which only provide warm starts;
+# the finest level uses ModelTolerance
+MultiResolutionCoarseTolerance = 0.1
+
+# Monte Carlo weather ensemble over a fixed plan (ensemble.main)
+EnsembleScenarios = 10000
+EnsembleSeed = 0
+EnsembleChunkSize = 500  # scenarios evaluated per vectorized call
+EnsembleWorkers = None  # None: one per CPU, 1: in-process
+EnsembleWindSpeedStd = 0.2  # relative
+EnsembleWindDirStd = 20  # deg
+EnsembleIrradianceStd = 0.1  # relative
+
+# Forecast ingestion (forecast_ingest.py); the API key is read from the ForecastApiKeyEnv environment variable
+ForecastApiUrl = "https://api.solcast.com.au/data/forecast/radiation_and_weather"
+ForecastApiKeyEnv = "SOLCAST_API_KEY"
+ForecastGridResolution = 0.1  # deg, route points in the same cell share one request
+ForecastHours = 168
+ForecastPeriod = "PT30M"
+ForecastIssueInterval = 3600  # s, a cell is downloaded again once per issue interval
+ForecastWorkers = 16  # concurrent requests / pooled connections
+ForecastTimeout = 30  # s per request
+ForecastCacheDir = ".forecast_cache"
+ForecastFile = "route_forecast.npz"
+
+# Forecast lookup (forecast_index.py): evaluate wind (and GHI, with SolarModel = "forecast") at
+# the time the car reaches every node, from an ingested .npz or a route .csv (time-independent)
+ForecastIndexSource = ForecastFile
+UseForecastWind = False
+
+# On-disk cache of optimized velocity profiles used to warm-start model.main (warmstart.py).
+# Off by default: with it, results depend on the solves run before (entries are only shared
+# between runs with the same car/model/solver settings and forecast file).
+UseWarmStartCache = False
+WarmStartDir = ".warmstart_cache"
+WarmStartMaxEntries = 200  # least recently used profiles are evicted beyond this
+
+# Structured solver instrumentation (instrumentation.py): per-solve call counts/times, thermal
+# iterations and convergence trace, written as JSON lines; fullmodelrunner adds a per-race summary.
+# Off by default; fullmodelrunner's main/main_parallel switch it on (with RunStream and WriteRunStore)
+Instrumentation = False
+InstrumentationFile = "solver_events.jsonl"
+
+# Dashboard rendering (dashboard.py / downsample.py): points sent per series at the current zoom level
+DashboardMaxPoints = 2000
+DashboardDownsampleMethod = "lttb"  # "lttb" (shape preserving) or "minmax" (first/last/min/max per bucket)
+
+# Incremental run stream (run_stream.py): fullmodelrunner appends every solved segment (and, with
+# RunStreamIterations and Instrumentation, every solver iteration) as JSON lines; `dashboard.py --live` tails it
+RunStream = False  # on in fullmodelrunner main/main_parallel
+RunStreamFile = "run_stream.jsonl"
+RunStreamIterations = False
+DashboardRefreshInterval = 1000  # ms between polls of the run stream
+
+# Run store (run_store.py): fullmodelrunner writes every solved segment as it finishes, as a binary
+# .npz chunk plus its metadata (waypoints, battery targets, solver status); run_dat.csv is still written
+WriteRunStore = False  # on in fullmodelrunner main/main_parallel
+RunStoreDir = "run_dat.run"
+
+# Battery stress analytics (battery_analytics.py): upper bin edges and peak-power windows
+CRateBins = (0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4)  # 1/h, battery current / capacity; above the last edge is one more bin
+DoDBins = (5, 10, 20, 40, 60, 80)  # % state of charge lost per discharge swing
+PeakPowerWindows = (300, 900, 1800, 3600)  # s of driving time
+
+# Live receding-horizon re-planning (live_replan.py): telemetry JSON lines are read from a file
+# that is tailed or from a "tcp://host:port" address; every update re-plans the current segment
+LiveTelemetrySource = "telemetry.jsonl"
+LivePlanFile = "live_plan.csv"
+LiveLatencyBudget = 3.0  # s per update, the fastest feasible plan found so far is used after that
+LivePollInterval = 0.2  # s
+
+# Benchmark suite (benchmark.py): synthetic route sizes (velocity nodes) and regression thresholds
+BenchmarkSizes = (50, 500, 5000, 50000)
+BenchmarkSolverSizes = (50, 200, 500)  # SLSQP works on dense copies of the Jacobians, O(nodes^2)
+BenchmarkSolverMaxIter = 20
+BenchmarkBaselineFile = "benchmark_baselines.json"
+BenchmarkTimeTolerance = 0.5  # relative slow-down flagged as a regression (best-of-N times still vary this much)
+BenchmarkMinTimeDifference = 0.001  # s, smaller slow-downs are timer noise
+BenchmarkMemoryTolerance = 0.10  # relative
+
 # Car Constraints
 MaxVelocity = 35 # m/s
 MaxCurrent = 12.3  # Am
@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import race_config as config
+
+# Names of the leading columns of a `processed_route_data.csv`-style file, in file order
+ROUTE_COLUMNS = (
+    "step_distance",  # m
+    "cumulative_distance",  # km
+    "slope",  # deg
+    "latitude",
+    "longitude",
+    "wind_speed",  # m/s
+    "wind_dir",  # deg
+)
+
+# One store per file per process (worker processes forked after loading share the pages)
+_stores: dict[str, "RouteStore"] = {}
+
+class RouteStore:
+    """Route data held as named, contiguous float64 columns.
+
+    Segment access returns views into the columns, so no data is copied per segment.
+    Columns beyond `ROUTE_COLUMNS` (e.g. GHI/WIND_* in updated_route_data.csv) are kept
+    under their CSV header names.
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray], csv_header: list[str]):
+        self._columns = {}
+        for name, values in columns.items():
+            array = np.ascontiguousarray(values, dtype=np.float64)
+            array.flags.writeable = False
+            self._columns[name] = array
+        self.csv_header = list(csv_header)
+
+    def __len__(self) -> int:
+        return len(next(iter(self._columns.values())))
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name]
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._columns)
+
+    def rows(self, start: int, stop: int) -> dict[str, np.ndarray]:
+        """Views of every column for rows [start, stop)."""
+        return {name: values[start:stop] for name, values in self._columns.items()}
+
+    def segment(self, index_no: int) -> dict[str, np.ndarray]:
+        """Views of every column for segment `index_no` between `DF_WayPoints`."""
+        return self.rows(config.DF_WayPoints[index_no], config.DF_WayPoints[index_no+1])
+
+    def to_dataframe(self, start: int | None = None, stop: int | None = None) -> pd.DataFrame:
+        """Rows [start, stop) as a DataFrame with the original CSV headers."""
+        return pd.DataFrame({
+            header: self._columns[name][start:stop]
+            for header, name in zip(self.csv_header, self._columns)
+        })
+
+    @classmethod
+    def from_csv(cls, path: str) -> "RouteStore":
+        return cls.from_dataframe(pd.read_csv(path))
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "RouteStore":
+        """Store over a DataFrame in the `processed_route_data.csv` column layout."""
+        names = list(ROUTE_COLUMNS) + list(df.columns[len(ROUTE_COLUMNS):])
+        return cls(
+            {name: df.iloc[:, i].to_numpy(dtype=np.float64) for i, name in enumerate(names)},
+            list(df.columns),
+        )
+
+    @classmethod
+    def from_npz(cls, path: str) -> "RouteStore":
+        with np.load(path) as data:
+            csv_header = [str(h) for h in data["_csv_header"]]
+            return cls({name: data[name] for name in data.files if name != "_csv_header"}, csv_header)
+
+    def save_npz(self, path: str) -> None:
+        """Writes an uncompressed .npz that `from_npz` loads without any parsing."""
+        np.savez(path, _csv_header=np.array(self.csv_header), **self._columns)
+
+def compiled_path(csv_path: str) -> str:
+    """Location of the compiled binary copy of a route CSV."""
+    return os.path.splitext(csv_path)[0] + ".route.npz"
+
+def load_route(csv_path: str = "processed_route_data.csv") -> RouteStore:
+    """Returns the route store for a CSV, loading it at most once per process.
+
+    The CSV is compiled to a binary `.route.npz` next to it on first use and re-compiled
+    whenever the CSV is newer than the compiled file.
+    """
+    key = os.path.abspath(csv_path)
+    if key in _stores:
+        return _stores[key]
+
+    npz_path = compiled_path(csv_path)
+    if os.path.exists(npz_path) and os.path.getmtime(npz_path) >= os.path.getmtime(csv_path):
+        store = RouteStore.from_npz(npz_path)
+    else:
+        store = RouteStore.from_csv(csv_path)
+        try:
+            store.save_npz(npz_path)
+        except OSError:
+            pass  # read-only checkout: keep the parsed copy in memory only
+
+    _stores[key] = store
+    return store
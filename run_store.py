@@ -0,0 +1,130 @@
+import glob
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import race_config as config
+
+# Output columns of a segment solve (`model.main`), in `run_dat.csv` order
+RUN_COLUMNS = ('CumulativeDistance', 'Velocity', 'Acceleration', 'Battery', 'EnergyConsumption', 'Solar', 'Time')
+
+_METADATA_FILE = "metadata.json"
+
+def config_hash() -> str:
+    """Hash of every plain setting in `race_config` (numbers, strings, lists...)."""
+    settings = {
+        name: value for name, value in sorted(vars(config).items())
+        if not name.startswith("_") and isinstance(value, (bool, int, float, str, list, tuple, dict, type(None)))
+    }
+    return hashlib.blake2b(repr(settings).encode(), digest_size=12).hexdigest()
+
+def _chunk_name(segment: int) -> str:
+    return f"segment_{segment:03d}.npz"
+
+class RunWriter:
+    """Writes a run store while the race is solved: one `.npz` chunk per segment plus `metadata.json`.
+
+    Chunks and metadata are replaced atomically, so after a crash the store still holds
+    every segment finished before it. Writing a segment again (a re-solve) replaces it.
+    """
+
+    def __init__(self, path: str, n_segments: int, **metadata):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        for chunk in glob.glob(os.path.join(path, "segment_*.npz")):
+            os.remove(chunk)  # previous run
+        self.metadata = {
+            "created": time.time(),
+            "config_hash": config_hash(),
+            "n_segments": n_segments,
+            "columns": list(RUN_COLUMNS),
+            "complete": False,
+            **metadata,
+            "segments": {},
+        }
+        self._write_metadata()
+
+    def write_segment(self, segment: int, segment_df: pd.DataFrame, **metadata) -> None:
+        """Stores a solved segment's output rows; `metadata` is kept with it (solver status, targets...)."""
+        chunk = os.path.join(self.path, _chunk_name(segment))
+        tmp_path = chunk + f".{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **{name: segment_df[name].to_numpy(dtype=np.float64) for name in segment_df.columns})
+        os.replace(tmp_path, chunk)
+
+        self.metadata["segments"][str(segment)] = {"file": _chunk_name(segment), "rows": len(segment_df), **metadata}
+        self._write_metadata()
+
+    def finish(self, **metadata) -> None:
+        """Marks the run complete, e.g. with its total race time."""
+        self.metadata.update(metadata, complete=True)
+        self._write_metadata()
+
+    def _write_metadata(self) -> None:
+        path = os.path.join(self.path, _METADATA_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.metadata, f, indent=2)
+        os.replace(tmp_path, path)
+
+class RunStore:
+    """Read access to a run store written by `RunWriter`.
+
+    Only the requested columns of the requested segments are read from disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, _METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+
+    @property
+    def segments(self) -> list[int]:
+        """Indices of the stored segments, in route order."""
+        return sorted(int(segment) for segment in self.metadata["segments"])
+
+    def segment_metadata(self, segment: int) -> dict:
+        return self.metadata["segments"][str(segment)]
+
+    def load(self, columns: list[str] | None = None, segments: list[int] | None = None) -> dict[str, np.ndarray]:
+        """Columns of the given segments (default: all stored), concatenated in route order."""
+        columns = list(columns or self.metadata["columns"])
+        parts = {name: [] for name in columns}
+        for segment in sorted(self.segments if segments is None else segments):
+            with np.load(os.path.join(self.path, self.segment_metadata(segment)["file"])) as chunk:
+                for name in columns:
+                    parts[name].append(chunk[name])
+        return {name: np.concatenate(values) if values else np.empty(0) for name, values in parts.items()}
+
+    def to_dataframe(self, columns: list[str] | None = None, segments: list[int] | None = None) -> pd.DataFrame:
+        return pd.DataFrame(self.load(columns, segments))
+
+def latest_output(csv_path: str = "run_dat.csv") -> str:
+    """The more recently written of the run store (`RunStoreDir`) and `csv_path`."""
+    metadata_path = os.path.join(config.RunStoreDir, _METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return csv_path
+    if os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(metadata_path):
+        return csv_path
+    return config.RunStoreDir
+
+def load_output(path: str | None = None, columns: list[str] | None = None,
+                segments: list[int] | None = None) -> pd.DataFrame:
+    """Race output from a run store directory or a `run_dat.csv`-style file.
+
+    Args:
+        path: Store directory or CSV (default: whichever of `RunStoreDir` and `run_dat.csv`
+            was written last, as runners such as `joint_model` only write the CSV).
+        columns: Columns to load (default: all).
+        segments: Segments to load (default: all); needs a run store.
+    """
+    if path is None:
+        path = latest_output()
+    if os.path.isdir(path):
+        return RunStore(path).to_dataframe(columns, segments)
+    if segments is not None:
+        raise ValueError(f"{path} has no segment boundaries; selecting segments needs a run store")
+    return pd.read_csv(path, usecols=columns)
@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import race_config as config
+
+_write_lock = threading.Lock()
+
+def append_line(path: str, event: dict) -> None:
+    """Appends an event as one JSON line with a single O_APPEND write.
+
+    Lines written this way by several processes (e.g. process pool workers) never interleave.
+    """
+    line = json.dumps(event, default=_to_json) + "\n"
+    with _write_lock:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+def _to_json(value):
+    """numpy scalars/arrays as plain JSON numbers/lists."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return float(value)
+
+def publish(event: dict) -> None:
+    """Appends an event to `RunStreamFile` (no-op with `RunStream` off)."""
+    if config.RunStream:
+        append_line(config.RunStreamFile, {"timestamp": time.time(), **event})
+
+def start_run(n_segments: int) -> None:
+    """Starts a new stream: the previous run's events are dropped and a "start" event is written."""
+    if not config.RunStream:
+        return
+    with open(config.RunStreamFile, "w"):
+        pass
+    publish({"event": "start", "run_id": f"{time.time():.6f}-{os.getpid()}", "segments": n_segments})
+
+def publish_segment(segment: int, day: int, segment_df: pd.DataFrame, segment_time: float,
+                    pass_no: int | None = None) -> None:
+    """Publishes a solved segment's output rows (the `run_dat.csv` columns).
+
+    A later event for the same segment (a re-solve in `main_parallel`) replaces it.
+    """
+    publish({
+        "event": "segment",
+        "segment": segment,
+        "day": day,
+        "pass": pass_no,
+        "segment_time": segment_time,
+        "columns": {name: segment_df[name].to_numpy() for name in segment_df.columns},
+    })
+
+def finish_run(total_time: float) -> None:
+    publish({"event": "finish", "total_time": total_time})
+
+def read_events(path: str, offset: int = 0) -> tuple[list[dict], int]:
+    """Complete events appended to the stream since byte `offset`.
+
+    A partially written last line is left for the next read. If the file is shorter than
+    `offset` (a new run truncated it), reading restarts from the beginning.
+
+    Returns:
+        tuple: (events, offset to continue from)
+    """
+    if not os.path.exists(path):
+        return [], 0
+    if os.path.getsize(path) < offset:
+        offset = 0
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    events = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+    return events, offset + end
@@ -1,10 +1,20 @@
 import numpy as np
+import race_config as config
+from accurate_solarprofile import route_geometry
+from car import CarParams
+from forecast_index import load_forecast_index
+import instrumentation
 from race_config import PanelArea, PanelEfficiency, RaceStartTime, RaceEndTime
 
 # Constants
 DT = RaceEndTime - RaceStartTime
 _power_coeff = PanelArea * PanelEfficiency
 
+# Gaussian clear-sky irradiance model (see _calc_solar_irradiance)
+_PEAK_IRRADIANCE = 1073.099  # W/m^2
+_SOLAR_NOON = 43200  # s after midnight
+_IRRADIANCE_WIDTH = 11600  # s, standard deviation of the curve
+
 def _calc_solar_irradiance(time: float) -> float:
     """Calculates solar irradiance at a given time using a Gaussian model.
 
@@ -14,19 +24,61 @@ def _calc_solar_irradiance(time: float) -> float:
     Returns:
         Solar irradiance in W/m^2.
     """
-    return 1073.099 * np.exp(-0.5 * ((time - 43200) / 11600)**2)
+    return _PEAK_IRRADIANCE * np.exp(-0.5 * ((time - _SOLAR_NOON) / _IRRADIANCE_WIDTH)**2)
 
-def calculate_incident_solarpower(globaltime: np.ndarray, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+@instrumentation.timed("calculate_incident_solarpower")
+def calculate_incident_solarpower(globaltime: np.ndarray, latitude: np.ndarray, longitude: np.ndarray,
+                                  car: CarParams | None = None) -> np.ndarray:
     """Calculates power generated by solar panels along the route.
 
     Args:
         globaltime: Array of cumulative time stamps in seconds.
         latitude: Array of latitudes along the route.
         longitude: Array of longitudes along the route.
+        car: Optional (batched) car parameters for the panel area/efficiency.
 
     Returns:
         Array of incident solar power in Watts.
     """
-    gt = globaltime % DT
-    intensity = _calc_solar_irradiance(RaceStartTime + gt)
-    return intensity * _power_coeff
+    return incident_solarpower_at(globaltime // DT, RaceStartTime + globaltime % DT, latitude, longitude, car)
+
+def incident_solarpower_at(day: np.ndarray, time_of_day: np.ndarray, latitude: np.ndarray, longitude: np.ndarray,
+                           car: CarParams | None = None) -> np.ndarray:
+    """Solar power of the configured `SolarModel` at local times of day, also outside racing hours.
+
+    Args:
+        day: Race day(s), 0 for `RaceDate`.
+        time_of_day: Local time(s) in seconds after midnight.
+        latitude: Latitudes (broadcast against the times).
+        longitude: Longitudes (broadcast against the times).
+        car: Optional (batched) car parameters for the panel area/efficiency.
+
+    Returns:
+        Array of incident solar power in Watts.
+    """
+    if config.SolarModel == "geometric":
+        intensity = route_geometry(latitude, longitude).irradiance_at(day, time_of_day)
+    elif config.SolarModel == "forecast":
+        intensity, _ = load_forecast_index().sample_at("ghi", day, time_of_day, latitude, longitude)
+    else:
+        intensity = _calc_solar_irradiance(time_of_day)
+    return intensity * (_power_coeff if car is None else car.panel_power_coeff)
+
+@instrumentation.timed("calculate_incident_solarpower_gradient")
+def calculate_incident_solarpower_gradient(globaltime: np.ndarray, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    """Derivative of `calculate_incident_solarpower` with respect to time.
+
+    Args:
+        globaltime: Array of cumulative time stamps in seconds.
+        latitude: Array of latitudes along the route.
+        longitude: Array of longitudes along the route.
+
+    Returns:
+        Array of d(solar power)/d(time) in Watts per second.
+    """
+    if config.SolarModel == "geometric":
+        return route_geometry(latitude, longitude).irradiance_gradient(globaltime) * _power_coeff
+    if config.SolarModel == "forecast":
+        return load_forecast_index().sample("ghi", globaltime, latitude, longitude)[1] * _power_coeff
+    time_of_day = RaceStartTime + globaltime % DT
+    return calculate_incident_solarpower(globaltime, latitude, longitude) * -(time_of_day - _SOLAR_NOON) / _IRRADIANCE_WIDTH**2
@@ -1,17 +1,34 @@
 import race_config as config
 import pandas as pd
 
+from context import SegmentContext
+from route_store import load_route
+
+# Compatibility shim: new code passes a SegmentContext explicitly (see context.py);
+# these globals mirror the last `set_day_state` call for older scripts.
 Day=1
 TimeOffset = 0
 
 InitialBatteryCapacity = None
 FinalBatteryCapacity = None
 route_df = None
+context = None
 
 def set_day_state(day_no, index_no, time_offset=0):
-    global InitialBatteryCapacity, FinalBatteryCapacity, route_df, Day, TimeOffset
+    global InitialBatteryCapacity, FinalBatteryCapacity, route_df, Day, TimeOffset, context
     Day = day_no
     TimeOffset = time_offset
     InitialBatteryCapacity = config.BatteryCapacity * config.BatteryLevelWayPoints[index_no] # Wh
     FinalBatteryCapacity = config.BatteryCapacity * config.BatteryLevelWayPoints[index_no+1]  # Wh
-    route_df = pd.read_csv("processed_route_data.csv").iloc[config.DF_WayPoints[index_no]: config.DF_WayPoints[index_no+1]]
+    route_df = load_route().to_dataframe(config.DF_WayPoints[index_no], config.DF_WayPoints[index_no+1])
+    context = current_context()
+
+def current_context(segment_df: pd.DataFrame | None = None) -> SegmentContext:
+    """SegmentContext built from the current globals (including any later edits to them)."""
+    return SegmentContext.from_route_df(
+        route_df if segment_df is None else segment_df,
+        initial_energy=InitialBatteryCapacity,
+        final_energy=FinalBatteryCapacity,
+        time_offset=TimeOffset,
+        day=Day,
+    )
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import race_config as config
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    """Runs every test from the repository root (route files are opened by relative path)
+    with the on-disk outputs and caches of the runners switched off."""
+    monkeypatch.chdir(ROOT)
+    for setting in ("Instrumentation", "RunStream", "WriteRunStore", "UseWarmStartCache"):
+        monkeypatch.setattr(config, setting, False)
@@ -0,0 +1,24 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from accurate_solarprofile import G_s_prime, SolarGeometry, DT
+from race_config import RaceStartTime
+
+# Darwin and Alice Springs on the first race day; solar noon in ACST (UTC+9.5) from the
+# equation of time (15.5 min on 22 October) and the 142.5 deg E time-zone meridian
+@pytest.mark.parametrize("latitude, longitude, solar_noon", [
+    (-12.46, 130.84, 12 + 31.1 / 60),
+    (-23.70, 133.88, 12 + 19.0 / 60),
+])
+def test_solar_noon_and_peak_irradiance(latitude, longitude, solar_noon):
+    geometry = SolarGeometry.for_route(np.array([latitude]), np.array([longitude]), date(2023, 10, 22))
+    globaltime = np.arange(0.0, DT, 10.0)
+    irradiance = geometry.irradiance(globaltime)
+
+    peak_time = (RaceStartTime + globaltime[np.argmax(irradiance)]) / 3600
+    assert peak_time == pytest.approx(solar_noon, abs=1 / 60)
+    # The sun is close to overhead: declination -11.2 deg on 22 October
+    zenith = np.radians(latitude + 11.2)
+    assert irradiance.max() == pytest.approx(G_s_prime * np.cos(zenith), rel=5e-3)
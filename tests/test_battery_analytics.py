@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import race_config as config
+from battery_analytics import RunBatch, battery_power, c_rate_residency, dod_cycles, peak_power, summarize
+
+C = config.BatteryCapacity  # W at 1C
+
+def _run(time, c_rates, battery) -> pd.DataFrame:
+    """Output rows whose steps draw the given C-rates (NaN: the row starts a segment)."""
+    time = np.asarray(time, dtype=float)
+    dt = np.diff(time, prepend=time[0])
+    energy = np.asarray(c_rates, dtype=float) * C * dt / 3600
+    return pd.DataFrame({
+        'Time': time,
+        'EnergyConsumption': np.clip(energy, 0, None),
+        'Solar': np.clip(-energy, 0, None),
+        'Battery': battery,
+    })
+
+@pytest.fixture
+def runs() -> RunBatch:
+    # Run "a": 0.18C and 0.12C for half an hour each, a one hour stop, then charging at 0.12C
+    # and 0.35C for half an hour each
+    a = _run([0, 1800, 3600, 7200, 9000, 10800], [np.nan, 0.18, 0.12, np.nan, -0.12, 0.35],
+             [100, 91, 85, 85, 91, 73.5])
+    # Run "b": flat, a 10 % discharge and a flat end
+    b = _run([0, 1800, 3600, 5400], [np.nan, 0.0, 0.1, 0.0], [50, 50, 40, 40])
+    return RunBatch.from_frames({'a': a, 'b': b})
+
+def test_battery_power_skips_stops_and_run_starts(runs):
+    dt, power = battery_power(runs)
+    np.testing.assert_array_equal(dt, [0, 1800, 1800, 0, 1800, 1800, 0, 1800, 1800, 1800])
+    np.testing.assert_allclose(power / C, [np.nan, 0.18, 0.12, np.nan, -0.12, 0.35, np.nan, 0, 0.1, 0])
+
+def test_c_rate_residency(runs):
+    # Bins (<=0.05, 0.05-0.1, 0.1-0.15, 0.15-0.2, 0.2-0.25, 0.25-0.3, 0.3-0.4, >0.4)
+    np.testing.assert_allclose(c_rate_residency(runs), [
+        [0, 0, 1.0, 0.5, 0, 0, 0.5, 0],
+        [1.0, 0.5, 0, 0, 0, 0, 0, 0],
+    ])
+
+def test_dod_cycles(runs):
+    counts, equivalent_cycles, deepest = dod_cycles(runs, edges=(5, 10, 20))
+    # "a": 100 -> 85 and 91 -> 73.5; "b": 50 -> 40 across the flat stretches
+    np.testing.assert_array_equal(counts, [[0, 0, 2, 0], [0, 1, 0, 0]])
+    np.testing.assert_allclose(equivalent_cycles, [0.325, 0.1])
+    np.testing.assert_allclose(deepest, [17.5, 10])
+
+def test_peak_power_over_driving_time(runs):
+    peaks = peak_power(runs, windows=(1800, 3600, 7200, 9000))
+    np.testing.assert_allclose(peaks / C, [
+        [0.35, (0.18 + 0.12) / 2, (0.18 + 0.12 - 0.12 + 0.35) / 4, np.nan],
+        [0.1, 0.05, np.nan, np.nan],
+    ])
+
+def test_summarize_has_one_row_per_run(runs):
+    summary = summarize(runs)
+    assert list(summary.index) == ['a', 'b']
+    assert summary.loc['a', 'max_dod'] == pytest.approx(17.5)
@@ -0,0 +1,69 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+import race_config as config
+import car
+
+SPEED = np.linspace(0, config.MaxVelocity, 36)
+
+# (ambient temperature K, slope deg, headwind m/s): nominal, high current (steep climb into
+# a strong headwind), high ambient and both
+CASES = {
+    "nominal": (config.Ta, 0.0, 0.0),
+    "high_current": (config.Ta, 10.0, 20.0),
+    "high_ambient": (330.0, 0.0, 0.0),
+    "high_current_and_ambient": (330.0, 10.0, 20.0),
+}
+
+@pytest.mark.parametrize("ta, slope, headwind", CASES.values(), ids=CASES.keys())
+def test_newton_winding_temperature_matches_fixed_point(ta, slope, headwind):
+    params = replace(car.DEFAULT_CAR, ta=ta)
+    torque = car._calculate_torque(SPEED, np.full_like(SPEED, slope), np.full_like(SPEED, headwind),
+                                   np.full_like(SPEED, 180.0), params)
+
+    newton = car._solve_winding_temperature_newton(torque, SPEED ** 2, params)
+    fixed_point = car._solve_winding_temperature_fixed_point(torque, SPEED ** 2, params)
+    np.testing.assert_allclose(newton, fixed_point, rtol=0, atol=2 * car._FIXED_POINT_TOL)
+    # The fixed point stops up to _FIXED_POINT_TOL short; Newton solves the balance itself
+    copper_loss, eddy_loss = car._motor_losses(torque, SPEED ** 2, newton, params)
+    np.testing.assert_allclose(car._THERMAL_RESISTANCE * (copper_loss + eddy_loss) + ta, newton, rtol=0, atol=1e-6)
+
+@pytest.mark.parametrize("ta, slope, headwind", CASES.values(), ids=CASES.keys())
+def test_calculate_power_does_not_depend_on_thermal_solver(monkeypatch, ta, slope, headwind):
+    params = replace(car.DEFAULT_CAR, ta=ta)
+    args = (SPEED, np.full_like(SPEED, 0.2), np.full_like(SPEED, slope), np.full_like(SPEED, headwind),
+            np.full_like(SPEED, 180.0), params)
+
+    monkeypatch.setattr(config, "ThermalSolver", "newton")
+    newton = car.calculate_power(*args)
+    monkeypatch.setattr(config, "ThermalSolver", "fixed_point")
+    fixed_point = car.calculate_power(*args)
+    np.testing.assert_allclose(newton, fixed_point, rtol=1e-5, atol=1e-3)  # W, from the 1 mK tolerance
+
+def test_newton_solves_batched_ambient_temperatures():
+    params = car.DEFAULT_CAR.sweep(ta=[config.Ta, 310.0, 330.0])
+    torque = car._calculate_torque(SPEED, np.zeros_like(SPEED), np.full_like(SPEED, 20.0),
+                                   np.full_like(SPEED, 180.0), params)
+
+    newton = car._solve_winding_temperature_newton(torque, SPEED ** 2, params)
+    assert newton.shape == (3, len(SPEED))
+    for k, ta in enumerate(params.ta.ravel()):
+        single = replace(car.DEFAULT_CAR, ta=ta)
+        np.testing.assert_allclose(newton[k], car._solve_winding_temperature_fixed_point(torque, SPEED ** 2, single),
+                                   rtol=0, atol=2 * car._FIXED_POINT_TOL)
+
+def test_batched_car_matches_each_configuration():
+    rng = np.random.default_rng(0)
+    speed, acceleration = rng.uniform(5, 35, 50), rng.normal(0, 0.3, 50)
+    slope, wind_speed, wind_dir = rng.normal(0, 3, 50), rng.uniform(0, 10, 50), rng.uniform(0, 360, 50)
+    variants = dict(mass=[240.0, 267.0, 300.0], cda=[0.08, 0.092, 0.11], zero_speed_crr=[0.003, 0.0045, 0.006],
+                    ta=[290.0, 305.0, 325.0], r_out=[0.26, 0.27, 0.28])
+    batched = car.calculate_power(speed, acceleration, slope, wind_speed, wind_dir, car.DEFAULT_CAR.sweep(**variants))
+
+    for k in range(3):
+        single = replace(car.DEFAULT_CAR, **{name: values[k] for name, values in variants.items()})
+        expected = car.calculate_power(speed, acceleration, slope, wind_speed, wind_dir, single)
+        for batched_power, power in zip(batched, expected):
+            np.testing.assert_allclose(batched_power[k], power, rtol=1e-6, atol=1e-3)
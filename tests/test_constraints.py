@@ -0,0 +1,24 @@
+import numpy as np
+from scipy import sparse
+
+from constraints import battery_acc_vector_constraint_func, battery_acc_vector_constraint_jac
+from context import make_segment_context
+
+def test_vector_constraint_jacobian_is_sparse_and_matches_finite_differences():
+    ctx = make_segment_context(1, 3, time_offset=7200.0)
+    rng = np.random.default_rng(0)
+    v_prof = np.concatenate([[0], rng.uniform(10, 30, ctx.n_points - 2), [0]])
+
+    jac = battery_acc_vector_constraint_jac(v_prof, ctx)
+    assert sparse.issparse(jac)
+    # Lower-triangular battery block plus bidiagonal power block
+    n_segments = jac.shape[0] // 2
+    assert jac.nnz <= n_segments * (n_segments + 3) / 2 + 2 * n_segments
+
+    h = 1e-6
+    for node in range(1, ctx.n_points - 1):
+        step = np.zeros(ctx.n_points)
+        step[node] = h
+        finite_difference = (battery_acc_vector_constraint_func(v_prof + step, ctx)
+                             - battery_acc_vector_constraint_func(v_prof - step, ctx)) / (2 * h)
+        np.testing.assert_allclose(jac[:, node].toarray().ravel(), finite_difference, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from downsample import downsample, lttb_indices, minmax_indices
+
+def _series(n: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Noisy sine with one spike up and one dip, away from the ends."""
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.uniform(0.5, 1.5, n))
+    y = np.sin(x / 50) + rng.normal(0, 0.1, n)
+    y[n // 3] = 10.0
+    y[2 * n // 3] = -10.0
+    return x, y
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+@pytest.mark.parametrize("n, max_points", [(10, 100), (1000, 100), (10_001, 64), (50_000, 2000), (2003, 7)])
+def test_downsample_keeps_endpoints_and_extrema_within_the_target(method, n, max_points):
+    x, y = _series(n)
+    x_out, y_out = downsample(x, y, max_points, method=method)
+
+    assert len(x_out) <= min(n, max_points)
+    assert (x_out[0], x_out[-1]) == (x[0], x[-1])
+    assert y_out.max() == y.max() and y_out.min() == y.min()
+    assert np.all(np.diff(x_out) > 0)
+    np.testing.assert_array_equal(y_out, y[np.searchsorted(x, x_out)])
+
+def test_lttb_returns_exactly_n_out_points():
+    x, y = _series(5000)
+    assert len(lttb_indices(x, y, 123)) == 123
+    np.testing.assert_array_equal(lttb_indices(x[:50], y[:50], 123), np.arange(50))
+
+def test_minmax_keeps_every_bucket_extremum():
+    _, y = _series(1000, seed=1)
+    indices = minmax_indices(y, 10)
+    for bucket in np.array_split(np.arange(1000), 10):
+        kept = y[indices[(indices >= bucket[0]) & (indices <= bucket[-1])]]
+        assert kept.max() == y[bucket].max() and kept.min() == y[bucket].min()
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_zoomed_range_keeps_one_point_either_side(method):
+    x, y = np.arange(10_000, dtype=float), np.sin(np.arange(10_000) / 100)
+    x_out, _ = downsample(x, y, 100, x_range=(2500.5, 3000.5), method=method)
+    assert (x_out[0], x_out[-1]) == (2500.0, 3001.0)
+    assert len(x_out) <= 100
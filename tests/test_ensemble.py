@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+import race_config as config
+import joint_model
+from ensemble import Scenarios, load_plan, run_ensemble
+
+@pytest.fixture
+def one_day_plan(monkeypatch, tmp_path):
+    """Optimized plan for the first race day (two control stops), written like `run_dat.csv`."""
+    monkeypatch.setattr(config, "DF_WayPoints", [0, 57, 102, 109])
+    monkeypatch.setattr(config, "BatteryLevelWayPoints", [1, 0.44, 0.51, 0.5])
+    route = joint_model.load_joint_route()
+    out_df, _ = joint_model.main(route)
+    path = tmp_path / "run_dat.csv"
+    out_df.to_csv(path, index=False)
+    return route, path
+
+def nominal_scenario() -> Scenarios:
+    return Scenarios(wind_scale=np.ones(1), wind_offset=np.zeros(1), irradiance_scale=np.ones(1))
+
+def test_nominal_scenario_of_feasible_plan_has_no_violations(one_day_plan):
+    route, path = one_day_plan
+    v_prof, stage_start_energy = load_plan(path, route)
+    assert joint_model.joint_constraint_func(v_prof, route).min() > -1e-6
+
+    for start_energy in (None, stage_start_energy):
+        result = run_ensemble(v_prof, nominal_scenario(), route, start_energy)
+        assert not result.battery_violation.any()
+        assert not result.power_violation.any()
+        assert result.min_battery_margin.min() > -1e-6
+
+    # Carried through the race, the nominal battery is the plan's own
+    result = run_ensemble(v_prof, nominal_scenario(), route)
+    assert result.final_battery[0] == pytest.approx(joint_model.race_state(v_prof, route)["battery"][-1], abs=1e-6)
+    assert result.finish_time == pytest.approx(joint_model.joint_objective(v_prof, route))
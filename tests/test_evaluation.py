@@ -0,0 +1,79 @@
+import gc
+import threading
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+import race_config as config
+import evaluation
+import instrumentation
+from car import DEFAULT_CAR
+from context import make_segment_context
+
+@pytest.fixture
+def ctx():
+    evaluation.clear_cache()
+    yield make_segment_context(1, 0)
+    evaluation.clear_cache()
+
+def _profile(ctx, speed=20.0):
+    return np.concatenate([[0], np.full(ctx.n_points - 2, speed), [0]])
+
+def test_repeated_profile_is_a_cache_hit(ctx):
+    v_prof = _profile(ctx)
+    with instrumentation.counting() as counters:
+        first = evaluation.evaluate(v_prof, ctx)
+        second = evaluation.evaluate(v_prof.copy(), ctx)
+        evaluation.evaluate(_profile(ctx, 21.0), ctx)
+    assert second is first
+    assert (counters.evaluations, counters.cache_hits) == (2, 1)
+
+def test_other_context_is_a_miss(ctx):
+    v_prof = _profile(ctx)
+    with instrumentation.counting() as counters:
+        evaluation.evaluate(v_prof, ctx)
+        evaluation.evaluate(v_prof, make_segment_context(1, 0))
+    assert (counters.evaluations, counters.cache_hits) == (2, 0)
+
+@pytest.mark.parametrize("setting, value", [
+    ("ThermalSolver", "fixed_point"),
+    ("SolarModel", "geometric"),
+])
+def test_model_settings_are_part_of_the_key(ctx, monkeypatch, setting, value):
+    v_prof = _profile(ctx)
+    before = evaluation.evaluate(v_prof, ctx)
+    monkeypatch.setattr(config, setting, value)
+    with instrumentation.counting() as counters:
+        after = evaluation.evaluate(v_prof, ctx)
+    assert counters.evaluations == 1 and after is not before
+
+def test_cached_context_id_is_not_reused(ctx):
+    v_prof = _profile(ctx)
+    evaluation.evaluate(v_prof, make_segment_context(1, 0))
+    gc.collect()
+    # The cache keeps the first context alive, so a new one cannot take over its id
+    with instrumentation.counting() as counters:
+        evaluation.evaluate(v_prof, ctx)
+    assert (counters.evaluations, counters.cache_hits) == (1, 0)
+
+def test_batched_evaluation_matches_each_configuration(ctx):
+    v_prof = _profile(ctx)
+    masses, areas = [250.0, 267.0, 290.0], [4.0, 4.5, 6.0]
+    batched = evaluation.evaluate_batch(v_prof, ctx, DEFAULT_CAR.sweep(mass=masses, panel_area=areas))
+
+    for k, (mass, area) in enumerate(zip(masses, areas)):
+        single = evaluation._evaluate(v_prof, ctx, replace(DEFAULT_CAR, mass=mass, panel_area=area))
+        for name in ("net_power", "solar_power", "energy_consumption"):
+            np.testing.assert_allclose(getattr(batched, name)[k], getattr(single, name), rtol=1e-6, atol=1e-6)
+
+def test_other_threads_do_not_evict_entries(ctx):
+    v_prof = _profile(ctx)
+    evaluation.evaluate(v_prof, ctx)
+    other = threading.Thread(target=lambda: [evaluation.evaluate(_profile(ctx, 10.0 + k), ctx)
+                                             for k in range(2 * evaluation._CACHE_SIZE)])
+    other.start()
+    other.join()
+    with instrumentation.counting() as counters:
+        evaluation.evaluate(v_prof, ctx)
+    assert (counters.evaluations, counters.cache_hits) == (0, 1)
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import race_config as config
+from forecast_index import ForecastIndex, clear_forecast_index, load_forecast_index, race_epoch
+from forecast_ingest import RouteForecast
+from route_store import load_route
+
+@pytest.fixture(autouse=True)
+def fresh_index():
+    clear_forecast_index()
+    yield
+    clear_forecast_index()
+
+def _write_route_csv(path, ghi: list) -> None:
+    route = pd.read_csv("updated_route_data.csv").iloc[:len(ghi)]
+    route["GHI"] = ghi
+    route.to_csv(path, index=False)
+
+def test_missing_source_names_the_ingestion_step(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "ForecastIndexSource", str(tmp_path / "route_forecast.npz"))
+    with pytest.raises(FileNotFoundError, match="forecast_ingest.py"):
+        load_forecast_index()
+
+def test_csv_lookup_uses_the_nearest_route_point(tmp_path, monkeypatch):
+    path = tmp_path / "route.csv"
+    _write_route_csv(path, [100.0, np.nan, 300.0, 400.0])
+    monkeypatch.setattr(config, "ForecastIndexSource", str(path))
+
+    index = load_forecast_index()
+    # Slightly off the route points; the missing GHI is interpolated between its neighbours
+    latitude, longitude = index.latitude + 1e-4, index.longitude - 1e-4
+    ghi, rate = index.sample("ghi", np.array([0.0, 3600.0, 7200.0, 9e4]), latitude, longitude)
+    np.testing.assert_allclose(ghi, [100.0, 200.0, 300.0, 400.0])
+    np.testing.assert_array_equal(rate, 0.0)
+
+def test_npz_lookup_interpolates_in_time(tmp_path, monkeypatch):
+    route = load_route()
+    n_points = len(route)
+    times = race_epoch(np.array([0.0, 3600.0]))
+    ghi = np.stack([np.full(n_points, 200.0), np.full(n_points, 600.0)], axis=1)
+    path = tmp_path / "route_forecast.npz"
+    RouteForecast(times, ghi, np.zeros_like(ghi), np.zeros_like(ghi), int(times[0])).save(path)
+    monkeypatch.setattr(config, "ForecastIndexSource", str(path))
+
+    index = load_forecast_index()
+    latitude, longitude = route["latitude"][:3], route["longitude"][:3]
+    value, rate = index.sample("ghi", np.array([-600.0, 900.0, 4000.0]), latitude, longitude)
+    np.testing.assert_allclose(value, [200.0, 300.0, 600.0])
+    np.testing.assert_allclose(rate, [0.0, 400.0 / 3600, 0.0])
+
+def test_index_is_reloaded_when_the_source_changes(tmp_path, monkeypatch):
+    path = tmp_path / "route.csv"
+    _write_route_csv(path, [100.0, 100.0])
+    monkeypatch.setattr(config, "ForecastIndexSource", str(path))
+
+    index = load_forecast_index()
+    assert load_forecast_index() is index
+
+    # A newer forecast written to the same file
+    _write_route_csv(path, [500.0, 500.0])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reloaded = load_forecast_index()
+    assert reloaded is not index
+    np.testing.assert_array_equal(reloaded.ghi, 500.0)
+
+    clear_forecast_index()
+    assert load_forecast_index() is not reloaded
+
+def test_index_follows_the_source_setting(tmp_path, monkeypatch):
+    first, second = tmp_path / "first.csv", tmp_path / "second.csv"
+    _write_route_csv(first, [100.0, 100.0])
+    _write_route_csv(second, [200.0, 200.0])
+
+    monkeypatch.setattr(config, "ForecastIndexSource", str(first))
+    assert isinstance(load_forecast_index(), ForecastIndex)
+    monkeypatch.setattr(config, "ForecastIndexSource", str(second))
+    np.testing.assert_array_equal(load_forecast_index().ghi, 200.0)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import race_config as config
+import joint_model
+from car import CarParams
+from forecast_index import ForecastIndex, local_epoch
+
+@pytest.fixture
+def one_day_route(monkeypatch):
+    monkeypatch.setattr(config, "DF_WayPoints", [0, 57, 102, 109])
+    monkeypatch.setattr(config, "BatteryLevelWayPoints", [1, 0.44, 0.51, 0.5])
+    return joint_model.load_joint_route()
+
+def _forecast_wind(route) -> ForecastIndex:
+    """Wind that changes every half hour along the route for the first two days."""
+    times = local_epoch(0, np.arange(0, 48 * 3600, 1800.0))
+    phase = np.arange(len(route.lats))[:, None] / 10 + np.arange(len(times))[None, :] / 3
+    return ForecastIndex(route.lats, route.longs, times, np.full(phase.shape, 800.0),
+                         4 + 2 * np.sin(phase), 90 + 60 * np.cos(phase))
+
+def _decision_vector(route) -> np.ndarray:
+    v_prof = np.array([20.0 if lo > 0 else 0.0 for lo, _ in joint_model.get_joint_bounds(route)])
+    x = joint_model._transcribe(v_prof, route)
+    return x + np.random.default_rng(0).normal(0, 1e-3, len(x))
+
+@pytest.mark.parametrize("forecast_wind", [False, True])
+def test_transcription_jacobians_match_finite_differences(monkeypatch, one_day_route, forecast_wind):
+    if forecast_wind:
+        monkeypatch.setattr(config, "UseForecastWind", True)
+        index = _forecast_wind(one_day_route)
+        monkeypatch.setattr(joint_model, "load_forecast_index", lambda: index)
+    x = _decision_vector(one_day_route)
+    h = 1e-7
+    for func, jac in [(joint_model.joint_defects, joint_model.joint_defects_jac),
+                      (joint_model.joint_power_constraint, joint_model.joint_power_constraint_jac)]:
+        numeric = np.array([(func(x + h * e, one_day_route) - func(x - h * e, one_day_route)) / (2 * h)
+                            for e in np.eye(len(x))]).T
+        assert np.allclose(jac(x, one_day_route).toarray(), numeric, atol=1e-6)
+
+def test_transcription_jacobians_have_a_few_entries_per_row():
+    route = joint_model.load_joint_route()
+    x = _decision_vector(route)
+    n_rows = len(route.segments)
+    assert joint_model.joint_defects_jac(x, route).nnz <= 10 * n_rows
+    assert joint_model.joint_power_constraint_jac(x, route).nnz < 3 * n_rows
+
+def test_joint_solve_is_feasible(one_day_route):
+    _, race_time = joint_model.main(one_day_route)
+    # Same race time as solving the single-shooting problem with SLSQP
+    assert race_time / 3600 == pytest.approx(8.4309, abs=1e-3)
+
+def test_batched_car_matches_single_cars(one_day_route):
+    v_prof = np.array([20.0 if lo > 0 else 0.0 for lo, _ in joint_model.get_joint_bounds(one_day_route)])
+    masses, areas = np.array([250.0, 300.0]), np.array([5.0, 6.0])
+    base = CarParams.from_config()
+    batched = joint_model.race_state(v_prof, one_day_route, base.sweep(mass=masses, panel_area=areas))
+    for k, (mass, area) in enumerate(zip(masses, areas)):
+        single = joint_model.race_state(v_prof, one_day_route, base.sweep(mass=[mass], panel_area=[area]))
+        for name in ("net_power", "solar_power", "stop_gain", "battery"):
+            assert np.allclose(batched[name][k], single[name][0])
+    # The configured car is the unbatched default
+    default = joint_model.race_state(v_prof, one_day_route)
+    assert np.allclose(joint_model.race_state(v_prof, one_day_route, base)["battery"], default["battery"])
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import race_config as config
+from live_replan import Replanner, Telemetry, horizon_context, solve_horizon
+
+def test_zero_latency_budget_stops_after_the_first_iteration():
+    telemetry = Telemetry(distance=20000.0, soc=90.0, time=1800.0, speed=20.0)
+    ctx, _ = horizon_context(telemetry)
+    v_initial = np.concatenate([[telemetry.speed], np.full(ctx.n_points - 2, config.InitialGuessVelocity), [0]])
+
+    velocity, feasible, iterations = solve_horizon(ctx, v_initial, latency_budget=0)
+    assert iterations == 1
+    assert velocity.shape == v_initial.shape
+    assert velocity[0] == telemetry.speed
+
+def test_replanner_returns_a_plan_within_a_zero_budget():
+    plan = Replanner(latency_budget=0).update(Telemetry(distance=20000.0, soc=90.0, time=1800.0, speed=20.0))
+    assert plan.iterations == 1
+    assert len(plan.out_df) == len(plan.velocity)
+
+@pytest.mark.parametrize("latency_budget", [0, 0.5])
+@pytest.mark.parametrize("method", ["trust-constr", "COBYLA"])
+def test_horizon_solves_with_other_methods_return_full_profiles(monkeypatch, method, latency_budget):
+    # trust-constr passes (x, state) to the callback and its iterates may leave the bounds,
+    # COBYLA drops the pinned first node from x
+    monkeypatch.setattr(config, "ModelMethod", method)
+    telemetry = Telemetry(distance=20000.0, soc=90.0, time=1800.0, speed=20.0)
+    ctx, _ = horizon_context(telemetry)
+    v_initial = np.concatenate([[telemetry.speed], np.full(ctx.n_points - 2, config.InitialGuessVelocity), [0]])
+
+    velocity, feasible, iterations = solve_horizon(ctx, v_initial, latency_budget=latency_budget)
+    assert iterations >= 1
+    assert velocity.shape == v_initial.shape
+    assert velocity[0] == telemetry.speed
+
+    plan = Replanner(latency_budget=0).update(telemetry)
+    assert len(plan.out_df) == len(plan.velocity) == ctx.n_points
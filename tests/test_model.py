@@ -0,0 +1,32 @@
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import instrumentation
+import model
+from constraints import battery_acc_constraint_func
+from context import make_segment_context
+
+def test_converged_segment_is_feasible_without_warning():
+    ctx = make_segment_context(1, 0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        out_df, _ = model.main(ctx)
+    assert min(battery_acc_constraint_func(out_df["Velocity"].to_numpy(), ctx)) > -model.FEASIBILITY_TOLERANCE
+
+def test_iteration_limit_warns():
+    with pytest.warns(RuntimeWarning, match="Iteration limit"):
+        model.main(make_segment_context(1, 0), max_iter=2)
+
+def test_threaded_solves_count_their_own_work():
+    def solve(index_no: int) -> instrumentation.WorkCounters:
+        with instrumentation.counting() as counters:
+            model.main(make_segment_context(1, index_no))
+        return counters
+
+    sequential = [solve(index_no) for index_no in (0, 1)]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        threaded = list(pool.map(solve, (0, 1)))
+    assert threaded == sequential
+    assert all(counters.evaluations > 0 and counters.thermal_calls > 0 for counters in threaded)
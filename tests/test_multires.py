@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import race_config as config
+import instrumentation
+import model
+import multires
+from context import make_segment_context
+
+# Raw points per processed_route_data.csv row in the synthetic raw route
+GROUP_SIZE = 4
+
+def _upsample(route: pd.DataFrame, group_size: int) -> pd.DataFrame:
+    """Raw route of `group_size` points per row of `route` that averages back to `route`."""
+    repeat = lambda i: np.repeat(route.iloc[:, i].to_numpy(dtype=float), group_size)
+    step = repeat(0) / group_size
+    columns = [step, np.cumsum(step) / 1000, repeat(2), repeat(3), repeat(4), repeat(5), repeat(6)]
+    return pd.DataFrame(dict(zip(route.columns[:7], columns)))
+
+@pytest.fixture
+def raw_route(tmp_path, monkeypatch):
+    """A raw route covering the first two segments, with levels of 4, 2 and 1 raw points per row."""
+    path = tmp_path / "raw_route.csv"
+    route = pd.read_csv("processed_route_data.csv").iloc[:config.DF_WayPoints[2] + 1]
+    _upsample(route, GROUP_SIZE).to_csv(path, index=False)
+    monkeypatch.setattr(config, "RawRouteFile", str(path))
+    monkeypatch.setattr(config, "RouteGroupSize", GROUP_SIZE)
+    monkeypatch.setattr(config, "MultiResolutionLevels", (4, 2, 1))
+    monkeypatch.setattr(multires, "_levels", {})
+    return route
+
+def test_level_route_averages_back_to_processed_route(raw_route):
+    columns = multires.level_route(GROUP_SIZE).rows(0, len(raw_route))
+    np.testing.assert_allclose(columns["step_distance"], raw_route.iloc[:, 0])
+
+def test_solve_segment_solves_every_level_and_returns_the_finest(raw_route, monkeypatch):
+    tolerances = []
+    main = model.main
+    def spy(ctx, v_initial=None, max_iter=None, tol=None):
+        tolerances.append((ctx.n_points, tol))
+        return main(ctx, v_initial, max_iter, tol)
+    monkeypatch.setattr(model, "main", spy)
+
+    ctx = make_segment_context(1, 0)
+    out_df, time_taken = multires.solve_segment(ctx, 0)
+
+    fine_points = (ctx.n_points - 1) * GROUP_SIZE + 1
+    assert [n for n, _ in tolerances] == [ctx.n_points, (ctx.n_points - 1) * 2 + 1, fine_points]
+    assert [tol for _, tol in tolerances] == [config.MultiResolutionCoarseTolerance] * 2 + [None]
+    assert len(out_df) == fine_points
+    assert time_taken == pytest.approx(out_df["Time"].iloc[-1] - ctx.time_offset, rel=1e-6)
+
+def test_warm_start_reduces_fine_level_iterations(raw_route, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "Instrumentation", True)
+    monkeypatch.setattr(config, "InstrumentationFile", str(tmp_path / "solver_events.jsonl"))
+    ctx = make_segment_context(1, 0)
+    with instrumentation.collecting() as records:
+        out_df, time_taken = multires.solve_segment(ctx, 0)
+        # A previous result of the finest level skips the coarser ones
+        _, warm_time_taken = multires.solve_segment(ctx, 0, out_df["Velocity"].to_numpy())
+
+    cold, warm = records[2], records[3]
+    assert len(records) == 4 and warm.labels["warm_started"]
+    assert warm.solver_iterations < cold.solver_iterations
+    assert warm_time_taken == pytest.approx(time_taken, rel=1e-4)
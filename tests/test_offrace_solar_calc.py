@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from scipy.integrate import quad
+
+import race_config as config
+from offrace_solar_calc import calculate_race_energy, overnight_energy, race_energy_rate
+from solar import calculate_incident_solarpower, incident_solarpower_at, DT
+
+# A control stop between Katherine and Tennant Creek
+LATITUDE, LONGITUDE = -16.26, 133.37
+
+def _solar_model_energy(race_start: float, race_end: float) -> float:
+    """Wh from integrating the solar model's power over race time."""
+    power = lambda t: float(calculate_incident_solarpower(np.array([t]), np.array([LATITUDE]), np.array([LONGITUDE]))[0])
+    # Split at the end of the race day, where the race clock jumps to the next morning
+    edges = [race_start] + [d * DT for d in range(int(race_start // DT) + 1, int(race_end // DT) + 1)] + [race_end]
+    return sum(quad(power, a, b)[0] for a, b in zip(edges[:-1], edges[1:])) / 3600
+
+def _solar_model_energy_at(day: int, start: float, end: float) -> float:
+    """Wh from integrating the solar model's power over a local time of day interval."""
+    power = lambda t: float(incident_solarpower_at(np.array([day]), np.array([t]), np.array([LATITUDE]), np.array([LONGITUDE]))[0])
+    return quad(power, start, end, limit=200)[0] / 3600
+
+@pytest.mark.parametrize("model", ["gaussian", "geometric"])
+def test_race_energy_matches_solar_model(monkeypatch, model):
+    monkeypatch.setattr(config, "SolarModel", model)
+    for race_start, duration in [(3.47 * 3600, 1800), (0.0, 1800), (DT - 600, 1800), (1.5 * DT, 3 * 3600)]:
+        expected = _solar_model_energy(race_start, race_start + duration)
+        energy = calculate_race_energy(race_start, race_start + duration, LATITUDE, LONGITUDE)
+        assert np.isclose(energy, expected, rtol=1e-6)
+
+@pytest.mark.parametrize("model", ["gaussian", "geometric"])
+def test_overnight_energy_matches_solar_model(monkeypatch, model):
+    monkeypatch.setattr(config, "SolarModel", model)
+    arrival = 1.98 * DT  # end of the second race day
+    expected = _solar_model_energy_at(1, 17 * 3600, 18 * 3600) + _solar_model_energy_at(2, 5 * 3600, 8 * 3600)
+    assert np.isclose(overnight_energy(arrival, LATITUDE, LONGITUDE), expected, rtol=1e-4)
+
+def test_location_dependent_models_need_the_position(monkeypatch):
+    monkeypatch.setattr(config, "SolarModel", "geometric")
+    with pytest.raises(ValueError, match="latitude and longitude"):
+        calculate_race_energy(0.0, 1800.0)
+
+def test_control_stop_is_charged_at_race_clock_time():
+    # 3.47 h into the race is 11:28, close to solar noon
+    assert 600 < calculate_race_energy(3.47 * 3600, 3.47 * 3600 + config.CONTROL_STOP_DURATION) < 620
+
+@pytest.mark.parametrize("model", ["gaussian", "geometric"])
+def test_race_energy_rate_is_the_derivative(monkeypatch, model):
+    monkeypatch.setattr(config, "SolarModel", model)
+    t = np.array([1000.0, 3.47 * 3600, DT + 5000])
+    h = 1e-3
+    numeric = (calculate_race_energy(t, t + h, LATITUDE, LONGITUDE) - calculate_race_energy(t, t - h, LATITUDE, LONGITUDE)) / (2 * h)
+    assert np.allclose(race_energy_rate(t, LATITUDE, LONGITUDE), numeric, rtol=1e-6)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from process_route_data import aggregate_route, compile_route
+
+N_POINTS = 1003
+
+@pytest.fixture(scope="module")
+def raw_route() -> pd.DataFrame:
+    """Synthetic raw route with irregular point spacing."""
+    rng = np.random.default_rng(0)
+    step = rng.uniform(5, 40, N_POINTS)
+    return pd.DataFrame({
+        "StepDistance": step,
+        "CumulativeDistance": np.cumsum(step) / 1000,
+        "Slope": rng.normal(0, 2, N_POINTS),
+        "Latitude": np.linspace(-12.46, -13.5, N_POINTS),
+        "Longitude": np.linspace(130.84, 131.2, N_POINTS),
+        "WindSpeed": rng.uniform(0, 10, N_POINTS),
+        "WindDirection": rng.uniform(0, 360, N_POINTS),
+    })
+
+@pytest.fixture(scope="module")
+def raw_route_file(raw_route, tmp_path_factory) -> str:
+    path = tmp_path_factory.mktemp("route") / "raw_route.csv"
+    raw_route.to_csv(path, index=False)
+    return str(path)
+
+@pytest.mark.parametrize("chunksize", [1, 7, 100, N_POINTS - 1, N_POINTS, 10_000])
+@pytest.mark.parametrize("grouping", [{"group_size": 10}, {"group_size": 600}, {"segment_length": 250.0}],
+                         ids=["group_size=10", "group_size=600", "segment_length=250"])
+def test_chunked_compile_matches_in_memory_aggregation(raw_route, raw_route_file, chunksize, grouping):
+    # The CSV round trip is exact for float64 (shortest repr)
+    expected = aggregate_route(raw_route, **grouping)
+    compiled = compile_route(raw_route_file, chunksize=chunksize, **grouping)
+
+    assert list(compiled.columns) == list(raw_route.columns)
+    assert len(compiled) == len(expected)
+    np.testing.assert_allclose(compiled.to_numpy(), expected.to_numpy(), rtol=1e-12)
+
+def test_segment_length_groups_cover_the_route(raw_route_file, raw_route):
+    compiled = compile_route(raw_route_file, segment_length=250.0, chunksize=64)
+    assert compiled.iloc[:, 0].sum() == pytest.approx(raw_route.iloc[:, 0].sum())
+    assert compiled.iloc[-1, 1] == raw_route.iloc[-1, 1]
+
+@pytest.mark.parametrize("grouping", [{}, {"group_size": 10, "segment_length": 250.0}])
+def test_compile_route_needs_exactly_one_grouping(raw_route_file, grouping):
+    with pytest.raises(ValueError, match="exactly one"):
+        compile_route(raw_route_file, **grouping)
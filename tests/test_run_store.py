@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import race_config as config
+import fullmodelrunner
+from run_store import RUN_COLUMNS, RunWriter, load_output
+
+def _frame(value: float) -> pd.DataFrame:
+    return pd.DataFrame({name: np.full(3, value) for name in RUN_COLUMNS})
+
+def test_load_output_picks_the_newer_source(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "RunStoreDir", "run_dat.run")
+    writer = RunWriter("run_dat.run", 1)
+    writer.write_segment(0, _frame(1.0))
+    writer.finish(total_time=1.0)
+    _frame(2.0).to_csv("run_dat.csv", index=False)
+
+    metadata = os.path.join("run_dat.run", "metadata.json")
+    os.utime(metadata, (1_000_000, 1_000_000))
+    assert load_output()["Velocity"].iloc[0] == 2.0
+
+    os.utime("run_dat.csv", (500_000, 500_000))
+    assert load_output()["Velocity"].iloc[0] == 1.0
+
+def test_run_race_leaves_the_stream_and_store_to_its_caller(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "RunStream", True)
+    monkeypatch.setattr(config, "RunStreamFile", str(tmp_path / "run_stream.jsonl"))
+    monkeypatch.setattr(config, "WriteRunStore", True)
+    monkeypatch.setattr(config, "RunStoreDir", str(tmp_path / "run_dat.run"))
+
+    results_list, _ = fullmodelrunner.run_race()
+    assert len(results_list) == fullmodelrunner.N_SEGMENTS
+    assert not os.listdir(tmp_path)
+
+def test_main_switches_the_run_outputs_on(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "InstrumentationFile", "solver_events.jsonl")
+    monkeypatch.setattr(config, "RunStreamFile", "run_stream.jsonl")
+    monkeypatch.setattr(config, "RunStoreDir", "run_dat.run")
+
+    def run_race(outputs=None):
+        assert config.Instrumentation and config.RunStream and config.WriteRunStore
+        outputs.write_segment(0, 1, _frame(1.0), 1.0, {})
+        return [_frame(1.0)], 1.0
+    monkeypatch.setattr(fullmodelrunner, "run_race", run_race)
+
+    fullmodelrunner.main()
+    assert sorted(os.listdir(tmp_path)) == ["run_dat.csv", "run_dat.run", "run_stream.jsonl"]
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+import race_config as config
+import warmstart
+from context import make_segment_context
+
+@pytest.mark.parametrize("setting, value", [
+    ("ConstraintMode", "scalar"), ("ModelMethod", "trust-constr"), ("SolarModel", "geometric"),
+    ("ThermalSolver", "fixed_point"), ("Mass", 300),
+])
+def test_entries_are_only_reused_under_the_same_settings(monkeypatch, tmp_path, setting, value):
+    monkeypatch.setattr(config, "WarmStartDir", str(tmp_path))
+    ctx = make_segment_context(1, 0)
+    velocity = np.concatenate([[0], np.linspace(10, 20, ctx.n_points - 2), [0]])
+    warmstart.store(ctx, velocity)
+    np.testing.assert_allclose(warmstart.lookup(ctx), velocity)
+
+    with monkeypatch.context() as changed:
+        changed.setattr(config, setting, value)
+        assert warmstart.lookup(ctx) is None
+        # Not even as the nearest match of another segment input
+        assert warmstart.lookup(ctx.with_initial_energy(ctx.initial_energy - 10)) is None
+
+    assert warmstart.lookup(ctx.with_initial_energy(ctx.initial_energy - 10)) is not None
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+import race_config as config
+import fullmodelrunner
+import model
+import waypoint_search
+from context import make_segment_context
+
+def test_evaluate_allocation_passes_its_levels_without_touching_the_config(monkeypatch):
+    config_levels, config_enforce = list(config.BatteryLevelWayPoints), config.EnforceWaypointBattery
+    levels = tuple(np.linspace(1, config.DeepDischargeCap, len(config_levels)))
+    calls = []
+
+    def run_race(v_initials=None, outputs=None, levels=None, enforce_final_energy=None):
+        calls.append((levels, enforce_final_energy))
+        frames = [pd.DataFrame({"Battery": [100 * levels[i], 100 * levels[i + 1]]})
+                  for i in range(fullmodelrunner.N_SEGMENTS)]
+        return frames, 1000.0
+    monkeypatch.setattr(fullmodelrunner, "run_race", run_race)
+
+    score, race_time, _ = waypoint_search.evaluate_allocation(levels)
+    assert calls == [(list(levels), True)]
+    assert score == race_time == 1000.0
+    assert config.BatteryLevelWayPoints == config_levels and config.EnforceWaypointBattery == config_enforce
+
+def test_segment_context_carries_the_levels_and_the_final_energy_constraint(monkeypatch):
+    monkeypatch.setattr(config, "EnforceWaypointBattery", False)
+    levels = [0.9, 0.3] + list(config.BatteryLevelWayPoints[2:])
+
+    ctx = make_segment_context(1, 0, levels=levels, enforce_final_energy=True)
+    assert (ctx.initial_energy, ctx.final_energy) == (0.9 * config.BatteryCapacity, 0.3 * config.BatteryCapacity)
+    assert ctx.enforces_final_energy
+    assert len(model.build_constraints(ctx, use_gradients=True)) == 2
+
+    default = make_segment_context(1, 0)
+    assert not default.enforces_final_energy
+    assert len(model.build_constraints(default, use_gradients=True)) == 1
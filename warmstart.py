@@ -0,0 +1,135 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+import race_config as config
+from context import SegmentContext
+
+# Car parameters and model/solver settings that change the solution (see _settings_hash)
+_CAR_PARAMETERS = (
+    "Mass", "ZeroSpeedCrr", "CDA", "R_Out", "Ta", "AirDensity", "PanelArea", "PanelEfficiency",
+    "BusVoltage", "MaxCurrent", "MaxVelocity", "BatteryCapacity", "DeepDischargeCap",
+)
+_MODEL_SETTINGS = (
+    "SolarModel", "RaceUtcOffset", "ConstraintMode", "ModelMethod",
+    "UseAnalyticGradients", "ThermalSolver", "UseForecastWind", "ForecastIndexSource",
+)
+
+# Segment bounds are rounded to this many metres so re-aggregated routes still match
+_BOUNDS_RESOLUTION = 100
+
+def _segment_bounds(ctx: SegmentContext) -> str:
+    """Cache bucket of a segment: its start/end distance along the route."""
+    start = ctx.start_distance
+    end = start + float(np.sum(ctx.segments))
+    return f"{round(start / _BOUNDS_RESOLUTION)}-{round(end / _BOUNDS_RESOLUTION)}"
+
+def _forecast_version() -> tuple | None:
+    """Size and modification time of the forecast the model reads (None if it reads none)."""
+    if config.SolarModel != "forecast" and not config.UseForecastWind:
+        return None
+    try:
+        stat = os.stat(config.ForecastIndexSource)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def _settings_hash(ctx: SegmentContext) -> str:
+    """Hash of the car, model and solver settings (with the segment's final energy
+    constraint) and the forecast data in use.
+
+    Part of every cache file name: solutions are only reused (even as the nearest
+    match) under the settings they were computed with.
+    """
+    settings = [getattr(config, name) for name in _CAR_PARAMETERS + _MODEL_SETTINGS] + [ctx.enforces_final_energy]
+    return hashlib.blake2b(repr([settings, _forecast_version()]).encode(), digest_size=8).hexdigest()
+
+def _input_hash(ctx: SegmentContext) -> str:
+    """Hash of the segment inputs the solution depends on (route data, energies, time)."""
+    h = hashlib.blake2b(digest_size=12)
+    for array in ctx.route_arrays:
+        h.update(array.tobytes())
+    h.update(np.array([ctx.initial_energy, ctx.final_energy, ctx.time_offset], dtype=float).tobytes())
+    return h.hexdigest()
+
+def _entry_prefix(ctx: SegmentContext) -> str:
+    """File name prefix of the cache entries of a segment under the current settings."""
+    return os.path.join(config.WarmStartDir, f"{_segment_bounds(ctx)}_{_settings_hash(ctx)}")
+
+def node_distance(ctx: SegmentContext) -> np.ndarray:
+    """Distance of every velocity node from the segment start (m)."""
+    return np.concatenate([[0.0], np.cumsum(ctx.segments)])
+
+def prolong(velocity: np.ndarray, from_distance: np.ndarray, ctx: SegmentContext) -> np.ndarray:
+    """Interpolates a velocity profile given at `from_distance` onto the nodes of `ctx`.
+
+    The result is a valid initial guess: at rest at both ends and within the velocity bounds.
+    """
+    v_initial = np.interp(node_distance(ctx), from_distance, velocity)
+    v_initial = np.clip(v_initial, 0.01, config.MaxVelocity)
+    v_initial[[0, -1]] = 0
+    return v_initial
+
+def _features(ctx: SegmentContext) -> np.ndarray:
+    """Inputs used to pick the nearest cached solution when there is no exact match."""
+    return np.array([ctx.initial_energy, ctx.final_energy, ctx.time_offset], dtype=float)
+
+# Scale of each feature when measuring "nearest" (Wh, Wh, s)
+_FEATURE_SCALE = np.array([0.05 * config.BatteryCapacity, 0.05 * config.BatteryCapacity, 1800.0])
+
+def lookup(ctx: SegmentContext) -> np.ndarray | None:
+    """Warm-start profile for a segment from the on-disk cache, or None.
+
+    An exact input match is returned as stored; otherwise the cached solution of the same
+    segment and settings with the nearest energies/time offset is used. Profiles are
+    interpolated by distance onto the context's grid, so a different route resolution
+    still benefits.
+    """
+    prefix = _entry_prefix(ctx)
+    paths = glob.glob(f"{prefix}_*.npz")
+    if not paths:
+        return None
+
+    exact = f"{prefix}_{_input_hash(ctx)}.npz"
+    if exact in paths:
+        best_path = exact
+    else:
+        best_path, best_distance = None, np.inf
+        for path in paths:
+            try:
+                with np.load(path) as entry:
+                    distance = np.sum(np.abs((entry["features"] - _features(ctx)) / _FEATURE_SCALE))
+            except (OSError, ValueError, KeyError):
+                continue  # partially written or stale entry
+            if distance < best_distance:
+                best_path, best_distance = path, distance
+        if best_path is None:
+            return None
+
+    try:
+        with np.load(best_path) as entry:
+            velocity, cached_distance = entry["velocity"], entry["node_distance"]
+        os.utime(best_path)  # mark as recently used
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return prolong(velocity, cached_distance, ctx)
+
+def store(ctx: SegmentContext, velocity: np.ndarray) -> None:
+    """Saves an optimized profile and evicts the least recently used entries beyond the limit."""
+    os.makedirs(config.WarmStartDir, exist_ok=True)
+    path = f"{_entry_prefix(ctx)}_{_input_hash(ctx)}.npz"
+
+    # Write then rename, so concurrent readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, velocity=velocity, node_distance=node_distance(ctx), features=_features(ctx))
+    os.replace(tmp_path, path)
+
+    entries = sorted(glob.glob(os.path.join(config.WarmStartDir, "*_*.npz")), key=os.path.getmtime)
+    for stale in entries[:max(0, len(entries) - config.WarmStartMaxEntries)]:
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
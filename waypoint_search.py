@@ -0,0 +1,101 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import race_config as config
+import fullmodelrunner
+
+
+def _battery_shortfall(results_list: list[pd.DataFrame], levels: np.ndarray) -> float:
+    """Total battery shortfall (in %) below the safe level or a segment's end-of-segment target."""
+    shortfall = 0.0
+    for waypoint_idx, segment_df in enumerate(results_list):
+        battery = segment_df['Battery'].to_numpy()
+        shortfall += max(0.0, config.DeepDischargeCap * 100 - battery.min())
+        shortfall += max(0.0, levels[waypoint_idx + 1] * 100 - battery[-1])
+    return shortfall
+
+
+def evaluate_allocation(levels: tuple[float, ...], v_initials: list[np.ndarray] | None = None
+                        ) -> tuple[float, float, list[pd.DataFrame]]:
+    """Runs the 13 segment solves for one waypoint allocation (also used as the pool worker).
+
+    Each segment is required to finish at its next waypoint level, so an allocation is
+    only as good as the race it can actually deliver. Allocations the solver cannot meet
+    are penalized by `WaypointSearchPenalty` per % of battery shortfall.
+
+    Returns:
+        tuple: (score, race_time, per-segment result DataFrames)
+    """
+    results_list, race_time = fullmodelrunner.run_race(v_initials, levels=list(levels), enforce_final_energy=True)
+    score = race_time + config.WaypointSearchPenalty * _battery_shortfall(results_list, np.asarray(levels))
+    return score, race_time, results_list
+
+
+def search(initial_levels: list[float] | None = None, max_workers: int | None = None
+           ) -> tuple[np.ndarray, float, list[pd.DataFrame]]:
+    """Compass search over the intermediate BatteryLevelWayPoints minimizing total race time.
+
+    Every iteration evaluates +/- step on each free waypoint level concurrently, each
+    candidate warm-started from the current best allocation's velocity profiles. The best
+    improving candidate is taken; if none improves, the step is halved. The first and last
+    levels (race start and finish) stay fixed.
+
+    Returns:
+        tuple: (best levels, race time in seconds, per-segment result DataFrames)
+    """
+    levels = np.array(config.BatteryLevelWayPoints if initial_levels is None else initial_levels, dtype=float)
+    free = range(1, len(levels) - 1)
+    step = config.WaypointSearchStep
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        best_score, best_time, best_results = pool.submit(evaluate_allocation, tuple(levels)).result()
+        print(f"Initial allocation: {best_time/3600:.4f} hrs (score {best_score:.1f})")
+
+        for iteration in range(config.WaypointSearchMaxIter):
+            if step < config.WaypointSearchMinStep:
+                break
+
+            warm_start = [segment_df['Velocity'].to_numpy() for segment_df in best_results]
+            candidates = []
+            for i in free:
+                for sign in (1, -1):
+                    candidate = levels.copy()
+                    candidate[i] = np.clip(candidate[i] + sign * step, config.DeepDischargeCap, 1.0)
+                    if candidate[i] != levels[i]:
+                        candidates.append(candidate)
+
+            futures = [pool.submit(evaluate_allocation, tuple(c), warm_start) for c in candidates]
+            scored = [(future.result(), candidate) for future, candidate in zip(futures, candidates)]
+            (score, race_time, results_list), candidate = min(scored, key=lambda item: item[0][0])
+
+            if score < best_score:
+                levels, best_score, best_time, best_results = candidate, score, race_time, results_list
+                print(f"Iteration {iteration + 1}: {best_time/3600:.4f} hrs (score {best_score:.1f}, step {step})")
+            else:
+                step /= 2
+                print(f"Iteration {iteration + 1}: no improvement, step -> {step}")
+
+    return levels, best_time, best_results
+
+
+def main() -> None:
+    """Finds the best waypoint allocation and writes it with its full race output."""
+    print("--- Starting Battery Waypoint Search ---")
+    levels, race_time, results_list = search(max_workers=config.WaypointSearchWorkers)
+
+    full_race_df = pd.concat(results_list)
+    full_race_df.to_csv('run_dat.csv', index=False)
+    with open('best_waypoints.json', 'w') as f:
+        json.dump({"BatteryLevelWayPoints": [round(float(x), 4) for x in levels], "RaceTime": race_time}, f, indent=2)
+
+    print("--- Search Complete ---")
+    print(f"BatteryLevelWayPoints = {[round(float(x), 4) for x in levels]}")
+    print(f"Race Time: {race_time/3600:.4f} hrs")
+    print("Results saved to `run_dat.csv` and `best_waypoints.json`")
+
+
+if __name__ == "__main__":
+    main()